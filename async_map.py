@@ -0,0 +1,182 @@
+"""
+Asyncio API for the directory mapper.
+
+map_directory and iter_directory_map block while they walk, which stalls an
+event loop. The async iterators and coroutines here run the same walk on a
+bounded thread pool instead, one chunk of entries at a time, so the loop
+stays responsive and callers get lines as soon as they are produced:
+
+    async for line in aiter_directory_map(path, order="name"):
+        await response.write(line.encode() + b"\\n")
+
+An AsyncMapper allows at most max_maps maps to run at once (per event
+loop); further maps wait for a free slot. The module-level functions share
+one default mapper; create an AsyncMapper to use another limit or executor.
+Cancelling the task, or closing the iterator early (e.g. with
+contextlib.aclosing), stops the walk at the next entry and frees its slot;
+a directory listing already in progress is allowed to finish.
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from dirmap import iter_directory_map, iter_walk_entries, write_directory_map
+
+DEFAULT_MAX_MAPS = 4
+# A chunk is handed to the event loop once it has this many items, or once
+# it has been filling for this long, whichever comes first
+CHUNK_SIZE = 1000
+CHUNK_SECONDS = 0.05
+
+
+class _ExecutorStream:
+    """A blocking iterator drained in chunks by executor threads, one at a time."""
+
+    def __init__(self, make_iterator):
+        self._make_iterator = make_iterator
+        self._iterator = None
+        self._lock = threading.Lock()
+        self.stop_event = threading.Event()
+
+    def next_chunk(self):
+        """Return (items, finished); the iterator is created on the first call."""
+        with self._lock:
+            if self.stop_event.is_set():
+                return [], True
+            if self._iterator is None:
+                self._iterator = iter(self._make_iterator())
+            chunk = []
+            deadline = time.monotonic() + CHUNK_SECONDS
+            for item in self._iterator:
+                chunk.append(item)
+                if (
+                    len(chunk) >= CHUNK_SIZE
+                    or time.monotonic() >= deadline
+                    or self.stop_event.is_set()
+                ):
+                    return chunk, False
+            return chunk, True
+
+    def close(self):
+        """Stop and close the iterator, waiting for a chunk in progress to return."""
+        self.stop_event.set()
+        with self._lock:
+            close = getattr(self._iterator, "close", None)
+            self._iterator = None
+            if close is not None:
+                close()
+
+
+class AsyncMapper:
+    """
+    Runs maps for asyncio code on a bounded thread pool. max_maps limits
+    how many maps run at once; executor defaults to a pool with one thread
+    per map slot.
+    """
+
+    def __init__(self, max_maps=DEFAULT_MAX_MAPS, executor=None):
+        if max_maps < 1:
+            raise ValueError("max_maps must be at least 1")
+        self.max_maps = max_maps
+        self._executor = executor
+        self._owns_executor = executor is None
+        self._executor_lock = threading.Lock()
+        # One semaphore per event loop, since asyncio primitives are bound to a loop
+        self._slots = weakref.WeakKeyDictionary()
+
+    @property
+    def executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_maps, thread_name_prefix="dirmap-async"
+                )
+            return self._executor
+
+    def _slot(self):
+        loop = asyncio.get_running_loop()
+        slot = self._slots.get(loop)
+        if slot is None:
+            slot = self._slots[loop] = asyncio.Semaphore(self.max_maps)
+        return slot
+
+    async def _stream(self, make_iterator):
+        """Yield the items of make_iterator(), produced on the executor in chunks."""
+        executor = self.executor
+        async with self._slot():
+            stream = _ExecutorStream(make_iterator)
+            try:
+                finished = False
+                while not finished:
+                    chunk, finished = await asyncio.wrap_future(executor.submit(stream.next_chunk))
+                    for item in chunk:
+                        yield item
+            finally:
+                stream.stop_event.set()
+                # Shielded so the slot is only freed once the walk has stopped
+                await asyncio.shield(asyncio.wrap_future(executor.submit(stream.close)))
+
+    def iter_entries(self, start_path, exclude_ignore=True, snapshot_file=None, **walk_options):
+        """
+        Async iterator of walker.WalkEntry records; the arguments are those of
+        dirmap.iter_walk_entries (workers, collect_sizes, limits, order, ...).
+        """
+        return self._stream(
+            lambda: iter_walk_entries(start_path, exclude_ignore, snapshot_file, **walk_options)
+        )
+
+    def iter_lines(self, start_path, exclude_ignore=True, **options):
+        """
+        Async iterator of the map's lines; the arguments are those of
+        dirmap.iter_directory_map (format, totals, limits, order, ...).
+        """
+        return self._stream(lambda: iter_directory_map(start_path, exclude_ignore, **options))
+
+    async def map(self, start_path, exclude_ignore=True, output_file=None, **options):
+        """
+        Return the map as a string like dirmap.map_directory. Nothing is
+        written unless output_file is given.
+        """
+        lines = [line async for line in self.iter_lines(start_path, exclude_ignore, **options)]
+        if output_file is not None:
+            await asyncio.wrap_future(
+                self.executor.submit(write_directory_map, lines, output_file)
+            )
+        return "\n".join(lines) + "\n"
+
+    def shutdown(self):
+        """Shut down the executor if this mapper created it."""
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_default_mapper = None
+_default_lock = threading.Lock()
+
+
+def default_mapper():
+    """Return the AsyncMapper shared by the module-level functions."""
+    global _default_mapper
+    with _default_lock:
+        if _default_mapper is None:
+            _default_mapper = AsyncMapper()
+        return _default_mapper
+
+
+def aiter_walk_entries(start_path, exclude_ignore=True, snapshot_file=None, **walk_options):
+    """Async version of dirmap.iter_walk_entries, using the default mapper."""
+    return default_mapper().iter_entries(start_path, exclude_ignore, snapshot_file, **walk_options)
+
+
+def aiter_directory_map(start_path, exclude_ignore=True, **options):
+    """Async version of dirmap.iter_directory_map, using the default mapper."""
+    return default_mapper().iter_lines(start_path, exclude_ignore, **options)
+
+
+async def amap_directory(start_path, exclude_ignore=True, output_file=None, **options):
+    """Async version of dirmap.map_directory, using the default mapper."""
+    return await default_mapper().map(start_path, exclude_ignore, output_file, **options)
@@ -0,0 +1,841 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the directory mapper hot paths.
+
+Usage:
+    python benchmark.py ignore [--paths N] [--patterns N]
+    python benchmark.py walk [--entries N] [--root DIR]
+    python benchmark.py parallel [--entries N] [--latency MS] [--workers 1,2,4,8]
+    python benchmark.py snapshot [--entries N] [--latency MS]
+    python benchmark.py hash [--files N] [--size-kb N] [--workers 1,4,16]
+    python benchmark.py tree [--entries N]
+    python benchmark.py wide [--entries N] [--root DIR]
+    python benchmark.py startup [--runs N]
+    python benchmark.py suite [--entries N] [--shapes a,b] [--repeat N] [--root DIR] [--json FILE]
+    python benchmark.py compare BASELINE.json CURRENT.json
+
+The suite generates reproducible synthetic trees of several shapes and times
+map_directory, is_ignored and read_gitignore on each. With --json the
+results are written as JSON (with the commit and Python version), so runs
+on two commits can be compared with the compare command.
+"""
+
+import argparse
+import contextlib
+import fnmatch
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from dirmap import is_ignored, map_directory, read_gitignore
+from ignore_matcher import GitignoreMatcher
+from snapshot import Snapshot, snapshot_fingerprint
+from tree_model import DirectoryTree, TreeEntry
+from walker import LISTING_CHUNK, walk_directory
+
+
+def legacy_is_ignored(path, ignore_patterns, base_path):
+    """The original per-pattern fnmatch loop, kept for comparison."""
+    relative_path = os.path.relpath(path, base_path).replace(os.sep, "/")
+    for pattern in ignore_patterns:
+        if pattern.startswith("/"):
+            pattern = pattern[1:]
+        if fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(
+            relative_path, os.path.join("**", pattern).replace(os.sep, "/")
+        ):
+            return True
+    return False
+
+
+def make_patterns(count, seed=0):
+    """Generate a .gitignore-like pattern list of roughly the given size."""
+    rng = random.Random(seed)
+    patterns = []
+    for i in range(count):
+        kind = rng.randrange(5)
+        if kind == 0:
+            patterns.append(f"*.ext{i}")
+        elif kind == 1:
+            patterns.append(f"build{i}/")
+        elif kind == 2:
+            patterns.append(f"/generated{i}")
+        elif kind == 3:
+            patterns.append(f"docs/**/tmp{i}")
+        else:
+            patterns.append(f"cache{i}.db")
+    return patterns
+
+
+def make_paths(count, seed=0):
+    """Generate relative paths with a few directory levels."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(count):
+        depth = rng.randrange(1, 6)
+        parts = [f"dir{rng.randrange(50)}" for _ in range(depth)]
+        if rng.random() < 0.1:
+            parts.append(f"build{rng.randrange(300)}")
+        if rng.random() < 0.1:
+            parts.append(f"cache{rng.randrange(300)}.db")
+        else:
+            ext = rng.choice(["py", "txt", "md", "json", f"ext{rng.randrange(300)}"])
+            parts.append(f"file{i}.{ext}")
+        paths.append("/".join(parts))
+    return paths
+
+
+def _timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def bench_ignore(path_count=20000, pattern_count=300):
+    """Compare the fnmatch loop against the compiled matcher."""
+    base = os.path.abspath(os.sep + "bench")
+    patterns = make_patterns(pattern_count)
+    paths = make_paths(path_count)
+    full_paths = [os.path.join(base, *p.split("/")) for p in paths]
+
+    legacy_time, legacy_hits = _timed(
+        lambda: sum(legacy_is_ignored(p, patterns, base) for p in full_paths)
+    )
+    compile_time, matcher = _timed(lambda: GitignoreMatcher(patterns))
+    compiled_time, compiled_hits = _timed(
+        lambda: sum(matcher.is_ignored(p) for p in paths)
+    )
+
+    print(f"ignore matching: {path_count} paths x {pattern_count} patterns")
+    print(f"  fnmatch loop:      {legacy_time:8.3f}s ({legacy_hits} ignored)")
+    print(f"  compile matcher:   {compile_time:8.3f}s")
+    print(f"  compiled matcher:  {compiled_time:8.3f}s ({compiled_hits} ignored)")
+    if compiled_time:
+        print(f"  speedup:           {legacy_time / compiled_time:8.1f}x")
+    return {
+        "legacy": legacy_time,
+        "compile": compile_time,
+        "compiled": compiled_time,
+    }
+
+
+def generate_tree(root, entries, files_per_dir=20, dirs_per_dir=4):
+    """
+    Create a synthetic tree with roughly the given number of entries under
+    root, filling directories breadth-first.
+    """
+    created = 0
+    queue = [root]
+    os.makedirs(root, exist_ok=True)
+    while queue and created < entries:
+        directory = queue.pop(0)
+        for i in range(files_per_dir):
+            if created >= entries:
+                break
+            open(os.path.join(directory, f"file{i}.txt"), "w").close()
+            created += 1
+        for i in range(dirs_per_dir):
+            if created >= entries:
+                break
+            sub = os.path.join(directory, f"dir{i}")
+            os.mkdir(sub)
+            queue.append(sub)
+            created += 1
+    return created
+
+
+def legacy_walk_lines(start_path):
+    """The original os.walk loop from map_directory, kept for comparison."""
+    lines = []
+    for root, dirs, files in os.walk(start_path):
+        # is_ignored joined and relpath'd every entry, even with no patterns
+        dirs[:] = [d for d in dirs if os.path.relpath(os.path.join(root, d), start_path)]
+        files = [f for f in files if os.path.relpath(os.path.join(root, f), start_path)]
+        level = root.replace(start_path, "").count(os.sep)
+        lines.append(f"{' ' * 4 * level}|_{os.path.basename(root)}")
+        sub_indent = " " * 4 * (level + 1)
+        for file in files:
+            lines.append(f"{sub_indent}|_{file}")
+    return lines
+
+
+def walker_lines(start_path):
+    return [
+        f"{' ' * 4 * entry.depth}|_{entry.name}"
+        for entry in walk_directory(start_path, exclude_ignore=False)
+    ]
+
+
+class SyscallCounter:
+    """Count calls to directory listing and stat functions while active."""
+
+    names = ("scandir", "stat", "lstat", "listdir")
+
+    def __init__(self):
+        self.counts = dict.fromkeys(self.names, 0)
+        self._saved = {}
+
+    def _wrap(self, name, func):
+        def counted(*args, **kwargs):
+            self.counts[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def __enter__(self):
+        for name in self.names:
+            self._saved[name] = getattr(os, name)
+            setattr(os, name, self._wrap(name, self._saved[name]))
+        return self
+
+    def __exit__(self, *exc):
+        for name, func in self._saved.items():
+            setattr(os, name, func)
+
+
+def _measure(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - start
+    tracemalloc.start()
+    func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    with SyscallCounter() as counter:
+        func(*args)
+    return elapsed, peak, counter.counts, result
+
+
+def bench_walk(entries=100000, root=None):
+    """Compare the os.walk loop against the scandir walker."""
+    cleanup = root is None
+    root = root or tempfile.mkdtemp(prefix="dirmap_bench_")
+    try:
+        tree = os.path.join(root, "tree")
+        if not os.path.isdir(tree):
+            generate_tree(tree, entries)
+        print(f"walk: {entries} entries under {tree}")
+        results = {}
+        for label, func in (("os.walk loop", legacy_walk_lines), ("scandir walker", walker_lines)):
+            elapsed, peak, counts, lines = _measure(func, tree)
+            results[label] = {"time": elapsed, "peak_bytes": peak, "syscalls": counts}
+            calls = ", ".join(f"{k}={v}" for k, v in counts.items() if v)
+            print(f"  {label:15s} {elapsed:8.3f}s  peak {peak / 1e6:8.1f} MB  "
+                  f"{len(lines)} lines  ({calls})")
+        return results
+    finally:
+        if cleanup:
+            shutil.rmtree(root)
+
+
+def sleeping_scandir(latency):
+    """Return an os.scandir shim that simulates a high-latency filesystem."""
+    def scandir(path):
+        time.sleep(latency)
+        return os.scandir(path)
+    return scandir
+
+
+def bench_parallel(entries=5000, latency_ms=5.0, worker_counts=(1, 2, 4, 8, 16)):
+    """Show how parallel listing scales with workers on a slow filesystem."""
+    root = tempfile.mkdtemp(prefix="dirmap_bench_")
+    try:
+        tree = os.path.join(root, "tree")
+        generate_tree(tree, entries, files_per_dir=5, dirs_per_dir=3)
+        scandir = sleeping_scandir(latency_ms / 1000)
+        print(f"parallel walk: {entries} entries, {latency_ms}ms per directory listing")
+        results = {}
+        baseline = None
+        for workers in worker_counts:
+            start = time.perf_counter()
+            count = sum(1 for _ in walk_directory(tree, False, scandir=scandir, workers=workers))
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            results[workers] = elapsed
+            print(f"  workers={workers:<3d} {elapsed:8.3f}s  {baseline / elapsed:5.1f}x  ({count} entries)")
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_hash(files=2000, size_kb=512, worker_counts=(1, 4, 16)):
+    """Hash throughput: a one-file-at-a-time script, hash_entries with workers, a warm cache."""
+    import hashlib
+
+    from content_hash import HashCache, hash_entries
+
+    root = tempfile.mkdtemp(prefix="dirmap_bench_")
+    try:
+        tree = os.path.join(root, "tree")
+        rng = random.Random(0)
+        block = rng.randbytes(size_kb * 1024)
+        for i in range(files):
+            directory = os.path.join(tree, f"d{i // 100}")
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"f{i}.bin")
+            with open(path, "wb") as f:
+                # Different contents per file, so nothing is deduplicated below us
+                f.write(i.to_bytes(8, "little") + block)
+            # Old enough to be cached
+            os.utime(path, (1e9, 1e9))
+        total_mb = files * size_kb / 1024
+        print(f"content hashing: {files} files of {size_kb} KB ({total_mb:.0f} MB, in page cache)")
+
+        def report(label, func):
+            start = time.perf_counter()
+            count = func()
+            elapsed = time.perf_counter() - start
+            print(f"  {label:24s} {elapsed:8.3f}s  {total_mb / elapsed:8.0f} MB/s  ({count} files)")
+            return elapsed
+
+        def script():
+            count = 0
+            for entry in walk_directory(tree, False):
+                if not entry.is_dir:
+                    with open(entry.path, "rb") as f:
+                        hashlib.sha256(f.read()).hexdigest()
+                    count += 1
+            return count
+
+        def hashed(workers, cache=None):
+            walk = walk_directory(tree, False, collect_sizes=True)
+            entries = hash_entries(walk, workers=workers, cache=cache)
+            return sum(1 for entry in entries if entry.digest is not None)
+
+        results = {"script": report("read + sha256 per file", script)}
+        for workers in worker_counts:
+            results[workers] = report(f"hash_entries workers={workers}", lambda: hashed(workers))
+        cache = HashCache(os.path.join(root, "hashes.db"))
+        hashed(None, cache)
+        results["cached"] = report("warm hash cache", lambda: hashed(None, HashCache(cache.cache_file)))
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def bench_snapshot(entries=100000, latency_ms=0.0):
+    """
+    Compare a full walk with snapshot-assisted re-mapping of an unchanged
+    tree. latency_ms delays every directory listing to model a network
+    filesystem, where listings are far more expensive than a stat.
+    """
+    root = tempfile.mkdtemp(prefix="dirmap_bench_")
+    try:
+        tree = os.path.join(root, "tree")
+        generate_tree(tree, entries)
+        # Back-date directories so the snapshot does not treat them as racy
+        for dirpath, _, _ in os.walk(tree):
+            os.utime(dirpath, (1_000_000_000, 1_000_000_000))
+        snapshot_file = os.path.join(root, "snapshot.db")
+        scandir = sleeping_scandir(latency_ms / 1000) if latency_ms else None
+
+        def run(snapshot_file):
+            start = time.perf_counter()
+            if snapshot_file is None:
+                count = sum(1 for _ in walk_directory(tree, scandir=scandir))
+            else:
+                fingerprint = snapshot_fingerprint(tree, {})
+                with Snapshot(snapshot_file, fingerprint) as snapshot:
+                    count = sum(
+                        1 for _ in walk_directory(tree, scandir=scandir, snapshot=snapshot)
+                    )
+                    snapshot.commit()
+            return time.perf_counter() - start, count
+
+        print(f"snapshot: {entries} entries, {latency_ms}ms per directory listing")
+        results = {}
+        for label, snapshot in (
+            ("no snapshot", None),
+            ("cold snapshot", snapshot_file),
+            ("warm snapshot", snapshot_file),
+        ):
+            elapsed, count = run(snapshot)
+            results[label] = elapsed
+            print(f"  {label:15s} {elapsed:8.3f}s  ({count} entries)")
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+def synthetic_entries(entries, files_per_dir=20, dirs_per_dir=4):
+    """Yield pre-order TreeEntry records for a synthetic tree, without touching disk."""
+    # Keep the tree balanced: stop adding directories below the depth that
+    # already holds enough entries
+    max_depth, capacity = 0, files_per_dir + 1
+    while capacity < entries:
+        max_depth += 1
+        capacity += (dirs_per_dir ** max_depth) * (files_per_dir + 1)
+    produced = 0
+    stack = [("root", 0)]
+    while stack and produced < entries:
+        name, depth = stack.pop()
+        yield TreeEntry(depth, name, True)
+        produced += 1
+        for i in range(files_per_dir):
+            if produced >= entries:
+                return
+            yield TreeEntry(depth + 1, f"file{i}.txt", False)
+            produced += 1
+        if depth < max_depth:
+            for i in reversed(range(dirs_per_dir)):
+                stack.append((f"dir{i}", depth + 1))
+
+
+def _retained(func):
+    """Return (seconds, bytes still allocated by the result) for func()."""
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    del result
+    tracemalloc.start()
+    result = func()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return elapsed, retained, result
+
+
+def bench_tree(entries=1000000):
+    """Compare the array-backed tree model with a list of formatted lines."""
+    print(f"tree model: {entries} entries")
+
+    elapsed, lines_bytes, lines = _retained(
+        lambda: [f"{' ' * 4 * e.depth}|_{e.name}" for e in synthetic_entries(entries)]
+    )
+    print(f"  list of lines   {elapsed:8.3f}s  {lines_bytes / 1e6:8.1f} MB")
+    del lines
+
+    elapsed, tree_bytes, tree = _retained(
+        lambda: DirectoryTree.from_entries(synthetic_entries(entries))
+    )
+    print(f"  DirectoryTree   {elapsed:8.3f}s  {tree_bytes / 1e6:8.1f} MB "
+          f"({tree_bytes / max(tree.size, 1):.1f} bytes/entry)")
+
+    start = time.perf_counter()
+    count = sum(1 for _ in tree.iter_entries())
+    print(f"  render pass     {time.perf_counter() - start:8.3f}s  ({count} entries)")
+    return {"lines_bytes": lines_bytes, "tree_bytes": tree_bytes}
+
+
+def bench_wide(entries=200000, root=None):
+    """Peak memory of mapping one flat directory, streamed and listed whole."""
+    own_root = root is None
+    root = root or tempfile.mkdtemp(prefix="dirmap-wide-")
+    try:
+        tree = os.path.join(root, "wide")
+        if not os.path.isdir(tree):
+            generate_wide(tree, entries, None)
+        print(f"wide directory: {entries} entries")
+        results = {}
+        for label, chunk_size in (("streamed", LISTING_CHUNK), ("listed whole", None)):
+            tracemalloc.start()
+            start = time.perf_counter()
+            count = sum(1 for _ in walk_directory(tree, False, chunk_size=chunk_size))
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[label] = peak
+            print(f"  {label:15s} {elapsed:8.3f}s  peak {peak / 1e6:8.1f} MB  ({count} entries)")
+        return results
+    finally:
+        if own_root:
+            shutil.rmtree(root)
+
+
+def _process_seconds(argv, runs, cwd=None):
+    """Best wall-clock time of running argv as a new process."""
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(argv, cwd=cwd, stdout=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def bench_startup(runs=20, entries=50):
+    """Start-up cost of one CLI run on a small tree, in process and through the map server."""
+    import threading
+
+    import map_server
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    root = tempfile.mkdtemp(prefix="dirmap-startup-")
+    try:
+        tree = os.path.join(root, "tree")
+        generate_tree(tree, entries)
+        output = os.path.join(root, "map.txt")
+        python = sys.executable
+        cases = [
+            ("python -c pass", [python, "-c", "pass"]),
+            ("import dirmap", [python, "-c", "import dirmap"]),
+            ("dirmap.py", [python, "dirmap.py", tree, "-o", output]),
+        ]
+        results = {}
+        print(f"start-up: best of {runs} runs, {entries}-entry tree")
+        for label, argv in cases:
+            results[label] = _process_seconds(argv, runs, cwd=here)
+            print(f"  {label:20s} {results[label] * 1000:8.1f} ms")
+
+        socket_path = os.path.join(root, "server.sock")
+        ready = threading.Event()
+        server = threading.Thread(target=map_server.serve, args=(socket_path, ready), daemon=True)
+        server.start()
+        if not ready.wait(30):
+            raise RuntimeError("the map server did not start")
+        try:
+            label = "map_server.py"
+            argv = [python, "-c", "import map_server, sys; sys.exit(map_server.request(sys.argv[1:], "
+                    f"{socket_path!r}))", tree, "-o", output]
+            results[label] = _process_seconds(argv, runs, cwd=here)
+            print(f"  {label:20s} {results[label] * 1000:8.1f} ms  (server running)")
+        finally:
+            map_server.stop(socket_path)
+            server.join()
+        imports = subprocess.run([python, "-X", "importtime", "-c", "import dirmap"], cwd=here,
+                                 stderr=subprocess.PIPE, text=True, check=True).stderr
+        print("  modules imported by dirmap: "
+              f"{sum(1 for line in imports.splitlines() if line.startswith('import time:')) - 1}")
+        return results
+    finally:
+        shutil.rmtree(root)
+
+
+SUITE_VERSION = 1
+# Paths sampled from each tree for the is_ignored benchmark
+IGNORE_SAMPLE = 10000
+# read_gitignore calls timed per run; a single call is too quick to time
+READ_GITIGNORE_CALLS = 200
+
+
+def _touch(path, size=0, rng=None):
+    with open(path, "wb") as f:
+        if size:
+            f.write(rng.randbytes(size))
+
+
+def generate_wide(root, entries, rng):
+    """One flat directory holding every entry."""
+    os.makedirs(root, exist_ok=True)
+    for i in range(entries - 1):
+        _touch(os.path.join(root, f"file{i:07d}.txt"))
+    return entries
+
+
+def generate_deep(root, entries, rng, depth=64, files_per_level=3):
+    """Chains of nested directories, depth levels deep, with a few files per level."""
+    os.makedirs(root, exist_ok=True)
+    created = 1
+    chain = 0
+    while created < entries:
+        directory = os.path.join(root, f"chain{chain}")
+        for level in range(depth):
+            if created >= entries:
+                break
+            directory = os.path.join(directory, f"level{level}")
+            os.makedirs(directory)
+            created += 1
+            for i in range(files_per_level):
+                if created >= entries:
+                    break
+                _touch(os.path.join(directory, f"file{i}.txt"))
+                created += 1
+        chain += 1
+    return created
+
+
+def generate_small_files(root, entries, rng):
+    """A balanced tree of many tiny files (1-256 bytes of content)."""
+    created = generate_tree(root, entries, files_per_dir=50, dirs_per_dir=8)
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            _touch(os.path.join(dirpath, name), rng.randrange(1, 257), rng)
+    return created
+
+
+def _ignore_bait(root, rng, patterns, count=200):
+    """Create files named after some patterns, so the matchers get real hits."""
+    names = [p for p in patterns if p.startswith("cache") or p.startswith("*.ext")]
+    for i in range(min(count, len(names))):
+        name = rng.choice(names).replace("*", f"bait{i}")
+        _touch(os.path.join(root, name))
+
+
+def generate_large_gitignore(root, entries, rng, pattern_count=2000):
+    """A balanced tree under a root .gitignore with thousands of patterns."""
+    created = generate_tree(root, entries)
+    patterns = make_patterns(pattern_count, seed=rng.randrange(1 << 30))
+    with open(os.path.join(root, ".gitignore"), "w") as f:
+        f.write("# synthetic benchmark patterns\n")
+        f.write("\n".join(patterns) + "\n*.txt\n!file1*.txt\n")
+    _ignore_bait(root, rng, patterns)
+    return created
+
+
+def generate_nested_ignores(root, entries, rng):
+    """A balanced tree with a small .gitignore, including negations, in every directory."""
+    created = generate_tree(root, entries, files_per_dir=10, dirs_per_dir=4)
+    for depth, (dirpath, dirs, _) in enumerate(os.walk(root)):
+        with open(os.path.join(dirpath, ".gitignore"), "w") as f:
+            f.write(f"file{rng.randrange(10)}.txt\n")
+            f.write(f"*.tmp\n!keep{depth % 7}.tmp\n")
+            if dirs:
+                f.write(f"{rng.choice(dirs)}/\n")
+    return created
+
+
+SHAPES = {
+    "wide": generate_wide,
+    "deep": generate_deep,
+    "small_files": generate_small_files,
+    "large_gitignore": generate_large_gitignore,
+    "nested_ignores": generate_nested_ignores,
+}
+
+
+def prepare_shape(root, shape, entries, seed=0):
+    """
+    Generate (or reuse) the tree for a shape under root and return its path.
+    Trees are keyed by shape, size and seed, so the same tree can be reused
+    to compare commits.
+    """
+    tree = os.path.join(root, f"{shape}-{entries}-{seed}")
+    marker = os.path.join(root, f".{shape}-{entries}-{seed}.done")
+    if os.path.exists(marker):
+        return tree
+    if os.path.exists(tree):
+        shutil.rmtree(tree)
+    SHAPES[shape](tree, entries, random.Random(f"{shape}:{seed}"))
+    open(marker, "w").close()
+    return tree
+
+
+def _sample_paths(tree, count, seed=0):
+    """Pick up to count file and directory paths from the tree, reproducibly."""
+    paths = [entry.path for entry in walk_directory(tree, exclude_ignore=False)][1:]
+    rng = random.Random(seed)
+    if len(paths) > count:
+        paths = rng.sample(paths, count)
+    return paths
+
+
+def _timing(runs, items=1):
+    return {
+        "seconds": min(runs),
+        "median": statistics.median(runs),
+        "runs": runs,
+        "per_item_us": min(runs) / max(items, 1) * 1e6,
+        "items": items,
+    }
+
+
+def bench_shape(tree, repeat=3):
+    """Time map_directory, is_ignored and read_gitignore on one generated tree."""
+    gitignore = os.path.join(tree, ".gitignore")
+    results = {}
+
+    runs = []
+    lines = 0
+    with tempfile.TemporaryDirectory(prefix="dirmap_bench_out_") as out_dir:
+        output_file = os.path.join(out_dir, "map.txt")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                content = map_directory(tree, output_file=output_file)
+            runs.append(time.perf_counter() - start)
+            lines = content.count("\n")
+            del content
+    results["map_directory"] = _timing(runs, lines)
+
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(READ_GITIGNORE_CALLS):
+            patterns = read_gitignore(gitignore)
+        runs.append(time.perf_counter() - start)
+    results["read_gitignore"] = _timing(runs, READ_GITIGNORE_CALLS)
+    results["read_gitignore"]["patterns"] = len(patterns)
+
+    paths = _sample_paths(tree, IGNORE_SAMPLE)
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ignored = sum(1 for path in paths if is_ignored(path, patterns, tree))
+        runs.append(time.perf_counter() - start)
+    results["is_ignored"] = _timing(runs, len(paths))
+    results["is_ignored"]["ignored"] = ignored
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_suite(entries=10000, shapes=None, repeat=3, root=None, seed=0):
+    """Run every benchmark on every shape and return machine-readable results."""
+    shapes = shapes or list(SHAPES)
+    cleanup = root is None
+    root = root or tempfile.mkdtemp(prefix="dirmap_bench_")
+    report = {
+        "suite_version": SUITE_VERSION,
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "entries": entries,
+        "repeat": repeat,
+        "seed": seed,
+        "results": [],
+    }
+    try:
+        for shape in shapes:
+            start = time.perf_counter()
+            tree = prepare_shape(root, shape, entries, seed)
+            generated = time.perf_counter() - start
+            print(f"{shape} ({entries} entries, ready in {generated:.1f}s)", file=sys.stderr)
+            for operation, timing in bench_shape(tree, repeat).items():
+                report["results"].append({"shape": shape, "operation": operation, **timing})
+                print(
+                    f"  {operation:15s} {timing['seconds']:8.3f}s  "
+                    f"{timing['per_item_us']:10.2f} us/item  ({timing['items']} items)",
+                    file=sys.stderr,
+                )
+    finally:
+        if cleanup:
+            shutil.rmtree(root)
+    return report
+
+
+def compare_reports(baseline, current, threshold=0.10):
+    """
+    Yield comparison lines for two suite reports. Relative changes beyond
+    threshold are flagged 'SLOWER' or 'faster'.
+    """
+    old = {(r["shape"], r["operation"]): r for r in baseline["results"]}
+    yield (
+        f"baseline {baseline.get('commit')} ({baseline['entries']} entries) -> "
+        f"current {current.get('commit')} ({current['entries']} entries)"
+    )
+    for result in current["results"]:
+        key = (result["shape"], result["operation"])
+        if key not in old:
+            continue
+        before, after = old[key]["seconds"], result["seconds"]
+        change = (after - before) / before if before else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  SLOWER"
+        elif change < -threshold:
+            flag = "  faster"
+        yield f"  {key[0]:16s} {key[1]:15s} {before:8.3f}s -> {after:8.3f}s  {change:+7.1%}{flag}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Directory mapper benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    ignore_parser = sub.add_parser("ignore", help="gitignore matching")
+    ignore_parser.add_argument("--paths", type=int, default=20000)
+    ignore_parser.add_argument("--patterns", type=int, default=300)
+
+    walk_parser = sub.add_parser("walk", help="directory traversal")
+    walk_parser.add_argument("--entries", type=int, default=100000)
+    walk_parser.add_argument("--root", help="reuse a generated tree in this directory")
+
+    parallel_parser = sub.add_parser("parallel", help="parallel traversal on a slow filesystem")
+    parallel_parser.add_argument("--entries", type=int, default=5000)
+    parallel_parser.add_argument("--latency", type=float, default=5.0, help="milliseconds")
+    parallel_parser.add_argument("--workers", default="1,2,4,8,16")
+
+    snapshot_parser = sub.add_parser("snapshot", help="incremental re-mapping")
+    snapshot_parser.add_argument("--entries", type=int, default=100000)
+    snapshot_parser.add_argument("--latency", type=float, default=0.0, help="milliseconds")
+
+    hash_parser = sub.add_parser("hash", help="content hashing throughput")
+    hash_parser.add_argument("--files", type=int, default=2000)
+    hash_parser.add_argument("--size-kb", type=int, default=512)
+    hash_parser.add_argument("--workers", default="1,4,16", help="comma-separated worker counts")
+
+    tree_parser = sub.add_parser("tree", help="tree model memory")
+    tree_parser.add_argument("--entries", type=int, default=1000000)
+
+    wide_parser = sub.add_parser("wide", help="memory of one huge directory")
+    wide_parser.add_argument("--entries", type=int, default=200000)
+    wide_parser.add_argument("--root", help="reuse a generated directory in this directory")
+
+    startup_parser = sub.add_parser("startup", help="start-up time of a CLI run")
+    startup_parser.add_argument("--runs", type=int, default=20)
+
+    suite_parser = sub.add_parser("suite", help="map, ignore and read benchmarks on synthetic trees")
+    suite_parser.add_argument("--entries", type=int, default=10000, help="entries per tree (up to 1M)")
+    suite_parser.add_argument("--shapes", default=",".join(SHAPES), help="comma-separated shapes")
+    suite_parser.add_argument("--repeat", type=int, default=3, help="runs per benchmark (min is reported)")
+    suite_parser.add_argument("--seed", type=int, default=0)
+    suite_parser.add_argument("--root", help="keep generated trees here and reuse them")
+    suite_parser.add_argument("--json", metavar="FILE", help="write results as JSON ('-' for stdout)")
+
+    compare_parser = sub.add_parser("compare", help="compare two suite JSON results")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="relative change flagged as a regression (default 0.10)")
+
+    args = parser.parse_args(argv)
+    if args.command == "ignore":
+        bench_ignore(args.paths, args.patterns)
+    elif args.command == "walk":
+        bench_walk(args.entries, args.root)
+    elif args.command == "parallel":
+        workers = [int(w) for w in args.workers.split(",")]
+        bench_parallel(args.entries, args.latency, workers)
+    elif args.command == "snapshot":
+        bench_snapshot(args.entries, args.latency)
+    elif args.command == "hash":
+        bench_hash(args.files, args.size_kb, [int(w) for w in args.workers.split(",")])
+    elif args.command == "tree":
+        bench_tree(args.entries)
+    elif args.command == "wide":
+        bench_wide(args.entries, args.root)
+    elif args.command == "startup":
+        bench_startup(args.runs)
+    elif args.command == "suite":
+        shapes = [shape for shape in args.shapes.split(",") if shape]
+        unknown = [shape for shape in shapes if shape not in SHAPES]
+        if unknown:
+            parser.error(f"unknown shapes: {', '.join(unknown)} (choose from {', '.join(SHAPES)})")
+        report = bench_suite(args.entries, shapes, args.repeat, args.root, args.seed)
+        if args.json == "-":
+            json.dump(report, sys.stdout, indent=2)
+            print()
+        elif args.json:
+            with open(args.json, "w") as f:
+                json.dump(report, f, indent=2)
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = 0
+        for line in compare_reports(baseline, current, args.threshold):
+            regressions += line.endswith("SLOWER")
+            print(line)
+        return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,298 @@
+"""
+Content digests of mapped files, for maps used as manifests.
+
+hash_entries passes walker entries through a thread pool that hashes every
+regular file while the walk goes on, and yields the entries in walk order
+with their digest filled in. Files are read in large chunks into a
+per-thread buffer; both the reads and hashlib release the GIL, so many
+files are read and hashed at once and a big tree is hashed at the speed of
+the disk rather than of one Python thread. Reads are not mmap'd: a file
+truncated while mapped kills the process with SIGBUS, and mmap measured no
+faster than chunked reads.
+
+A HashCache remembers digests by path together with the size, mtime,
+inode and ctime the file had, so unchanged files are not read again. The
+ctime catches files rewritten with their old mtime put back, which
+tools like rsync and tar do. Files modified
+just before they were hashed may change again within the same mtime tick,
+so their digests are never cached (like the snapshot's racy window).
+
+Directory digests are Merkle hashes over their children's names and
+digests, computed by tree_model.DirectoryTree once the walk is over. A
+folder that was not listed in full has no digest, and neither have the
+folders above it, so a digest always covers everything below it: folders
+cut short by limits or unreadable have none, and walks that leave folders
+unlisted altogether (max_depth, listed symlinks) cannot be hashed.
+"""
+
+import os
+import stat
+import threading
+import time
+from collections import deque
+
+from snapshot import RACY_WINDOW_NS
+
+DEFAULT_ALGORITHM = "sha256"
+READ_CHUNK = 1 << 20
+DEFAULT_HASH_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+# Entries waiting for their digest, per worker, before the walk is held back
+WINDOW_PER_WORKER = 64
+# Small files are hashed in batches of up to this many files or bytes
+BATCH_FILES = 64
+BATCH_BYTES = 1 << 20
+
+_buffers = threading.local()
+
+
+def check_algorithm(algorithm):
+    """Raise ValueError unless algorithm is a fixed-size hashlib digest."""
+    import hashlib
+
+    try:
+        digest = hashlib.new(algorithm)
+    except (ValueError, TypeError):
+        digest = None
+    if digest is None or digest.digest_size == 0:
+        choices = sorted(a for a in hashlib.algorithms_guaranteed if not a.startswith("shake_"))
+        raise ValueError(
+            f"Unknown hash algorithm '{algorithm}' (choose from {', '.join(choices)})"
+        ) from None
+    return algorithm
+
+
+def check_walk_options(limits=None, symlinks="skip"):
+    """Raise ValueError if a walk with these options would leave folders unlisted."""
+    if limits is not None and limits.max_depth is not None or symlinks == "list":
+        raise ValueError(
+            "content digests need every folder listed, so they cannot be combined with "
+            "a depth limit or with symlinked folders that are listed but not followed"
+        )
+
+
+def hash_file(path, algorithm=DEFAULT_ALGORITHM, chunk_size=READ_CHUNK):
+    """Return the hex digest of a regular file's contents."""
+    import hashlib
+
+    buffer = getattr(_buffers, "buffer", None)
+    if buffer is None or len(buffer) != chunk_size:
+        buffer = _buffers.buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    digest = hashlib.new(algorithm)
+    with open(path, "rb", buffering=0) as f:
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def _key(st):
+    return (st.st_size, st.st_mtime_ns, st.st_ino, st.st_ctime_ns)
+
+
+class HashCache:
+    """
+    File digests by absolute path, valid while the file keeps its size,
+    mtime, inode and ctime; with cache_file they are kept in a sqlite file between
+    runs. hits and misses count lookups. Safe to share between threads.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (algorithm, path) -> (size, mtime_ns, inode, ctime_ns, hex digest)
+        self._rows = None
+        self._dirty = {}
+
+    def __getstate__(self):
+        # Sent to worker processes without the digests held in memory
+        return {"cache_file": self.cache_file}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def _load(self):
+        rows = {}
+        if self.cache_file and os.path.isfile(self.cache_file):
+            import sqlite3
+
+            try:
+                db = sqlite3.connect(self.cache_file)
+                try:
+                    for algorithm, path, *row in db.execute("SELECT * FROM files"):
+                        rows[(algorithm, path)] = tuple(row)
+                finally:
+                    db.close()
+            except sqlite3.Error:
+                rows = {}
+        return rows
+
+    def lookup(self, algorithm, path, st):
+        """Return the cached digest of path if st shows the file unchanged, else None."""
+        key = (algorithm, os.path.abspath(path))
+        with self._lock:
+            if self._rows is None:
+                self._rows = self._load()
+            row = self._rows.get(key)
+            if row is not None and row[:4] == _key(st):
+                self.hits += 1
+                return row[4]
+            self.misses += 1
+            return None
+
+    def record(self, algorithm, path, st, digest, hashed_ns):
+        """Remember digest for path as stat'ed by st, unless it was modified too recently."""
+        if max(st.st_mtime_ns, st.st_ctime_ns) >= hashed_ns - RACY_WINDOW_NS:
+            return
+        key = (algorithm, os.path.abspath(path))
+        row = _key(st) + (digest,)
+        with self._lock:
+            if self._rows is None:
+                self._rows = self._load()
+            self._rows[key] = self._dirty[key] = row
+
+    def commit(self):
+        """Write the digests recorded since the last commit to the cache file."""
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not self.cache_file or not dirty:
+            return
+        import sqlite3
+
+        with sqlite3.connect(self.cache_file) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS files (algorithm TEXT, path TEXT, size INTEGER, "
+                "mtime_ns INTEGER, ino INTEGER, ctime_ns INTEGER, digest TEXT, "
+                "PRIMARY KEY (algorithm, path))"
+            )
+            db.executemany(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(algorithm, path) + row for (algorithm, path), row in dirty.items()],
+            )
+        db.close()
+
+
+def _file_hasher(algorithm, cache, stats):
+    """
+    Return a function giving the hex digests of a list of files, with None
+    for unreadable and special files.
+    """
+
+    def digest_of(path):
+        try:
+            st = os.stat(path)
+            if not stat.S_ISREG(st.st_mode):
+                return None
+            if cache is not None:
+                digest = cache.lookup(algorithm, path, st)
+                if digest is not None:
+                    if stats is not None:
+                        stats.count("hash_cache_hits")
+                    return digest
+            hashed_ns = time.time_ns()
+            digest = hash_file(path, algorithm)
+            if cache is not None:
+                cache.record(algorithm, path, st, digest, hashed_ns)
+            if stats is not None:
+                stats.count("hashed_files")
+                stats.count("hashed_bytes", st.st_size)
+            return digest
+        except OSError:
+            if stats is not None:
+                stats.count("hash_errors")
+            return None
+
+    def digests_of(paths):
+        started = time.perf_counter()
+        try:
+            return [digest_of(path) for path in paths]
+        finally:
+            if stats is not None:
+                stats.add_time("hash", time.perf_counter() - started)
+
+    return digests_of
+
+
+def _drain(pending):
+    """Pop and yield the first pending entry, with the rest of its batch."""
+    entry, future, index = pending.popleft()
+    if future is None:
+        yield entry
+        return
+    digests = future.result()
+    yield entry._replace(digest=digests[index])
+    while pending and pending[0][1] is future:
+        entry, _, index = pending.popleft()
+        yield entry._replace(digest=digests[index])
+
+
+def hash_entries(entries, algorithm=DEFAULT_ALGORITHM, workers=None, cache=None, stats=None):
+    """
+    Yield walker entries in order, with the hex digest of each file's
+    contents as digest (None for directories, placeholders and files that
+    are unreadable or not regular files). workers files are hashed at once
+    (DEFAULT_HASH_WORKERS by default); small files are handed to them in
+    batches when the entries carry sizes. cache is an optional HashCache;
+    it is committed when the entries run out or the iterator is closed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    check_algorithm(algorithm)
+    workers = workers or DEFAULT_HASH_WORKERS
+    digests_of = _file_hasher(algorithm, cache, stats)
+    window = workers * WINDOW_PER_WORKER
+    # [entry, future, index in the future's batch] in walk order; future is
+    # None for entries that are not hashed and for files not yet submitted
+    pending = deque()
+    batch = []
+    batch_bytes = 0
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dirmap-hash")
+
+    def submit():
+        nonlocal batch, batch_bytes
+        future = executor.submit(digests_of, [item[0].path for item in batch])
+        for item in batch:
+            item[1] = future
+        batch = []
+        batch_bytes = 0
+
+    try:
+        for entry in entries:
+            if entry.is_dir or entry.omitted is not None:
+                pending.append([entry, None, None])
+            else:
+                item = [entry, None, len(batch)]
+                pending.append(item)
+                batch.append(item)
+                # Files of unknown size get a batch of their own
+                batch_bytes += BATCH_BYTES if entry.size is None else entry.size
+                if len(batch) >= BATCH_FILES or batch_bytes >= BATCH_BYTES:
+                    submit()
+            while pending:
+                entry, future, index = pending[0]
+                unsubmitted = future is None and index is not None
+                if len(pending) <= window and (
+                    unsubmitted or future is not None and not future.done()
+                ):
+                    break
+                if unsubmitted:
+                    submit()
+                yield from _drain(pending)
+        if batch:
+            submit()
+        while pending:
+            yield from _drain(pending)
+    finally:
+        close = getattr(entries, "close", None)
+        if close is not None:
+            close()
+        executor.shutdown(wait=True, cancel_futures=True)
+        # Cached digests stay valid even if the walk was stopped early
+        if cache is not None:
+            cache.commit()
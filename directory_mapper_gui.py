@@ -9,8 +9,56 @@ with optional .gitignore exclusion support.
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 import os
+import queue
 import threading
-from dirmap import map_directory, read_gitignore
+import time
+from itertools import islice
+from content_hash import DEFAULT_ALGORITHM, HashCache, check_walk_options
+from dirmap import iter_walk_entries, read_gitignore, render_text, write_directory_map
+from map_stats import MapStats
+from renderers import format_size, format_totals, get_renderer
+from result_cache import ResultCache, default_cache_dir
+from search_index import SearchIndex
+from tree_diff import DIFF_MARKERS, diff_summary, diff_trees
+from tree_model import DirectoryTree
+from walker import SORT_ORDERS, SYMLINK_POLICIES, WalkLimits
+from watcher import LiveMap, watch_changes
+
+# Children inserted into the tree view per expansion; the rest are loaded on demand
+TREE_PAGE_SIZE = 500
+# Entries the mapping thread hands to the UI at a time, and the batches it
+# may get ahead of the UI before it waits
+MAP_BATCH_SIZE = 2000
+MAP_QUEUE_BATCHES = 8
+# How often a mapping thread waiting for the UI checks for Cancel
+CANCEL_CHECK_SECONDS = 0.1
+# Save dialog file types: (label, pattern, output format)
+SAVE_FORMATS = [
+    ("Text map", "*.txt", "text"),
+    ("Unicode tree", "*.txt", "tree"),
+    ("JSON", "*.json", "json"),
+    ("NDJSON", "*.ndjson", "ndjson"),
+    ("CSV", "*.csv", "csv"),
+    ("Directory tree", "*.dirtree", "dirtree"),
+]
+# Walk limit fields in the Options frame: (WalkLimits field, label, type)
+LIMIT_FIELDS = [
+    ("max_depth", "Max depth", int),
+    ("max_entries_per_dir", "Max per folder", int),
+    ("max_entries", "Max entries", int),
+    ("time_limit", "Time limit (s)", float),
+]
+# Sort choices; the first keeps the order the filesystem lists entries in
+SORT_CHOICES = ["filesystem"] + list(SORT_ORDERS)
+# How often the UI drains mapping batches, and for how long at most per tick
+POLL_INTERVAL_MS = 100
+POLL_BUDGET_SECONDS = 0.05
+# Search runs this long after the last keystroke, and shows at most this many matches
+SEARCH_DELAY_MS = 200
+SEARCH_RESULT_LIMIT = 5000
+# Differences shown in the compare window, and their colours by status
+DIFF_RESULT_LIMIT = 5000
+DIFF_COLORS = {"added": "dark green", "removed": "red3", "changed": "dark orange"}
 
 
 class DirectoryMapperGUI:
@@ -23,7 +71,49 @@ class DirectoryMapperGUI:
         # Variables
         self.directory_path = tk.StringVar()
         self.exclude_gitignore = tk.BooleanVar(value=True)
+        self.show_sizes = tk.BooleanVar(value=False)
+        self.hash_contents = tk.BooleanVar(value=False)
+        self.collect_stats = tk.BooleanVar(value=False)
+        self.watch_changes = tk.BooleanVar(value=False)
+        # Walk limits; blank means unlimited
+        self.limit_vars = {field: tk.StringVar() for field, _, _ in LIMIT_FIELDS}
+        self.view_mode = tk.StringVar(value="text")
+        self.sort_order = tk.StringVar(value=SORT_CHOICES[0])
+        self.symlink_policy = tk.StringVar(value=SYMLINK_POLICIES[0])
+        self.search_query = tk.StringVar()
         self.output_text = None
+        self.output_tree = None
+        self.map_tree = None
+        # Whether the current map was made with sizes, so totals can be shown,
+        # and with content checksums
+        self._map_has_sizes = False
+        self._map_has_digests = False
+        # Search index over map_tree, built on the first query; matching nodes
+        # shown instead of the full map, or None
+        self.search_index = None
+        self._search_nodes = None
+        self._search_job = None
+        # Line iterators still to be added to the text view a batch at a
+        # time, and the scheduled call adding the next batch
+        self._text_fill = None
+        self._text_job = None
+        self._mapping = False
+        # Listings of earlier maps, shared with the CLI's --cache, so mapping
+        # the same folder again with other options does not list it again
+        self.result_cache = ResultCache(default_cache_dir())
+        # Checksums of files hashed this session, reused while a file is unchanged
+        self.hash_cache = HashCache()
+        # Watch mode: the live map being kept up to date and its thread's stop flag
+        self.live_map = None
+        self._watch_stop = None
+        self._watch_queue = None
+        # Tree view item id -> (tree node, index of the first child not yet shown)
+        self._tree_items = {}
+        # State of the mapping run in progress
+        self._map_queue = None
+        self._cancel_event = None
+        self._map_started = 0.0
+        self._dir_count = 0
         
         self.setup_ui()
         
@@ -65,6 +155,87 @@ class DirectoryMapperGUI:
         )
         self.gitignore_check.grid(row=0, column=0, sticky=tk.W)
         
+        # Folder sizes checkbox
+        self.sizes_check = ttk.Checkbutton(
+            options_frame,
+            text="Show folder sizes and file counts",
+            variable=self.show_sizes
+        )
+        self.sizes_check.grid(row=0, column=1, sticky=tk.W, padx=(10, 0))
+        
+        # Statistics checkbox
+        self.stats_check = ttk.Checkbutton(
+            options_frame,
+            text="Show statistics",
+            variable=self.collect_stats
+        )
+        self.stats_check.grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # Watch checkbox
+        self.watch_check = ttk.Checkbutton(
+            options_frame,
+            text="Watch for changes",
+            variable=self.watch_changes,
+            command=self._on_watch_toggled
+        )
+        self.watch_check.grid(row=0, column=3, sticky=tk.W, padx=(10, 0))
+        
+        # Checksums checkbox
+        ttk.Checkbutton(
+            options_frame,
+            text=f"File checksums ({DEFAULT_ALGORITHM.upper()})",
+            variable=self.hash_contents
+        ).grid(row=1, column=3, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+        
+        # View mode
+        view_frame = ttk.Frame(options_frame)
+        view_frame.grid(row=1, column=0, sticky=tk.W, pady=(5, 0))
+        ttk.Label(view_frame, text="View:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
+        ttk.Radiobutton(
+            view_frame,
+            text="Text",
+            value="text",
+            variable=self.view_mode,
+            command=self.switch_view
+        ).grid(row=0, column=1, sticky=tk.W)
+        ttk.Radiobutton(
+            view_frame,
+            text="Tree (expand folders on demand, best for large maps)",
+            value="tree",
+            variable=self.view_mode,
+            command=self.switch_view
+        ).grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
+        
+        # Sort order
+        sort_frame = ttk.Frame(options_frame)
+        sort_frame.grid(row=1, column=1, columnspan=2, sticky=tk.W, padx=(10, 0), pady=(5, 0))
+        ttk.Label(sort_frame, text="Sort:").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
+        ttk.Combobox(
+            sort_frame,
+            textvariable=self.sort_order,
+            values=SORT_CHOICES,
+            state="readonly",
+            width=12
+        ).grid(row=0, column=1, sticky=tk.W)
+        ttk.Label(sort_frame, text="Symlinked folders:").grid(row=0, column=2, sticky=tk.W, padx=(10, 5))
+        ttk.Combobox(
+            sort_frame,
+            textvariable=self.symlink_policy,
+            values=SYMLINK_POLICIES,
+            state="readonly",
+            width=8
+        ).grid(row=0, column=3, sticky=tk.W)
+        
+        # Walk limits
+        limits_frame = ttk.Frame(options_frame)
+        limits_frame.grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=(5, 0))
+        ttk.Label(limits_frame, text="Limits (blank = none):").grid(row=0, column=0, sticky=tk.W, padx=(0, 5))
+        for i, (field, label, _) in enumerate(LIMIT_FIELDS):
+            ttk.Label(limits_frame, text=label).grid(row=0, column=2 * i + 1, sticky=tk.W, padx=(10, 2))
+            ttk.Entry(limits_frame, textvariable=self.limit_vars[field], width=7).grid(
+                row=0, column=2 * i + 2, sticky=tk.W
+            )
+        
         # Control buttons
         button_frame = ttk.Frame(main_frame)
         button_frame.grid(row=2, column=0, columnspan=3, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -95,11 +266,46 @@ class DirectoryMapperGUI:
         )
         self.clear_btn.grid(row=0, column=2, sticky=tk.W, padx=(10, 0))
         
+        # Cancel button, only active while a map is being generated
+        self.cancel_btn = ttk.Button(
+            button_frame, 
+            text="Cancel", 
+            command=self.cancel_map,
+            state="disabled"
+        )
+        self.cancel_btn.grid(row=0, column=3, sticky=tk.W, padx=(10, 0))
+        
+        # Compare button: diff the current map against a saved one
+        self.compare_btn = ttk.Button(
+            button_frame, 
+            text="Compare...", 
+            command=self.compare_with_saved,
+            state="disabled"
+        )
+        self.compare_btn.grid(row=0, column=4, sticky=tk.W, padx=(10, 0))
+        
+        # Clear cache button: forget cached listings so the next map lists everything again
+        self.clear_cache_btn = ttk.Button(
+            button_frame, 
+            text="Clear Cache", 
+            command=self.clear_cache
+        )
+        self.clear_cache_btn.grid(row=0, column=5, sticky=tk.W, padx=(10, 0))
+        
         # Output section
         output_frame = ttk.LabelFrame(main_frame, text="Directory Structure", padding="5")
         output_frame.grid(row=3, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S))
         output_frame.columnconfigure(0, weight=1)
-        output_frame.rowconfigure(0, weight=1)
+        output_frame.rowconfigure(1, weight=1)
+        
+        # Search box; filters the mapped tree without rescanning the disk
+        search_frame = ttk.Frame(output_frame)
+        search_frame.grid(row=0, column=0, sticky=(tk.W, tk.E), pady=(0, 5))
+        search_frame.columnconfigure(1, weight=1)
+        ttk.Label(search_frame, text="Search:").grid(row=0, column=0, sticky=tk.W)
+        self.search_entry = ttk.Entry(search_frame, textvariable=self.search_query)
+        self.search_entry.grid(row=0, column=1, sticky=(tk.W, tk.E), padx=(5, 0))
+        self.search_query.trace_add("write", self._on_search_changed)
         
         # Text widget with scrollbar
         self.output_text = scrolledtext.ScrolledText(
@@ -109,7 +315,21 @@ class DirectoryMapperGUI:
             height=20,
             font=("Courier New", 10)
         )
-        self.output_text.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.output_text.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        
+        # Lazy tree view: children are only inserted when a folder is opened
+        self.tree_frame = ttk.Frame(output_frame)
+        self.tree_frame.grid(row=1, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        self.tree_frame.columnconfigure(0, weight=1)
+        self.tree_frame.rowconfigure(0, weight=1)
+        self.output_tree = ttk.Treeview(self.tree_frame, show="tree", selectmode="browse")
+        tree_scroll = ttk.Scrollbar(self.tree_frame, orient=tk.VERTICAL, command=self.output_tree.yview)
+        self.output_tree.configure(yscrollcommand=tree_scroll.set)
+        self.output_tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+        tree_scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.output_tree.bind("<<TreeviewOpen>>", self._on_tree_open)
+        self.output_tree.bind("<<TreeviewSelect>>", self._on_tree_select)
+        self.output_text.tkraise()
         
         # Status bar
         self.status_bar = ttk.Label(main_frame, text="Ready", relief=tk.SUNKEN, anchor=tk.W)
@@ -152,46 +372,509 @@ class DirectoryMapperGUI:
             messagebox.showerror("Error", f"'{path}' is not a valid directory.")
             return
         
+        try:
+            limits = self.read_limits()
+        except ValueError as e:
+            messagebox.showerror("Error", str(e))
+            return
+        if self.watch_changes.get() and any(limit is not None for limit in limits):
+            messagebox.showerror("Error", "Limits cannot be used while watching for changes.")
+            return
+        order = self.sort_order.get()
+        order = None if order == SORT_CHOICES[0] else order
+        if self.watch_changes.get() and order == "dirs-first":
+            messagebox.showerror("Error", "Folders cannot be sorted first while watching for changes.")
+            return
+        symlinks = self.symlink_policy.get()
+        if self.watch_changes.get() and symlinks != SYMLINK_POLICIES[0]:
+            messagebox.showerror("Error", "Symlinked folders are always skipped while watching for changes.")
+            return
+        content_hash = DEFAULT_ALGORITHM if self.hash_contents.get() else None
+        if self.watch_changes.get() and content_hash:
+            messagebox.showerror("Error", "File checksums cannot be computed while watching for changes.")
+            return
+        if content_hash:
+            try:
+                check_walk_options(limits, symlinks)
+            except ValueError as e:
+                messagebox.showerror("Error", f"File checksums: {e}.")
+                return
+        
+        self._stop_watching()
+        if self.watch_changes.get():
+            self.live_map = LiveMap(
+                path, self.exclude_gitignore.get(), totals=self.show_sizes.get(), order=order
+            )
+        
         # Disable controls during generation
         self.set_controls_state("disabled")
         self.status_bar.config(text="Generating directory map...")
+        self._stop_text_fill()
+        self.output_text.delete(1.0, tk.END)
+        self._clear_tree()
+        self.map_tree = DirectoryTree()
+        self.map_tree.digest_algorithm = content_hash
+        self.search_index = None
+        self._search_nodes = None
+        self._mapping = True
+        self._map_has_sizes = self.show_sizes.get()
+        self._map_has_digests = content_hash is not None
+        self._dir_count = 0
+        self._map_started = time.perf_counter()
+        self._map_queue = queue.Queue(maxsize=MAP_QUEUE_BATCHES)
+        self._cancel_event = threading.Event()
         
-        # Run mapping in separate thread to prevent GUI freezing
-        thread = threading.Thread(target=self._generate_map_thread, args=(path,))
+        # Run mapping in separate thread to prevent GUI freezing; it hands
+        # entries back in batches which the UI drains on a timer
+        thread = threading.Thread(
+            target=self._generate_map_thread,
+            args=(
+                path,
+                self.exclude_gitignore.get(),
+                self._map_has_sizes,
+                limits,
+                MapStats() if self.collect_stats.get() else None,
+                self._map_queue,
+                self._cancel_event,
+                self.live_map,
+                order,
+                self.result_cache,
+                symlinks,
+                content_hash,
+                self.hash_cache,
+            )
+        )
         thread.daemon = True
         thread.start()
+        self.root.after(POLL_INTERVAL_MS, self._poll_map_queue, path)
     
-    def _generate_map_thread(self, path):
-        """Generate map in separate thread."""
+    def cancel_map(self):
+        """Ask the mapping thread to stop."""
+        if self._cancel_event is not None:
+            self._cancel_event.set()
+            self.cancel_btn.config(state="disabled")
+            self.status_bar.config(text="Cancelling...")
+    
+    def read_limits(self):
+        """Build WalkLimits from the Options fields; raises ValueError for bad input."""
+        values = {}
+        for field, label, convert in LIMIT_FIELDS:
+            text = self.limit_vars[field].get().strip()
+            if not text:
+                continue
+            try:
+                value = convert(text)
+            except ValueError:
+                value = -1
+            if value < 0:
+                raise ValueError(f"{label} must be a non-negative number.")
+            values[field] = value
+        return WalkLimits(**values)
+    
+    def _generate_map_thread(
+        self, path, exclude_ignore, collect_sizes, limits, stats, results, cancel_event,
+        live_map=None, order=None, result_cache=None, symlinks="skip", content_hash=None,
+        hash_cache=None
+    ):
+        """Generate map in separate thread; with a live_map, its initial scan is the walk."""
         try:
-            exclude_ignore = self.exclude_gitignore.get()
-            tree_content = map_directory(path, exclude_ignore)
+            output_file = os.path.join(os.getcwd(), "directory_map.txt")
+            partial_file = output_file + ".partial"
+            if live_map is not None:
+                entries = live_map.scan()
+            else:
+                entries = iter_walk_entries(
+                    path, exclude_ignore, collect_sizes=collect_sizes, limits=limits, stats=stats,
+                    order=order, result_cache=result_cache, symlinks=symlinks,
+                    content_hash=content_hash, hash_cache=hash_cache
+                )
+            try:
+                batches = self._batched(entries, results, cancel_event)
+                if stats is not None:
+                    batches = stats.timed("walk", batches)
+                lines = render_text(batches)
+                if stats is not None:
+                    lines = stats.timed("render", lines, inner=("walk",))
+                    stats.measure("write", write_directory_map, lines, partial_file,
+                                  inner=("walk", "render"))
+                    stats.finish()
+                else:
+                    write_directory_map(lines, partial_file)
+            finally:
+                entries.close()
             
-            # Update GUI in main thread
-            self.root.after(0, self._update_output, tree_content, path)
+            if cancel_event.is_set():
+                os.remove(partial_file)
+                results.put(("cancelled", None))
+            else:
+                os.replace(partial_file, output_file)
+                results.put(("done", stats))
             
         except Exception as e:
-            error_msg = f"Error generating directory map: {str(e)}"
-            self.root.after(0, self._show_error, error_msg)
+            results.put(("error", f"Error generating directory map: {str(e)}"))
     
-    def _update_output(self, tree_content, path):
-        """Update the output text widget with generated content."""
-        self.output_text.delete(1.0, tk.END)
-        self.output_text.insert(1.0, tree_content)
+    @staticmethod
+    def _batched(entries, results, cancel_event):
+        """
+        Pass entries through, posting them to the UI queue in batches. When
+        the queue is full the walk waits for the UI, or stops on Cancel.
+        """
+        def post(batch):
+            while True:
+                try:
+                    results.put(("batch", batch), timeout=CANCEL_CHECK_SECONDS)
+                    return True
+                except queue.Full:
+                    if cancel_event.is_set():
+                        return False
+        
+        batch = []
+        for entry in entries:
+            if cancel_event.is_set():
+                break
+            batch.append(entry)
+            yield entry
+            if len(batch) >= MAP_BATCH_SIZE:
+                if not post(batch):
+                    return
+                batch = []
+        if batch:
+            post(batch)
+    
+    def _poll_map_queue(self, path):
+        """Drain mapping batches for a bounded time, then reschedule."""
+        finished = None
+        deadline = time.perf_counter() + POLL_BUDGET_SECONDS
+        try:
+            while time.perf_counter() < deadline:
+                kind, payload = self._map_queue.get_nowait()
+                if kind == "batch":
+                    self._add_batch(payload)
+                else:
+                    finished = (kind, payload)
+                    break
+        except queue.Empty:
+            pass
+        
+        if finished is None:
+            self._update_progress()
+            self.root.after(POLL_INTERVAL_MS, self._poll_map_queue, path)
+            return
+        
+        kind, payload = finished
+        if kind == "done":
+            self._update_output(path, payload)
+        elif kind == "cancelled":
+            self._show_cancelled()
+        else:
+            self._show_error(payload)
+    
+    def _add_batch(self, batch):
+        """Add a batch of entries to the map and the text view."""
+        self.map_tree.extend(batch)
+        self._dir_count += sum(1 for entry in batch if entry.is_dir)
+        if self._text_fill is not None:
+            # Appended after the part of the map still being filled in
+            self._text_fill.append(render_text(batch))
+        elif self.view_mode.get() == "text":
+            self.output_text.insert(tk.END, "\n".join(render_text(batch)) + "\n")
+    
+    def _update_progress(self):
+        """Show live entry counts and rates in the status bar."""
+        elapsed = max(time.perf_counter() - self._map_started, 1e-6)
+        items = self.map_tree.size
+        self.status_bar.config(
+            text=(
+                f"Generating directory map... {items:,} items ({self._dir_count:,} folders), "
+                f"{items / elapsed:,.0f} items/s, {self._dir_count / elapsed:,.0f} folders/s"
+            )
+        )
+    
+    def _update_output(self, path, stats=None):
+        """Finish the view once the map is complete."""
+        self._mapping = False
+        # Folder totals and digests are only known now, so the text view is redrawn with them
+        if self.search_query.get().strip():
+            self._apply_search()
+        elif self.view_mode.get() == "tree" or self._map_has_sizes or self._map_has_digests:
+            self._show_map()
         
         # Enable save button
         self.save_btn.config(state="normal")
+        self.compare_btn.config(state="normal")
         
         # Re-enable controls
         self.set_controls_state("normal")
         
         # Update status
+        elapsed = time.perf_counter() - self._map_started
+        status = (
+            f"Directory map generated for {os.path.basename(path)} "
+            f"({self.map_tree.size} items in {elapsed:.1f}s)"
+        )
+        if stats is not None:
+            status += f" | {stats.summary()}"
+        if self.live_map is not None:
+            self._start_watching()
+            status += " | watching for changes"
+        self.status_bar.config(text=status)
+    
+    def _show_cancelled(self):
+        """Keep the partial map on screen but do not offer to save it."""
+        self._mapping = False
+        self.live_map = None
+        if self.view_mode.get() == "tree" and self.map_tree.root is not None:
+            self._show_map()
+        self.set_controls_state("normal")
         self.status_bar.config(
-            text=f"Directory map generated for {os.path.basename(path)} ({len(tree_content.splitlines())} items)"
+            text=f"Cancelled after {self.map_tree.size:,} items (partial map shown)"
+        )
+    
+    def _on_watch_toggled(self):
+        """Stop watching when unchecked; watching starts with the next map."""
+        if not self.watch_changes.get() and self._watch_stop is not None:
+            self._stop_watching()
+            self.status_bar.config(text="Stopped watching for changes")
+    
+    def _start_watching(self):
+        """Follow filesystem changes to the current map in a background thread."""
+        self._watch_stop = threading.Event()
+        self._watch_queue = queue.Queue()
+        thread = threading.Thread(
+            target=self._watch_thread,
+            args=(self.live_map, self._watch_queue, self._watch_stop),
+        )
+        thread.daemon = True
+        thread.start()
+        self.root.after(POLL_INTERVAL_MS, self._poll_watch_queue, self._watch_stop)
+    
+    def _stop_watching(self):
+        if self._watch_stop is not None:
+            self._watch_stop.set()
+        self._watch_stop = None
+        self._watch_queue = None
+        self.live_map = None
+    
+    @staticmethod
+    def _watch_thread(live_map, results, stop_event):
+        """Patch the live map on changes and hand each update, with a fresh tree, to the UI."""
+        try:
+            for patches in watch_changes(live_map, stop_event):
+                results.put(("update", (patches, live_map.tree())))
+        except Exception as e:
+            results.put(("error", f"Stopped watching for changes: {e}"))
+    
+    def _poll_watch_queue(self, stop_event):
+        """Apply pending watch updates; only changed lines of the text view are redrawn."""
+        if stop_event.is_set():
+            return
+        updates = []
+        try:
+            while True:
+                kind, payload = self._watch_queue.get_nowait()
+                if kind == "error":
+                    self._stop_watching()
+                    self.status_bar.config(text=payload)
+                    return
+                updates.append(payload)
+        except queue.Empty:
+            pass
+        
+        if updates:
+            self.map_tree = updates[-1][1]
+            self.search_index = None
+            if self.search_query.get().strip():
+                self._apply_search()
+            elif self.view_mode.get() == "text" and self._text_fill is None:
+                for patches, _ in updates:
+                    self._patch_text(patches)
+            else:
+                self._show_map()
+            self.status_bar.config(
+                text=f"Updated {time.strftime('%H:%M:%S')} ({self.map_tree.size:,} items) "
+                "| watching for changes"
+            )
+        self.root.after(POLL_INTERVAL_MS, self._poll_watch_queue, stop_event)
+    
+    def _patch_text(self, patches):
+        """Replace the changed line ranges of the text view."""
+        for start, count, lines in patches:
+            self.output_text.delete(f"{start + 1}.0", f"{start + count + 1}.0")
+            if lines:
+                self.output_text.insert(f"{start + 1}.0", "\n".join(lines) + "\n")
+    
+    def switch_view(self):
+        """Raise the selected view and fill it from the current map."""
+        if self.view_mode.get() == "tree":
+            self.tree_frame.tkraise()
+        else:
+            self.output_text.tkraise()
+        if self.map_tree is not None:
+            self._show_map()
+    
+    def _on_search_changed(self, *args):
+        """Rerun the search shortly after the user stops typing."""
+        if self._search_job is not None:
+            self.root.after_cancel(self._search_job)
+        self._search_job = self.root.after(SEARCH_DELAY_MS, self._apply_search)
+    
+    def _apply_search(self):
+        """Filter the displayed map by the search query, or restore the full map."""
+        self._search_job = None
+        # While mapping, the query is applied once the map is complete
+        if self.map_tree is None or self.map_tree.root is None or self._mapping:
+            return
+        query = self.search_query.get().strip()
+        if not query:
+            if self._search_nodes is not None:
+                self._search_nodes = None
+                self._show_map()
+                self.status_bar.config(text=f"{self.map_tree.size:,} items")
+            return
+        started = time.perf_counter()
+        if self.search_index is None:
+            self.search_index = SearchIndex(self.map_tree)
+        try:
+            nodes = self.search_index.search(query)
+        except ValueError as e:
+            self.status_bar.config(text=f"Search: {e}")
+            return
+        self._search_nodes = nodes[:SEARCH_RESULT_LIMIT]
+        self._show_map()
+        status = f"{len(nodes):,} matches for {query!r} in {time.perf_counter() - started:.3f}s"
+        if len(nodes) > SEARCH_RESULT_LIMIT:
+            status += f" (showing the first {SEARCH_RESULT_LIMIT:,})"
+        self.status_bar.config(text=status)
+    
+    def _show_map(self):
+        """Render the current map into the selected view only."""
+        self._stop_text_fill()
+        self.output_text.delete(1.0, tk.END)
+        self._clear_tree()
+        if self.map_tree.root is None:
+            return
+        if self._search_nodes is not None:
+            self._show_search_results()
+        elif self.view_mode.get() == "tree":
+            self.tree_frame.tkraise()
+            root_node = self.map_tree.root
+            item = self.output_tree.insert("", tk.END, text=self._node_label(root_node), open=True)
+            self._tree_items[item] = (root_node, 0)
+            self._load_children(item)
+        else:
+            self.output_text.tkraise()
+            entries = self.map_tree.iter_entries(
+                totals=self._map_has_sizes, digests=self._map_has_digests
+            )
+            self._fill_text(entries)
+    
+    def _fill_text(self, entries):
+        """
+        Add entries to the text view a batch at a time between UI events,
+        as the tree view loads folders a page at a time.
+        """
+        self._text_fill = [render_text(entries)]
+        self._add_text_batch()
+    
+    def _add_text_batch(self):
+        """Insert the next batch of pending text lines and schedule the rest."""
+        self._text_job = None
+        pending = self._text_fill
+        while pending:
+            lines = list(islice(pending[0], MAP_BATCH_SIZE))
+            if lines:
+                self.output_text.insert(tk.END, "\n".join(lines) + "\n")
+                self._text_job = self.root.after(1, self._add_text_batch)
+                return
+            pending.pop(0)
+        self._text_fill = None
+    
+    def _stop_text_fill(self):
+        """Drop the text lines still waiting to be inserted."""
+        if self._text_job is not None:
+            self.root.after_cancel(self._text_job)
+            self._text_job = None
+        self._text_fill = None
+    
+    def _show_search_results(self):
+        """Show the search matches with their parent folders, fully expanded."""
+        entries = self.map_tree.iter_selection(
+            self._search_nodes, totals=self._map_has_sizes, digests=self._map_has_digests
         )
+        if self.view_mode.get() != "tree":
+            self.output_text.tkraise()
+            self._fill_text(entries)
+            return
+        self.tree_frame.tkraise()
+        # Tree view items of the open folders, by depth
+        parents = [""]
+        for entry in entries:
+            del parents[entry.depth + 1:]
+            label = entry.name
+            if entry.total_size is not None:
+                label += format_totals(entry.total_size, entry.file_count)
+            if entry.digest is not None:
+                label += f"  {entry.digest}"
+            item = self.output_tree.insert(parents[-1], tk.END, text=label, open=True)
+            parents.append(item)
+    
+    def _node_label(self, node):
+        """
+        Tree view text for a node, with subtree totals for folders when sizes
+        were collected and the node's digest when contents were hashed.
+        """
+        label = self.map_tree.name(node)
+        if self._map_has_sizes and self.map_tree.is_dir(node):
+            label += format_totals(self.map_tree.total_size(node), self.map_tree.file_count(node))
+        digest = self.map_tree.digest_of(node) if self._map_has_digests else None
+        if digest is not None:
+            label += f"  {digest}"
+        return label
+    
+    def _clear_tree(self):
+        self.output_tree.delete(*self.output_tree.get_children())
+        self._tree_items.clear()
+    
+    def _load_children(self, item):
+        """Insert the next page of children of a tree view item."""
+        node, start = self._tree_items[item]
+        children = self.map_tree.children(node)
+        end = min(start + TREE_PAGE_SIZE, len(children))
+        for child in children[start:end]:
+            child_item = self.output_tree.insert(item, tk.END, text=self._node_label(child))
+            if self.map_tree.is_dir(child):
+                self._tree_items[child_item] = (child, 0)
+                if self.map_tree.child_count(child):
+                    # Placeholder so the folder can be expanded
+                    self.output_tree.insert(child_item, tk.END, text="", tags=("placeholder",))
+        self._tree_items[item] = (node, end)
+        if end < len(children):
+            more = self.output_tree.insert(
+                item, tk.END, text=f"... {len(children) - end} more (select to load)", tags=("more",)
+            )
+            self._tree_items[more] = (node, end)
+    
+    def _on_tree_open(self, event):
+        """Fill a folder's children the first time it is expanded."""
+        item = self.output_tree.focus()
+        children = self.output_tree.get_children(item)
+        if len(children) == 1 and "placeholder" in self.output_tree.item(children[0], "tags"):
+            self.output_tree.delete(children[0])
+            self._load_children(item)
+    
+    def _on_tree_select(self, event):
+        """Load the next page of a large folder when its '... more' row is selected."""
+        for item in self.output_tree.selection():
+            if "more" in self.output_tree.item(item, "tags"):
+                parent = self.output_tree.parent(item)
+                del self._tree_items[item]
+                self.output_tree.delete(item)
+                self._load_children(parent)
     
     def _show_error(self, error_msg):
         """Show error message and re-enable controls."""
+        self._mapping = False
+        self.live_map = None
         messagebox.showerror("Error", error_msg)
         self.set_controls_state("normal")
         self.status_bar.config(text="Error occurred during generation")
@@ -201,37 +884,159 @@ class DirectoryMapperGUI:
         self.generate_btn.config(state=state)
         self.browse_btn.config(state=state)
         self.dir_entry.config(state=state)
+        self.clear_btn.config(state=state)
+        self.clear_cache_btn.config(state=state)
+        self.cancel_btn.config(state="normal" if state == "disabled" else "disabled")
         if state == "disabled":
             self.save_btn.config(state="disabled")
+            self.compare_btn.config(state="disabled")
     
     def save_to_file(self):
         """Save the current output to a file."""
-        content = self.output_text.get(1.0, tk.END).strip()
-        if not content:
-            messagebox.showwarning("Warning", "No content to save.")
-            return
+        if self.map_tree is None:
+            content = self.output_text.get(1.0, tk.END).strip()
+            if not content:
+                messagebox.showwarning("Warning", "No content to save.")
+                return
         
+        file_type = tk.StringVar(value=SAVE_FORMATS[0][0])
         filename = filedialog.asksaveasfilename(
             title="Save Directory Map",
             defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")],
-            initialfile="directory_map.txt"
+            filetypes=[(label, pattern) for label, pattern, _ in SAVE_FORMATS] + [("All files", "*.*")],
+            initialfile="directory_map.txt",
+            typevariable=file_type
         )
         
         if filename:
             try:
-                with open(filename, 'w') as f:
-                    f.write(content + '\n')
+                format = self._save_format(filename, file_type.get())
+                if self.map_tree is not None and format == "dirtree":
+                    # Saved trees can be compared or searched later
+                    self.map_tree.save(filename)
+                elif self.map_tree is not None:
+                    # Stream the full map from the model, whatever is on screen
+                    renderer = get_renderer(format)
+                    entries = self.map_tree.iter_entries(
+                        totals=self._map_has_sizes, digests=self._map_has_digests
+                    )
+                    write_directory_map(renderer(entries), filename)
+                else:
+                    with open(filename, 'w') as f:
+                        f.write(content + '\n')
                 messagebox.showinfo("Success", f"Directory map saved to {filename}")
                 self.status_bar.config(text=f"Saved to {os.path.basename(filename)}")
             except Exception as e:
                 messagebox.showerror("Error", f"Failed to save file: {str(e)}")
     
+    @staticmethod
+    def _save_format(filename, file_type):
+        """Pick the output format from the file extension, then the chosen file type."""
+        extension = os.path.splitext(filename)[1].lower()
+        by_extension = [f for _, pattern, f in SAVE_FORMATS if extension and pattern.endswith(extension)]
+        for label, _, format in SAVE_FORMATS:
+            if label == file_type and (not by_extension or format in by_extension):
+                return format
+        return by_extension[0] if by_extension else "text"
+    
     def clear_output(self):
-        """Clear the output text widget."""
+        """Clear the output views."""
+        self._stop_watching()
+        self._stop_text_fill()
         self.output_text.delete(1.0, tk.END)
+        self._clear_tree()
+        self.map_tree = None
+        self.search_index = None
+        self._search_nodes = None
         self.save_btn.config(state="disabled")
+        self.compare_btn.config(state="disabled")
         self.status_bar.config(text="Output cleared")
+    
+    def clear_cache(self):
+        """Drop all cached listings, in memory and on disk, and the checksums of this session."""
+        try:
+            self.result_cache.invalidate()
+        except OSError as e:
+            messagebox.showerror("Error", f"Failed to clear the cache: {str(e)}")
+            return
+        self.hash_cache = HashCache()
+        self.status_bar.config(text="Cache cleared; the next map walks the disk again")
+    
+    def compare_with_saved(self):
+        """Compare the current map with a saved directory tree, side by side."""
+        if self.map_tree is None or self.map_tree.root is None or self._mapping:
+            messagebox.showwarning("Warning", "Generate a map to compare first.")
+            return
+        filename = filedialog.askopenfilename(
+            title="Compare With Saved Map",
+            filetypes=[("Directory tree", "*.dirtree"), ("All files", "*.*")]
+        )
+        if not filename:
+            return
+        try:
+            saved = DirectoryTree.load(filename)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to load saved map: {str(e)}")
+            return
+        
+        entries = list(diff_trees(saved, self.map_tree))
+        counts = diff_summary(entries)
+        shown = entries[:DIFF_RESULT_LIMIT]
+        window = tk.Toplevel(self.root)
+        window.title(f"Compare {os.path.basename(filename)} with current map")
+        window.geometry("900x500")
+        window.columnconfigure(0, weight=1)
+        window.columnconfigure(1, weight=1)
+        window.rowconfigure(1, weight=1)
+        sides = [
+            (f"Saved: {filename}", saved, {e.old_node: e.status for e in shown if e.old_node is not None}),
+            (f"Current: {self.directory_path.get()}", self.map_tree,
+             {e.new_node: e.status for e in shown if e.new_node is not None}),
+        ]
+        for column, (title, tree, statuses) in enumerate(sides):
+            ttk.Label(window, text=title).grid(row=0, column=column, sticky=tk.W, padx=5, pady=(5, 0))
+            frame = ttk.Frame(window)
+            frame.grid(row=1, column=column, sticky=(tk.W, tk.E, tk.N, tk.S), padx=5, pady=5)
+            frame.columnconfigure(0, weight=1)
+            frame.rowconfigure(0, weight=1)
+            view = ttk.Treeview(frame, show="tree", selectmode="browse")
+            scroll = ttk.Scrollbar(frame, orient=tk.VERTICAL, command=view.yview)
+            view.configure(yscrollcommand=scroll.set)
+            view.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
+            scroll.grid(row=0, column=1, sticky=(tk.N, tk.S))
+            for status, color in DIFF_COLORS.items():
+                view.tag_configure(status, foreground=color)
+            self._fill_diff_view(view, tree, statuses)
+        
+        if entries:
+            summary = f"{counts['added']:,} added, {counts['removed']:,} removed, {counts['changed']:,} changed"
+            if len(entries) > len(shown):
+                summary += f" (first {len(shown):,} shown)"
+        else:
+            summary = "No differences."
+        ttk.Label(window, text=summary, relief=tk.SUNKEN, anchor=tk.W).grid(
+            row=2, column=0, columnspan=2, sticky=(tk.W, tk.E), padx=5, pady=(0, 5)
+        )
+        self.status_bar.config(text=f"Compared with {os.path.basename(filename)}: {summary}")
+    
+    @staticmethod
+    def _fill_diff_view(view, tree, statuses):
+        """Insert the differing nodes of one side and their parent folders, marked by status."""
+        by_path = {tree.path(node): status for node, status in statuses.items()}
+        # Tree view items of the open folders, by depth
+        parents = [""]
+        for entry in tree.iter_selection(statuses):
+            del parents[entry.depth + 1:]
+            status = by_path.get(entry.rel_path)
+            label = entry.name
+            if status is not None:
+                label = f"{DIFF_MARKERS[status]} {label}"
+                if entry.size is not None:
+                    label += f" ({format_size(entry.size)})"
+            item = view.insert(
+                parents[-1], tk.END, text=label, open=status is None, tags=(status,) if status else ()
+            )
+            parents.append(item)
 
 
 def main():
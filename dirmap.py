@@ -1,5 +1,27 @@
 import os
-import fnmatch
+import sys
+import time
+from functools import lru_cache
+
+from ignore_matcher import GitignoreMatcher
+from renderers import (
+    EXTENSIONS,
+    RENDERERS,
+    SIZED_FORMATS,
+    format_size,
+    get_renderer,
+    render_text,
+)
+from walker import SORT_ORDERS, SYMLINK_POLICIES, WalkLimits, root_name, walk_directory
+
+# Everything else (argparse, sqlite3, the tree model, search index, snapshots,
+# cache, live map, stats and the process pool) is imported where it is used,
+# so that mapping a small tree is not dominated by start-up time.
+
+WRITE_BUFFER_SIZE = 1 << 20
+WRITE_CHUNK_LINES = 4096
+# Top-level phases timed by MapStats; nested phases are left out of each other
+TIMED_PHASES = ("walk", "build", "render")
 
 
 def read_gitignore(gitignore_path):
@@ -15,79 +37,707 @@ def read_gitignore(gitignore_path):
     return ignore_patterns
 
 
+@lru_cache(maxsize=32)
+def _compiled_patterns(patterns):
+    return GitignoreMatcher(patterns)
+
+
+def compile_ignore_patterns(ignore_patterns):
+    """Return a compiled GitignoreMatcher for a list of .gitignore patterns."""
+    if isinstance(ignore_patterns, GitignoreMatcher):
+        return ignore_patterns
+    return _compiled_patterns(tuple(ignore_patterns))
+
+
 def is_ignored(path, ignore_patterns, base_path):
     """Check if a file or directory should be ignored based on the .gitignore patterns."""
+    matcher = compile_ignore_patterns(ignore_patterns)
+    if not matcher:
+        return False
     relative_path = os.path.relpath(path, base_path).replace(os.sep, "/")
-    for pattern in ignore_patterns:
-        # Handle patterns with leading '/'
-        if pattern.startswith("/"):
-            pattern = pattern[1:]
-        if fnmatch.fnmatch(relative_path, pattern) or fnmatch.fnmatch(
-            relative_path, os.path.join("**", pattern).replace(os.sep, "/")
-        ):
-            return True
-    return False
+    is_dir = matcher.has_dir_only and os.path.isdir(path)
+    return matcher.is_ignored(relative_path, is_dir)
 
 
-def map_directory(start_path, exclude_ignore=True, output_file=None):
+def default_output_file(format="text"):
+    """Return the default output path in the current directory for a format."""
+    return os.path.join(os.getcwd(), "directory_map" + EXTENSIONS[format])
+
+
+def iter_directory_map(
+    start_path,
+    exclude_ignore=True,
+    workers=None,
+    snapshot_file=None,
+    format="text",
+    totals=False,
+    limits=None,
+    stats=None,
+    order=None,
+    result_cache=None,
+    symlinks="skip",
+    content_hash=None,
+    hash_cache=None,
+    hash_workers=None,
+):
     """
-    Map the directory structure to 'directory_map.txt', optionally excluding
-    files/folders from .gitignore.
-    Returns the directory structure as a string.
+    Yield the lines of the directory map (without newlines) as the walk
+    proceeds, so a map can be consumed without holding it all in memory.
+
+    With snapshot_file, directory listings are cached there between runs and
+    only directories whose mtime changed are listed again. The snapshot is
+    updated once the walk completes. format selects the renderer (see
+    renderers.RENDERERS).
+    totals=True shows each directory's subtree size and file count. Those
+    are only known once the walk is over, so the map is first collected
+    into a compact DirectoryTree and rendered from there.
+    limits is an optional walker.WalkLimits bounding the walk's depth,
+    entries per directory, total entries and time. stats is an optional
+    map_stats.MapStats that records where the time goes. order sorts the
+    children of every directory (one of walker.SORT_ORDERS) so the map is
+    the same on every host; by default they keep the filesystem's order.
+    result_cache is an optional result_cache.ResultCache to map from.
+    symlinks says what to do with symlinked directories (one of
+    walker.SYMLINK_POLICIES): leave them out, show them unlisted or map
+    their contents. Unreadable directories appear with an '... error'
+    entry.
+    content_hash names a hashlib algorithm (e.g. "sha256") to add the
+    digest of every file's contents and a Merkle digest of every directory;
+    like totals, this maps into a DirectoryTree first. hash_workers files
+    are hashed at once, and hash_cache is an optional
+    content_hash.HashCache of digests of unchanged files.
     """
-    if output_file is None:
-        output_file = os.path.join(os.getcwd(), "directory_map.txt")
-    
-    gitignore_path = os.path.join(start_path, ".gitignore")
+    renderer = get_renderer(format)
+    if totals or content_hash:
+        tree = map_directory_tree(
+            start_path,
+            exclude_ignore,
+            workers,
+            snapshot_file,
+            collect_sizes=totals or format in SIZED_FORMATS,
+            limits=limits,
+            stats=stats,
+            order=order,
+            result_cache=result_cache,
+            symlinks=symlinks,
+            content_hash=content_hash,
+            hash_cache=hash_cache,
+            hash_workers=hash_workers,
+        )
+        entries = tree.iter_entries(totals=totals, digests=bool(content_hash))
+    else:
+        entries = iter_walk_entries(
+            start_path,
+            exclude_ignore,
+            snapshot_file,
+            workers=workers,
+            collect_sizes=format in SIZED_FORMATS,
+            limits=limits,
+            stats=stats,
+            order=order,
+            result_cache=result_cache,
+            symlinks=symlinks,
+        )
+        if stats is not None:
+            entries = stats.timed("walk", entries)
+    if stats is None:
+        return renderer(entries)
+    return stats.timed("render", renderer(entries), inner=TIMED_PHASES)
 
-    # Decide which patterns to use
-    if exclude_ignore and os.path.exists(gitignore_path):
-        ignore_patterns = read_gitignore(gitignore_path)
+
+def iter_walk_entries(
+    start_path,
+    exclude_ignore=True,
+    snapshot_file=None,
+    result_cache=None,
+    content_hash=None,
+    hash_cache=None,
+    hash_workers=None,
+    **walk_options,
+):
+    """
+    Yield walker entries for the map, managing the optional snapshot and
+    result cache (a result_cache.ResultCache whose unchanged listings are
+    used instead of listing directories again). With content_hash, files
+    carry the digest of their contents (see content_hash.hash_entries).
+    Other keyword arguments are passed on to walker.walk_directory.
+    """
+    stats = walk_options.get("stats")
+    if content_hash:
+        from content_hash import check_walk_options
+
+        check_walk_options(walk_options.get("limits"), walk_options.get("symlinks", "skip"))
+        # Sizes let hash_entries hand small files to its threads in batches
+        walk_options["collect_sizes"] = True
+    listing = None
+    if result_cache is not None:
+        listing = result_cache.listing(start_path, walk_options.get("scandir"))
+        walk_options["scandir"] = listing
+    snapshot = None
+    if snapshot_file:
+        from snapshot import Snapshot, snapshot_fingerprint
+
+        options = {
+            "root": os.path.abspath(start_path),
+            "exclude_ignore": exclude_ignore,
+            "symlinks": walk_options.get("symlinks", "skip"),
+        }
+        snapshot = Snapshot(snapshot_file, snapshot_fingerprint(start_path, options))
+    try:
+        entries = walk_directory(start_path, exclude_ignore, snapshot=snapshot, **walk_options)
+        if content_hash:
+            from content_hash import hash_entries
+
+            entries = hash_entries(entries, content_hash, hash_workers, hash_cache, stats)
+        yield from entries
+        if listing is not None:
+            result_cache.commit(listing)
+            if stats is not None:
+                # Like the snapshot, the cache stats every directory it lists
+                stats.count("result_cache_hits", listing.hits)
+                stats.count("result_cache_misses", listing.misses)
+                stats.count("stat_calls", listing.hits + listing.misses)
+        if snapshot is not None:
+            snapshot.commit()
+            if stats is not None:
+                # The snapshot stats every directory it is asked about
+                stats.count("snapshot_hits", snapshot.hits)
+                stats.count("stat_calls", snapshot.hits + snapshot.misses)
+    finally:
+        if snapshot is not None:
+            snapshot.close()
+
+
+def map_directory_tree(
+    start_path,
+    exclude_ignore=True,
+    workers=None,
+    snapshot_file=None,
+    collect_sizes=False,
+    limits=None,
+    stats=None,
+    order=None,
+    result_cache=None,
+    symlinks="skip",
+    content_hash=None,
+    hash_cache=None,
+    hash_workers=None,
+):
+    """
+    Map the directory structure into an in-memory DirectoryTree instead of
+    text, so it can be browsed or rendered later without walking again.
+    With content_hash the tree holds file and directory content digests
+    (see DirectoryTree.digest_of).
+    """
+    from tree_model import DirectoryTree
+
+    entries = iter_walk_entries(
+        start_path,
+        exclude_ignore,
+        snapshot_file,
+        content_hash=content_hash,
+        hash_cache=hash_cache,
+        hash_workers=hash_workers,
+        workers=workers,
+        collect_sizes=collect_sizes,
+        limits=limits,
+        stats=stats,
+        order=order,
+        result_cache=result_cache,
+        symlinks=symlinks,
+    )
+    if stats is None:
+        tree = DirectoryTree.from_entries(entries)
     else:
-        ignore_patterns = []
-
-    directory_tree = []
-    
-    for root, dirs, files in os.walk(start_path):
-        # Filter directories and files based on ignore patterns
-        dirs[:] = [
-            d
-            for d in dirs
-            if not is_ignored(os.path.join(root, d), ignore_patterns, start_path)
-        ]
-        files = [
-            file
-            for file in files
-            if not is_ignored(os.path.join(root, file), ignore_patterns, start_path)
-        ]
-
-        # Calculate indentation
-        level = root.replace(start_path, "").count(os.sep)
-        indent = " " * 4 * level
-        directory_tree.append(f"{indent}|_{os.path.basename(root)}")
-        sub_indent = " " * 4 * (level + 1)
-        for file in files:
-            directory_tree.append(f"{sub_indent}|_{file}")
-
-    # Write to file
-    tree_content = "\n".join(directory_tree) + "\n"
-    with open(output_file, "w") as f:
-        f.write(tree_content)
+        tree = stats.measure(
+            "build", DirectoryTree.from_entries, stats.timed("walk", entries), inner=TIMED_PHASES
+        )
+    tree.digest_algorithm = content_hash
+    return tree
+
+
+def load_tree(source, exclude_ignore=True, workers=None):
+    """
+    Return a DirectoryTree for source: a tree file saved with --save-tree
+    or --save-index is loaded, a directory is mapped live with sizes.
+    """
+    if os.path.isdir(source):
+        return map_directory_tree(source, exclude_ignore, workers, collect_sizes=True)
+    from tree_model import DirectoryTree
+
+    return DirectoryTree.load(source)
+
+
+def largest_subtrees_report(tree, n=10):
+    """Yield report lines for the n largest directories of a mapped tree."""
+    largest = tree.largest_subtrees(n)
+    if not largest:
+        yield "No directories below the root."
+        return
+    yield f"Largest {len(largest)} directories:"
+    for total, node in largest:
+        yield f"{format_size(total):>10}  {tree.file_count(node):>10,} files  {tree.path(node)}"
+
+
+def search_directory_map(index, query, format="text", totals=False, digests=False):
+    """
+    Yield the lines of a map showing only the entries of a SearchIndex that
+    match query, each with its chain of parent directories.
+    """
+    return get_renderer(format)(index.iter_matches(query, totals=totals, digests=digests))
+
+
+def write_directory_map(lines, output_file, buffer_size=WRITE_BUFFER_SIZE):
+    """
+    Stream map lines to output_file ('-' for stdout, or an open text file)
+    through a bounded write buffer. Returns the number of lines written.
+    """
+    if output_file == "-":
+        return _write_lines(lines, sys.stdout)
+    if hasattr(output_file, "write"):
+        return _write_lines(lines, output_file)
+    with open(output_file, "w", buffering=buffer_size) as f:
+        return _write_lines(lines, f)
+
+
+def _write_timed(lines, output_file, stats):
+    """write_directory_map, with the time left after producing lines recorded as 'write'."""
+    if stats is None:
+        return write_directory_map(lines, output_file)
+    return stats.measure("write", write_directory_map, lines, output_file, inner=TIMED_PHASES)
+
+
+def _write_lines(lines, f):
+    count = 0
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) >= WRITE_CHUNK_LINES:
+            f.write("\n".join(chunk) + "\n")
+            count += len(chunk)
+            chunk.clear()
+    if chunk:
+        f.write("\n".join(chunk) + "\n")
+        count += len(chunk)
+    f.flush()
+    return count
+
+
+def map_directory(
+    start_path,
+    exclude_ignore=True,
+    output_file=None,
+    workers=None,
+    snapshot_file=None,
+    format="text",
+    totals=False,
+    limits=None,
+    stats=None,
+    order=None,
+    result_cache=None,
+    symlinks="skip",
+    content_hash=None,
+    hash_cache=None,
+    hash_workers=None,
+):
+    """
+    Map the directory structure to 'directory_map.txt' (or the file for the
+    chosen format, e.g. 'directory_map.json'), optionally excluding
+    files/folders matched by .gitignore files (the root one, nested ones and
+    .git/info/exclude); .git folders are always left out then, as git does.
+    workers > 1 lists directories in parallel, which helps on slow or
+    network filesystems; the output is the same. snapshot_file enables
+    incremental re-mapping (see iter_directory_map). totals=True shows
+    each directory's subtree size and file count next to it. limits is an
+    optional WalkLimits, e.g. WalkLimits(max_depth=3, time_limit=60), so
+    huge trees produce a bounded map. Pass a map_stats.MapStats as stats to
+    get per-phase timings, counts, ignore pattern hits and peak memory.
+    order sorts each directory's children, e.g. "name" for output that is
+    byte-identical across hosts (see walker.SORT_ORDERS). result_cache is
+    an optional result_cache.ResultCache that keeps directory listings
+    between calls, so mapping the same root again, even with other options,
+    only lists the directories that changed. symlinks is the policy for
+    symlinked directories (see walker.SYMLINK_POLICIES). content_hash,
+    hash_cache and hash_workers add content digests, as in
+    iter_directory_map.
+    Returns the directory structure as a string; use iter_directory_map and
+    write_directory_map to stream large maps instead.
+    """
+    renderer = get_renderer(format)
+    if output_file is None:
+        output_file = default_output_file(format)
+
+    directory_tree = map_directory_tree(
+        start_path,
+        exclude_ignore,
+        workers,
+        snapshot_file,
+        totals or format in SIZED_FORMATS,
+        limits,
+        stats,
+        order,
+        result_cache,
+        symlinks,
+        content_hash,
+        hash_cache,
+        hash_workers,
+    )
+    digests = bool(content_hash)
+    lines = renderer(directory_tree.iter_entries(totals=totals, digests=digests))
+    if stats is not None:
+        lines = stats.timed("render", lines)
+    _write_timed(lines, output_file, stats)
+    if stats is not None:
+        stats.finish(directory_tree)
 
     print(f"Directory structure has been written to {output_file}")
-    return tree_content
+    return "\n".join(renderer(directory_tree.iter_entries(totals=totals, digests=digests))) + "\n"
 
 
-if __name__ == "__main__":
-    directory_path = input("Enter the directory path: ").strip()
-    if not os.path.isdir(directory_path):
-        print(f"Error: '{directory_path}' is not a valid directory.")
-        exit(1)
+def _replace_file(lines, output_file):
+    """Write lines to a temporary file next to output_file, then swap it in."""
+    temp_file = output_file + ".tmp"
+    write_directory_map(lines, temp_file)
+    os.replace(temp_file, output_file)
+
 
-    # Check for .gitignore and ask user whether to exclude
-    gitignore_path = os.path.join(directory_path, ".gitignore")
+def watch_directory(
+    start_path,
+    output_file=None,
+    exclude_ignore=True,
+    format="text",
+    totals=False,
+    debounce=None,
+    polling=False,
+    stop_event=None,
+    order=None,
+):
+    """
+    Map start_path once, then keep output_file up to date as files change
+    until stop_event is set or the run is interrupted. Only the changed
+    directories are listed again, and the text map only re-renders their
+    lines. Updates are debounced by debounce seconds (by default
+    watcher.DEFAULT_DEBOUNCE); polling=True uses
+    directory mtime polling instead of inotify. order sorts each
+    directory's children as in map_directory, except "dirs-first".
+    """
+    from watcher import DEFAULT_DEBOUNCE, LiveMap, watch_changes
+
+    if debounce is None:
+        debounce = DEFAULT_DEBOUNCE
+    if output_file is None:
+        output_file = default_output_file(format)
+    live_map = LiveMap(
+        start_path,
+        exclude_ignore,
+        format in SIZED_FORMATS,
+        totals,
+        skip_files=[output_file, output_file + ".tmp"],
+        order=order,
+    )
+    for _ in live_map.scan():
+        pass
+    _replace_file(live_map.lines(format), output_file)
+    print(f"Directory structure has been written to {output_file}; watching for changes "
+          "(Ctrl+C to stop)")
+    try:
+        for patches in watch_changes(live_map, stop_event, debounce, polling):
+            _replace_file(live_map.lines(format), output_file)
+            changed = sum(len(lines) for _, _, lines in patches)
+            print(f"{time.strftime('%H:%M:%S')} updated {len(patches)} region(s), "
+                  f"{changed} line(s); {live_map.size:,} items", file=sys.stderr)
+    except KeyboardInterrupt:
+        pass
+    return live_map
+
+
+def map_to_file(start_path, output_file, options, collect_stats=False):
+    """
+    Stream the map of one root to output_file and return a summary dict.
+    Errors are reported in the summary rather than raised, so one bad root
+    does not stop a batch. collect_stats adds MapStats data under 'stats'.
+    """
+    started = time.perf_counter()
+    summary = {"root": start_path, "output": output_file, "lines": 0, "error": None}
+    stats = None
+    if collect_stats:
+        from map_stats import MapStats
+
+        stats = MapStats()
+    try:
+        lines = iter_directory_map(start_path, stats=stats, **options)
+        summary["lines"] = _write_timed(lines, output_file, stats)
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+    summary["seconds"] = round(time.perf_counter() - started, 3)
+    if stats is not None:
+        summary["stats"] = stats.finish().as_dict()
+    return summary
+
+
+def batch_output_files(roots, output_dir, format="text"):
+    """Return one output path per root in output_dir, named after the root."""
+    used = set()
+    outputs = []
+    for root in roots:
+        base = root_name(root) or "root"
+        name = base + EXTENSIONS[format]
+        counter = 1
+        while name in used:
+            counter += 1
+            name = f"{base}-{counter}{EXTENSIONS[format]}"
+        used.add(name)
+        outputs.append(os.path.join(output_dir, name))
+    return outputs
+
+
+def map_roots(roots, output_dir, jobs=None, snapshot_dir=None, collect_stats=False, **options):
+    """
+    Map many roots in a process pool, writing one output file per root into
+    output_dir. Returns the list of per-root summaries in input order.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    outputs = batch_output_files(roots, output_dir, options.get("format", "text"))
+    tasks = []
+    for root, output_file in zip(roots, outputs):
+        root_options = dict(options)
+        if snapshot_dir:
+            name = os.path.splitext(os.path.basename(output_file))[0]
+            root_options["snapshot_file"] = os.path.join(snapshot_dir, name + ".snapshot")
+        tasks.append((root, output_file, root_options, collect_stats))
+    if snapshot_dir:
+        os.makedirs(snapshot_dir, exist_ok=True)
+
+    if jobs == 1 or len(tasks) == 1:
+        return [map_to_file(*task) for task in tasks]
+    from concurrent.futures import ProcessPoolExecutor
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        return list(pool.map(map_to_file, *zip(*tasks)))
+
+
+def build_parser():
+    """Build the command-line argument parser."""
+    import argparse
+
+    from content_hash import DEFAULT_ALGORITHM, DEFAULT_HASH_WORKERS
+    from result_cache import DEFAULT_DISK_BYTES, default_cache_dir
+    from watcher import DEFAULT_DEBOUNCE
+
+    parser = argparse.ArgumentParser(
+        description="Generate a text-based map of a directory's structure."
+    )
+    parser.add_argument(
+        "paths",
+        nargs="*",
+        metavar="path",
+        help="directories to map (prompted for if omitted); several paths are "
+        "mapped in parallel, one output file each",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="output file for a single path, or '-' for stdout (default: "
+        "directory_map.txt, or the extension of the chosen format)",
+    )
+    parser.add_argument(
+        "--output-dir",
+        default=".",
+        help="directory for per-path output files when mapping several paths "
+        "(default: current directory)",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        choices=list(RENDERERS),
+        default="text",
+        help="output format (default: text)",
+    )
+    parser.add_argument(
+        "--no-gitignore",
+        action="store_true",
+        help="include files and folders matched by .gitignore, and .git folders",
+    )
+    parser.add_argument(
+        "--sizes",
+        action="store_true",
+        help="show the total size and file count of each directory",
+    )
+    parser.add_argument(
+        "--top",
+        type=int,
+        metavar="N",
+        help="also report the N largest directories (single path only)",
+    )
+    parser.add_argument(
+        "--max-depth",
+        type=int,
+        metavar="N",
+        help="do not list directories more than N levels below the root",
+    )
+    parser.add_argument(
+        "--max-entries-per-dir",
+        type=int,
+        metavar="N",
+        help="show at most N entries per directory; the rest are collapsed into '... N more'",
+    )
+    parser.add_argument(
+        "--max-entries",
+        type=int,
+        metavar="N",
+        help="stop after N entries in total",
+    )
+    parser.add_argument(
+        "--time-limit",
+        type=float,
+        metavar="SECONDS",
+        help="stop walking after this many seconds",
+    )
+    parser.add_argument(
+        "--sort",
+        choices=SORT_ORDERS,
+        help="sort the entries of each directory, for output that is identical on every "
+        "host: name, natural (file2 before file10), dirs-first or size (largest files "
+        "first); default: filesystem order",
+    )
+    parser.add_argument(
+        "--symlinks",
+        choices=SYMLINK_POLICIES,
+        default="skip",
+        help="what to do with symlinks to directories: skip them (default), list them "
+        "without their contents, or follow them (loops are detected and reported)",
+    )
+    parser.add_argument(
+        "--hash",
+        action="store_true",
+        help="add a digest of every file's contents and a Merkle digest of every directory, "
+        "e.g. for deployment manifests",
+    )
+    parser.add_argument(
+        "--hash-algorithm",
+        default=DEFAULT_ALGORITHM,
+        metavar="NAME",
+        help=f"hashlib algorithm for --hash (default: {DEFAULT_ALGORITHM})",
+    )
+    parser.add_argument(
+        "--hash-workers",
+        type=int,
+        metavar="N",
+        help=f"files hashed at once with --hash (default: {DEFAULT_HASH_WORKERS})",
+    )
+    parser.add_argument(
+        "--hash-cache",
+        metavar="FILE",
+        help="keep file digests in FILE and only hash files whose size, mtime, inode or "
+        "ctime changed since (implies --hash)",
+    )
+    parser.add_argument(
+        "--search",
+        metavar="QUERY",
+        help="only show entries matching QUERY and their parent directories, e.g. "
+        "'*.log size>100MB under:build' (see search_index.py for the syntax)",
+    )
+    parser.add_argument(
+        "--save-index",
+        metavar="FILE",
+        help="save the mapped tree and its search index to FILE (single path only)",
+    )
+    parser.add_argument(
+        "--index",
+        metavar="FILE",
+        help="render or search a tree saved with --save-index instead of walking a path",
+    )
+    parser.add_argument(
+        "--save-tree",
+        metavar="FILE",
+        help="save the mapped tree to FILE, to compare against later with --diff",
+    )
+    parser.add_argument(
+        "--diff",
+        nargs=2,
+        metavar=("OLD", "NEW"),
+        help="compare two maps instead of mapping; each is a file saved with --save-tree "
+        "or --save-index, or a directory to map now. Exits with 1 if they differ",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        help="keep the output file up to date as files change (single path only; "
+        "inotify on Linux, polling elsewhere)",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=DEFAULT_DEBOUNCE,
+        metavar="SECONDS",
+        help=f"with --watch, wait this long after a change before updating (default: {DEFAULT_DEBOUNCE})",
+    )
+    parser.add_argument(
+        "--poll",
+        action="store_true",
+        help="with --watch, poll directory mtimes instead of using inotify",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print phase timings, counts, ignore pattern hits and peak memory to stderr "
+        "(added to dirmap_summary.json when mapping several paths)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        help="threads used to list directories of each path (useful on network filesystems)",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        help="processes used when mapping several paths (default: CPU count)",
+    )
+    parser.add_argument(
+        "--snapshot",
+        metavar="FILE",
+        help="reuse and update a listing snapshot to speed up repeated runs",
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="reuse the folder listings cached by earlier runs while the folders are "
+        "unchanged, also with other options (e.g. --no-gitignore, --sort); the cache "
+        "is shared with the GUI",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        metavar="DIR",
+        help=f"directory of the cache (implies --cache; default: {default_cache_dir()})",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_DISK_BYTES >> 20,
+        metavar="MB",
+        help=f"disk space for cached listings, least recently used paths dropped first "
+        f"(default: {DEFAULT_DISK_BYTES >> 20})",
+    )
+    parser.add_argument(
+        "--clear-cache",
+        action="store_true",
+        help="drop the cached listings of the given paths before mapping, or of every path "
+        "when none is given",
+    )
+    parser.add_argument(
+        "--snapshot-dir",
+        metavar="DIR",
+        help="keep one listing snapshot per path in DIR when mapping several paths",
+    )
+    return parser
+
+
+def _prompt_for_path():
+    """Interactive fallback used when no path is given on the command line."""
+    directory_path = input("Enter the directory path: ").strip()
     exclude_ignore = True
-    if os.path.exists(gitignore_path):
+    if os.path.exists(os.path.join(directory_path, ".gitignore")):
         answer = (
             input("Exclude files and folders from the .gitignore file? [Y/n]: ")
             .strip()
@@ -95,5 +745,238 @@ if __name__ == "__main__":
         )
         if answer and answer[0] == "n":
             exclude_ignore = False
+    return directory_path, exclude_ignore
+
+
+def _map_with_tree(start_path, output_file, args, options, stats=None):
+    """
+    Write the map from an in-memory tree (mapped, or loaded with --index),
+    filtered by --search, then report the largest directories and save the
+    index as requested.
+    """
+    from search_index import SearchIndex
+
+    index = None
+    if args.index:
+        index = SearchIndex.load(args.index)
+        tree = index.tree
+    else:
+        tree = map_directory_tree(
+            start_path,
+            options["exclude_ignore"],
+            options["workers"],
+            options.get("snapshot_file"),
+            collect_sizes=True,
+            limits=options["limits"],
+            stats=stats,
+            order=options["order"],
+            result_cache=options.get("result_cache"),
+            symlinks=options["symlinks"],
+            content_hash=options["content_hash"],
+            hash_cache=options["hash_cache"],
+            hash_workers=options["hash_workers"],
+        )
+    # Saved trees keep the digests they were mapped with
+    digests = tree.digest_algorithm is not None
+    if index is None and (args.search is not None or args.save_index):
+        index = SearchIndex(tree)
+    if args.search is not None:
+        lines = search_directory_map(
+            index, args.search, options["format"], options["totals"], digests
+        )
+    else:
+        renderer = get_renderer(options["format"])
+        lines = renderer(tree.iter_entries(totals=options["totals"], digests=digests))
+    if stats is not None:
+        lines = stats.timed("render", lines)
+    _write_timed(lines, output_file, stats)
+    # Keep stdout clean when the map itself goes there
+    report_file = sys.stderr if output_file == "-" else sys.stdout
+    if args.top:
+        for line in largest_subtrees_report(tree, args.top):
+            print(line, file=report_file)
+    if args.save_index:
+        index.save(args.save_index)
+        print(f"Search index has been written to {args.save_index}", file=report_file)
+    if args.save_tree:
+        tree.save(args.save_tree)
+        print(f"Tree has been written to {args.save_tree}", file=report_file)
+    return tree
+
+
+def _diff_main(sources, output_file, format, exclude_ignore):
+    """Write the differences between two maps; exit status 1 if there are any, like diff."""
+    import sqlite3
+
+    from tree_diff import DIFF_RENDERERS, diff_trees
+
+    try:
+        old, new = (load_tree(source, exclude_ignore) for source in sources)
+    except (OSError, ValueError, sqlite3.Error) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    entries = list(diff_trees(old, new))
+    write_directory_map(DIFF_RENDERERS[format](old, new, entries), output_file)
+    return 1 if entries else 0
+
+
+def main(argv=None):
+    """Command-line entry point."""
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    exclude_ignore = not args.no_gitignore
+    paths = args.paths
+    if args.diff:
+        from tree_diff import DIFF_RENDERERS
+
+        if paths or args.index:
+            parser.error("--diff compares the two maps it is given; do not pass paths or --index")
+        if args.format not in DIFF_RENDERERS:
+            parser.error(f"--diff writes {' or '.join(DIFF_RENDERERS)}, not {args.format}")
+        return _diff_main(args.diff, args.output or "-", args.format, exclude_ignore)
+    result_cache = None
+    if args.cache or args.cache_dir or args.clear_cache:
+        from result_cache import ResultCache, default_cache_dir
 
-    map_directory(directory_path, exclude_ignore)
+        result_cache = ResultCache(args.cache_dir or default_cache_dir(), max_disk=args.cache_size << 20)
+        if args.clear_cache:
+            if not paths and not args.index:
+                result_cache.invalidate()
+                print(f"Cleared the cache in {result_cache.directory}")
+                return 0
+            for path in paths:
+                result_cache.invalidate(path)
+        if not (args.cache or args.cache_dir):
+            result_cache = None
+    if args.index:
+        if paths:
+            parser.error("--index replaces the path argument")
+        if args.save_index:
+            parser.error("--index already reads a saved index")
+        paths = [args.index]
+    elif not paths:
+        # Scripted runs (cron, CI, pipes) must never wait for an answer
+        if sys.stdin is None or not sys.stdin.isatty():
+            parser.error("path is required")
+        path, exclude_ignore = _prompt_for_path()
+        paths = [path]
+
+    invalid = [path for path in paths if not args.index and not os.path.isdir(path)]
+    for path in invalid:
+        print(f"Error: '{path}' is not a valid directory.", file=sys.stderr)
+    if invalid:
+        return 1
+
+    content_hash = hash_cache = None
+    if args.hash or args.hash_cache:
+        from content_hash import HashCache, check_algorithm
+
+        try:
+            content_hash = check_algorithm(args.hash_algorithm)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.max_depth is not None or args.symlinks == "list":
+            parser.error("--hash cannot be combined with --max-depth or --symlinks list, "
+                         "which leave folders unlisted")
+        if args.hash_cache:
+            hash_cache = HashCache(args.hash_cache)
+
+    options = {
+        "exclude_ignore": exclude_ignore,
+        "workers": args.workers,
+        "format": args.format,
+        "totals": args.sizes,
+        "limits": WalkLimits(
+            args.max_depth, args.max_entries_per_dir, args.max_entries, args.time_limit
+        ),
+        "order": args.sort,
+        "result_cache": result_cache,
+        "symlinks": args.symlinks,
+        "content_hash": content_hash,
+        "hash_cache": hash_cache,
+        "hash_workers": args.hash_workers,
+    }
+
+    if len(paths) == 1:
+        if args.snapshot:
+            options["snapshot_file"] = args.snapshot
+        output_file = args.output or default_output_file(args.format)
+        if args.watch:
+            if output_file == "-" or args.index or args.search is not None or args.top:
+                parser.error("--watch needs an output file and cannot be combined with "
+                             "--index, --search or --top")
+            if args.sort == "dirs-first":
+                parser.error("--watch cannot sort with dirs-first")
+            if args.symlinks != "skip":
+                parser.error("--watch always skips symlinked directories")
+            if content_hash:
+                parser.error("--watch cannot be combined with --hash")
+            watch_directory(
+                paths[0],
+                output_file,
+                exclude_ignore,
+                args.format,
+                args.sizes,
+                args.debounce,
+                args.poll,
+                order=args.sort,
+            )
+            return 0
+        stats = None
+        if args.stats:
+            from map_stats import MapStats
+
+            stats = MapStats()
+        tree = None
+        if args.top or args.search is not None or args.save_index or args.save_tree or args.index:
+            import sqlite3
+
+            try:
+                tree = _map_with_tree(paths[0], output_file, args, options, stats)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                print(f"Error: {e}", file=sys.stderr)
+                return 1
+        else:
+            lines = iter_directory_map(paths[0], stats=stats, **options)
+            _write_timed(lines, output_file, stats)
+        if output_file != "-":
+            print(f"Directory structure has been written to {output_file}")
+        if stats is not None:
+            for line in stats.finish(tree).report():
+                print(line, file=sys.stderr)
+        return 0
+
+    if (args.output or args.snapshot or args.top or args.search is not None or args.save_index
+            or args.save_tree or args.watch):
+        parser.error("--output, --snapshot, --top, --search, --save-index, --save-tree and "
+                     "--watch take a single path; use --output-dir and --snapshot-dir with "
+                     "several paths")
+    summaries = map_roots(
+        paths,
+        args.output_dir,
+        jobs=args.jobs,
+        snapshot_dir=args.snapshot_dir,
+        collect_stats=args.stats,
+        **options,
+    )
+    import json
+
+    summary_file = os.path.join(args.output_dir, "dirmap_summary.json")
+    with open(summary_file, "w") as f:
+        json.dump(summaries, f, indent=2)
+
+    failed = 0
+    for summary in summaries:
+        if summary["error"]:
+            failed += 1
+            print(f"✗ {summary['root']}: {summary['error']}", file=sys.stderr)
+        else:
+            print(f"✓ {summary['root']} -> {summary['output']} "
+                  f"({summary['lines']} lines, {summary['seconds']}s)")
+    print(f"Mapped {len(summaries) - failed}/{len(summaries)} paths; summary in {summary_file}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,379 @@
+"""
+Compiled .gitignore matching for the directory mapper.
+
+Patterns are translated once into a handful of combined regular expressions
+instead of running fnmatch for every pattern on every path. Patterns are
+grouped by how they have to be matched:
+
+- basename patterns (no slash) are matched against the entry name only,
+  literal names go into a set lookup;
+- path patterns (containing a slash) are matched against the path relative
+  to the directory holding the .gitignore file;
+- directory-only patterns (trailing slash) are only tried for directories.
+
+Negation (``!``) is handled by splitting the pattern list into runs of the
+same polarity. Runs are checked last to first, so the last matching pattern
+wins, exactly like git.
+
+Nested .gitignore files are handled by an IgnoreStack: each directory with an
+ignore file pushes its compiled matcher while it is being walked, and rules
+from deeper files override the ones above them.
+"""
+
+import os
+import re
+import threading
+
+GITIGNORE = ".gitignore"
+
+
+def _translate_segment(segment):
+    """Translate one glob path segment (no slashes) into a regex fragment."""
+    out = []
+    i = 0
+    n = len(segment)
+    while i < n:
+        c = segment[i]
+        i += 1
+        if c == "*":
+            # '**' inside a segment behaves like a plain '*'
+            while i < n and segment[i] == "*":
+                i += 1
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and segment[j] in "!^":
+                j += 1
+            if j < n and segment[j] == "]":
+                j += 1
+            while j < n and segment[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+                continue
+            body = segment[i:j]
+            i = j + 1
+            if body[:1] in ("!", "^"):
+                body = "^" + body[1:]
+            out.append("[" + body.replace("\\", "\\\\") + "]")
+        elif c == "\\" and i < n:
+            out.append(re.escape(segment[i]))
+            i += 1
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
+def translate_pattern(pattern):
+    """Translate a gitignore path pattern (without '!' or trailing '/') into a regex."""
+    segments = pattern.split("/")
+    last = len(segments) - 1
+    out = []
+    for i, segment in enumerate(segments):
+        if segment == "**":
+            if i == last:
+                out.append(".*")
+            else:
+                out.append("(?:.*/)?")
+            continue
+        out.append(_translate_segment(segment))
+        if i != last:
+            out.append("/")
+    return "".join(out)
+
+
+def _is_literal(pattern):
+    return not any(c in pattern for c in "*?[\\")
+
+
+class IgnorePattern:
+    """A single parsed .gitignore line."""
+
+    __slots__ = ("source", "pattern", "negated", "dir_only", "basename", "regex", "_compiled")
+
+    def __init__(self, source):
+        self.source = source
+        pattern = source
+        self.negated = pattern.startswith("!")
+        if self.negated:
+            pattern = pattern[1:]
+        elif pattern.startswith("\\!") or pattern.startswith("\\#"):
+            pattern = pattern[1:]
+        self.dir_only = pattern.endswith("/")
+        pattern = pattern.rstrip("/")
+        # A leading '**/' matches in any directory, just like a bare name
+        while pattern.startswith("**/"):
+            pattern = pattern[3:]
+            if "/" in pattern:
+                pattern = "**/" + pattern
+                break
+        self.basename = "/" not in pattern
+        self.pattern = pattern.lstrip("/")
+        if self.basename:
+            self.regex = _translate_segment(self.pattern)
+        else:
+            self.regex = translate_pattern(self.pattern)
+        self._compiled = None
+
+    def matches(self, relative_path, name, is_dir):
+        """Match this pattern alone; slow, used only to attribute decisions."""
+        if self.dir_only and not is_dir:
+            return False
+        if self._compiled is None:
+            self._compiled = re.compile(self.regex + r"\Z", re.DOTALL)
+        return self._compiled.match(name if self.basename else relative_path) is not None
+
+    def __repr__(self):
+        return f"IgnorePattern({self.source!r})"
+
+
+def parse_pattern(line):
+    """Parse a raw .gitignore line, returning None for blanks and comments."""
+    line = line.rstrip("\n").rstrip("\r")
+    # Trailing spaces are ignored unless escaped with a backslash
+    stripped = line.rstrip(" ")
+    if stripped.endswith("\\") and len(stripped) < len(line):
+        stripped += " "
+    if not stripped or stripped.startswith("#"):
+        return None
+    pattern = IgnorePattern(stripped)
+    if not pattern.pattern:
+        return None
+    return pattern
+
+
+def _combine(regexes):
+    if not regexes:
+        return None
+    return re.compile("(?:" + "|".join(regexes) + r")\Z", re.DOTALL)
+
+
+class _PatternRun:
+    """Consecutive patterns with the same polarity, merged into combined regexes."""
+
+    __slots__ = (
+        "negated",
+        "names",
+        "dir_names",
+        "name_re",
+        "dir_name_re",
+        "path_re",
+        "dir_path_re",
+    )
+
+    def __init__(self, negated, patterns):
+        self.negated = negated
+        self.names = set()
+        self.dir_names = set()
+        name_regexes, dir_name_regexes = [], []
+        path_regexes, dir_path_regexes = [], []
+        for p in patterns:
+            if p.basename:
+                if _is_literal(p.pattern):
+                    (self.dir_names if p.dir_only else self.names).add(p.pattern)
+                else:
+                    (dir_name_regexes if p.dir_only else name_regexes).append(p.regex)
+            else:
+                (dir_path_regexes if p.dir_only else path_regexes).append(p.regex)
+        self.name_re = _combine(name_regexes)
+        self.dir_name_re = _combine(dir_name_regexes)
+        self.path_re = _combine(path_regexes)
+        self.dir_path_re = _combine(dir_path_regexes)
+
+    def matches(self, relative_path, name, is_dir):
+        if name in self.names:
+            return True
+        if self.name_re is not None and self.name_re.match(name):
+            return True
+        if self.path_re is not None and self.path_re.match(relative_path):
+            return True
+        if is_dir:
+            if name in self.dir_names:
+                return True
+            if self.dir_name_re is not None and self.dir_name_re.match(name):
+                return True
+            if self.dir_path_re is not None and self.dir_path_re.match(relative_path):
+                return True
+        return False
+
+
+class GitignoreMatcher:
+    """
+    Matcher compiled once from a list of .gitignore patterns.
+
+    Paths passed to ``match`` are '/'-separated and relative to the directory
+    the patterns were read from. origin is the ignore file's path, if any.
+    """
+
+    def __init__(self, patterns, origin=None):
+        self.origin = origin
+        self.patterns = []
+        for line in patterns:
+            pattern = line if isinstance(line, IgnorePattern) else parse_pattern(line)
+            if pattern is not None:
+                self.patterns.append(pattern)
+        self.has_dir_only = any(p.dir_only for p in self.patterns)
+        self._runs = []
+        start = 0
+        for i in range(1, len(self.patterns) + 1):
+            if i == len(self.patterns) or self.patterns[i].negated != self.patterns[start].negated:
+                self._runs.append(
+                    _PatternRun(self.patterns[start].negated, self.patterns[start:i])
+                )
+                start = i
+        self._runs.reverse()
+
+    def __bool__(self):
+        return bool(self.patterns)
+
+    def __len__(self):
+        return len(self.patterns)
+
+    def match(self, relative_path, is_dir=False):
+        """
+        Return True if the path is ignored, False if it is explicitly
+        re-included by a negated pattern, or None if no pattern matches.
+        """
+        name = relative_path.rpartition("/")[2]
+        for run in self._runs:
+            if run.matches(relative_path, name, is_dir):
+                return not run.negated
+        return None
+
+    def is_ignored(self, relative_path, is_dir=False):
+        """Return True if the path is ignored by these patterns."""
+        return self.match(relative_path, is_dir) is True
+
+    def match_pattern(self, relative_path, is_dir=False):
+        """
+        Return the IgnorePattern that decides the path (the last one that
+        matches), or None. Same result as match, but pattern by pattern.
+        """
+        name = relative_path.rpartition("/")[2]
+        for pattern in reversed(self.patterns):
+            if pattern.matches(relative_path, name, is_dir):
+                return pattern
+        return None
+
+
+def compile_patterns(patterns):
+    """Build a GitignoreMatcher from the output of read_gitignore."""
+    return GitignoreMatcher(patterns)
+
+
+class IgnoreStack:
+    """
+    Immutable stack of matchers, one per directory that has ignore rules.
+
+    Each frame holds the '/'-terminated path prefix (relative to the map root)
+    of the directory its patterns were read from. Pushing returns a new stack
+    sharing the outer frames, so popping is simply going back to the parent's
+    stack when the walk leaves a directory.
+    """
+
+    __slots__ = ("parent", "prefix", "matcher")
+
+    def __init__(self, parent=None, prefix="", matcher=None):
+        self.parent = parent
+        self.prefix = prefix
+        self.matcher = matcher
+
+    def push(self, prefix, matcher):
+        """Return a new stack with matcher on top, or self if there is nothing to add."""
+        if not matcher:
+            return self
+        return IgnoreStack(self, prefix, matcher)
+
+    def __bool__(self):
+        return self.matcher is not None
+
+    def is_ignored(self, relative_path, is_dir=False):
+        """Check a root-relative path against every frame, innermost first."""
+        frame = self
+        while frame is not None and frame.matcher is not None:
+            result = frame.matcher.match(relative_path[len(frame.prefix):], is_dir)
+            if result is not None:
+                return result
+            frame = frame.parent
+        return False
+
+    def match_pattern(self, relative_path, is_dir=False):
+        """Return (matcher, pattern) deciding the path, innermost first, or (None, None)."""
+        for matcher, prefix in self.frames():
+            pattern = matcher.match_pattern(relative_path[len(prefix):], is_dir)
+            if pattern is not None:
+                return matcher, pattern
+        return None, None
+
+    def frames(self):
+        """Yield (matcher, prefix) for every frame, innermost first."""
+        frame = self
+        while frame is not None and frame.matcher is not None:
+            yield frame.matcher, frame.prefix
+            frame = frame.parent
+
+
+def read_ignore_file(path):
+    """Read and compile an ignore file, returning None if it has no patterns."""
+    try:
+        with open(path, "r", encoding="utf-8", errors="surrogateescape") as f:
+            matcher = GitignoreMatcher(f, origin=path)
+    except OSError:
+        return None
+    return matcher or None
+
+
+class IgnoreFileCache:
+    """
+    Cache of compiled matchers keyed by ignore file path.
+
+    Entries are revalidated against the file's mtime and size, so a file is
+    only parsed again when it actually changed.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def load(self, path):
+        """Return the compiled matcher for path, or None if it is missing or empty."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            with self._lock:
+                self._entries.pop(path, None)
+            return None
+        key = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._entries.get(path)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        matcher = read_ignore_file(path)
+        with self._lock:
+            self._entries[path] = (key, matcher)
+        return matcher
+
+    def load_dir(self, directory):
+        """Return the matcher for the .gitignore inside directory."""
+        return self.load(os.path.join(directory, GITIGNORE))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+default_cache = IgnoreFileCache()
+
+
+def root_ignore_stack(start_path, cache=None):
+    """
+    Build the ignore stack for the map root: .git/info/exclude first, then the
+    root .gitignore, so the latter takes precedence.
+    """
+    cache = cache or default_cache
+    stack = IgnoreStack()
+    stack = stack.push("", cache.load(os.path.join(start_path, ".git", "info", "exclude")))
+    stack = stack.push("", cache.load_dir(start_path))
+    return stack
@@ -0,0 +1,305 @@
+"""
+Persistent map server, so scripted runs skip interpreter and import start-up.
+
+Mapping a small tree takes a few milliseconds, but starting Python and
+importing the mapper for each run takes several times that. A map server
+is a long-running process that has already imported everything and
+answers requests on a unix socket; the client here only needs the socket
+and json modules, and passes its arguments and working directory to the
+server, which runs dirmap's command line for it and streams stdout,
+stderr and the exit status back:
+
+    python map_server.py serve &
+    python map_server.py src -o map.txt --format json   # same as dirmap.py
+    python map_server.py stop
+
+run() falls back to mapping in this process when no server is running,
+when unix sockets are unavailable, for --watch and when no arguments are
+given (so the path can be prompted for). Requests are handled one at a
+time, in the server's environment: environment variables such as
+XDG_CACHE_HOME are the server's, not the client's.
+
+The socket is $DIRMAP_SOCKET, else dirmap.sock in $XDG_RUNTIME_DIR, else
+/tmp/dirmap-<uid>.sock, and is only accessible to the user who started
+the server.
+"""
+
+import json
+import os
+import socket
+import sys
+
+# Modules imported when the server starts so that requests never wait for them
+PRELOAD = (
+    "argparse",
+    "csv",
+    "json",
+    "sqlite3",
+    "hashlib",
+    "concurrent.futures",
+    "map_stats",
+    "search_index",
+    "snapshot",
+    "tree_diff",
+    "tree_model",
+    "watcher",
+)
+# Output is sent to the client in messages of about this many characters
+SEND_CHUNK = 1 << 16
+
+
+def default_socket_path():
+    """Socket the server listens on and the client connects to."""
+    path = os.environ.get("DIRMAP_SOCKET")
+    if path:
+        return path
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return os.path.join(runtime_dir, "dirmap.sock")
+    uid = os.getuid() if hasattr(os, "getuid") else os.getpid()
+    return f"/tmp/dirmap-{uid}.sock"
+
+
+def _send(conn, message):
+    conn.sendall(json.dumps(message).encode() + b"\n")
+
+
+def _connect(socket_path):
+    """Return a socket connected to the server, or None if none is running."""
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+# Client
+
+
+def request(argv, socket_path=None):
+    """
+    Run dirmap's command line with argv on the map server, copying its
+    output to sys.stdout and sys.stderr. Returns the exit status, or None
+    if no server is running.
+    """
+    sock = _connect(socket_path or default_socket_path())
+    if sock is None:
+        return None
+    with sock:
+        _send(sock, {"argv": list(argv), "cwd": os.getcwd()})
+        for line in sock.makefile("rb"):
+            message = json.loads(line)
+            if "stdout" in message:
+                sys.stdout.write(message["stdout"])
+            elif "stderr" in message:
+                sys.stderr.write(message["stderr"])
+            elif "exit" in message:
+                sys.stdout.flush()
+                return message["exit"]
+    print("Error: the map server closed the connection", file=sys.stderr)
+    return 1
+
+
+def run(argv=None, socket_path=None):
+    """Run dirmap's command line through the map server if one is running, else here."""
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and "--watch" not in argv:
+        code = request(argv, socket_path)
+        if code is not None:
+            return code
+    from dirmap import main
+
+    return main(argv)
+
+
+def stop(socket_path=None):
+    """Ask the server to shut down; returns False if none was running."""
+    sock = _connect(socket_path or default_socket_path())
+    if sock is None:
+        return False
+    with sock:
+        _send(sock, {"command": "stop"})
+        sock.makefile("rb").readline()
+    return True
+
+
+# Server
+
+
+class _SocketWriter:
+    """Text stream sent to the client as {name: text} messages."""
+
+    def __init__(self, conn, name):
+        self._conn = conn
+        self._name = name
+        self._parts = []
+        self._size = 0
+
+    def write(self, text):
+        self._parts.append(text)
+        self._size += len(text)
+        if self._size >= SEND_CHUNK:
+            self.flush()
+        return len(text)
+
+    def flush(self):
+        if self._parts:
+            text = "".join(self._parts)
+            self._parts = []
+            self._size = 0
+            _send(self._conn, {self._name: text})
+
+    def isatty(self):
+        return False
+
+
+def _exit_code(exit):
+    code = exit.code
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+def _run_request(request, stdout, stderr, main):
+    """Run one command line with the process's cwd and standard streams swapped in."""
+    import io
+    import traceback
+
+    saved = sys.stdin, sys.stdout, sys.stderr
+    cwd = os.getcwd()
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(), stdout, stderr
+    try:
+        os.chdir(request["cwd"])
+        return main(request["argv"]) or 0
+    except SystemExit as e:
+        return _exit_code(e)
+    except EOFError:
+        print("Error: pass the paths to map; the map server cannot prompt for them",
+              file=sys.stderr)
+        return 2
+    except OSError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = saved
+        os.chdir(cwd)
+
+
+def _handle(conn, main):
+    """Answer one connection; returns False once the server should stop."""
+    line = conn.makefile("rb").readline()
+    if not line:
+        return True
+    request = json.loads(line)
+    if request.get("command") == "stop":
+        _send(conn, {"exit": 0})
+        return False
+    stdout = _SocketWriter(conn, "stdout")
+    stderr = _SocketWriter(conn, "stderr")
+    code = _run_request(request, stdout, stderr, main)
+    stdout.flush()
+    stderr.flush()
+    _send(conn, {"exit": code})
+    return True
+
+
+def _remove_stale_socket(socket_path):
+    """Remove a socket left behind by a server that is no longer running."""
+    import errno
+    import stat
+
+    try:
+        st = os.lstat(socket_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        raise OSError(errno.EEXIST, "not a map server socket of this user", socket_path)
+    sock = _connect(socket_path)
+    if sock is not None:
+        sock.close()
+        raise OSError(errno.EADDRINUSE, "a map server is already running", socket_path)
+    os.remove(socket_path)
+
+
+def serve(socket_path=None, ready=None):
+    """
+    Listen on socket_path and run the command lines clients send until a
+    client asks the server to stop. ready, if given, is a threading.Event
+    set once the server accepts connections.
+    """
+    import importlib
+
+    from dirmap import main
+
+    for name in PRELOAD:
+        importlib.import_module(name)
+    socket_path = socket_path or default_socket_path()
+    if not hasattr(socket, "AF_UNIX"):
+        raise OSError("the map server needs unix sockets")
+    _remove_stale_socket(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only the user who started the server may connect to it
+    umask = os.umask(0o177)
+    try:
+        server.bind(socket_path)
+    finally:
+        os.umask(umask)
+    try:
+        server.listen(16)
+        if ready is not None:
+            ready.set()
+        running = True
+        while running:
+            conn, _ = server.accept()
+            with conn:
+                try:
+                    running = _handle(conn, main)
+                except (OSError, ValueError):
+                    # The client went away or sent something that is not a request
+                    pass
+    finally:
+        server.close()
+        try:
+            os.remove(socket_path)
+        except OSError:
+            pass
+
+
+def main(argv=None):
+    """
+    map_server.py serve [SOCKET]   start a server (in the foreground)
+    map_server.py stop [SOCKET]    stop it
+    map_server.py ARGS...          run dirmap.py ARGS, on the server if one is running
+    """
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv and argv[0] in ("serve", "stop") and len(argv) <= 2:
+        socket_path = argv[1] if len(argv) == 2 else None
+        if argv[0] == "stop":
+            if not stop(socket_path):
+                print("No map server is running.", file=sys.stderr)
+                return 1
+            return 0
+        print(f"Map server listening on {socket_path or default_socket_path()}", file=sys.stderr)
+        try:
+            serve(socket_path)
+        except OSError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        except KeyboardInterrupt:
+            pass
+        return 0
+    return run(argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
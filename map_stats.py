@@ -0,0 +1,264 @@
+"""
+Optional instrumentation for a mapping run.
+
+Pass a MapStats object as ``stats=`` to map_directory, iter_directory_map or
+walker.walk_directory and it is filled in as the run goes: time per phase,
+directories and files visited and pruned, scandir/stat calls, how often each
+ignore pattern decided an entry, and peak memory. Nothing is measured when
+no stats object is given, so normal runs pay nothing for it.
+
+Ignore hits are attributed by re-checking each entry against the individual
+patterns (innermost file first, last pattern first) instead of the combined
+regexes, which makes a traced run slower than an untraced one.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from renderers import format_size
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Phases in report order; list, ignore and stat happen inside walk
+PHASES = [
+    ("walk", "walk"),
+    ("list", "  listing"),
+    ("ignore", "  ignore matching"),
+    ("stat", "  size/mtime stat"),
+    ("hash", "  content hashing"),
+    ("build", "build tree"),
+    ("render", "formatting"),
+    ("write", "file write"),
+]
+
+
+def peak_memory():
+    """Return the peak resident set size of this process in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MapStats:
+    """
+    Statistics collected during one mapping run.
+
+    phases maps phase names to seconds. Listing, ignore, stat and hash times
+    are summed over worker threads, so with workers > 1 they can exceed the
+    wall-clock walk time. counts maps counter names to integers, and
+    pattern_hits maps (ignore file, pattern) to the number of entries that
+    pattern decided; patterns that were loaded but never matched have 0.
+    """
+
+    def __init__(self):
+        self.root = None
+        self.phases = Counter()
+        self.counts = Counter()
+        self.pattern_hits = Counter()
+        self.stopped = None
+        self.total_seconds = None
+        self.peak_memory = None
+        self.tree_memory = None
+        self._started = time.perf_counter()
+        self._matchers = set()
+        self._lock = threading.Lock()
+
+    def add_time(self, phase, seconds):
+        with self._lock:
+            self.phases[phase] += seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counts[name] += n
+
+    def _inner_time(self, inner):
+        phases = self.phases
+        return sum(phases[name] for name in inner)
+
+    def timed(self, phase, iterable, inner=()):
+        """
+        Yield from iterable, adding the time spent producing each item to
+        phase. Time recorded meanwhile for the inner phases (iterators this
+        one pulls from) is left out, so phases do not overlap.
+        """
+        clock = time.perf_counter
+        iterator = iter(iterable)
+        try:
+            while True:
+                inner_before = self._inner_time(inner)
+                started = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    elapsed = clock() - started
+                    elapsed -= self._inner_time(inner) - inner_before
+                    self.add_time(phase, elapsed)
+                yield item
+        finally:
+            # Stopping early must still release the wrapped generator
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def measure(self, phase, func, *args, inner=()):
+        """Call func(*args), timing it under phase like timed() does."""
+        inner_before = self._inner_time(inner)
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.add_time(phase, elapsed - (self._inner_time(inner) - inner_before))
+
+    def timed_call(self, phase, func):
+        """Wrap func so each call is timed under phase and counted as '<phase>_calls'."""
+        clock = time.perf_counter
+
+        def wrapper(*args):
+            started = clock()
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self.phases[phase] += clock() - started
+                    self.counts[phase + "_calls"] += 1
+
+        return wrapper
+
+    def add_matcher(self, matcher):
+        """Register an ignore file's patterns so dead patterns show up with 0 hits."""
+        with self._lock:
+            if id(matcher) in self._matchers:
+                return
+            self._matchers.add(id(matcher))
+            for pattern in matcher.patterns:
+                self.pattern_hits[(matcher.origin, pattern.source)] += 0
+
+    def ignore_checker(self, stack):
+        """
+        Return (is_ignored, hits): a drop-in for stack.is_ignored that also
+        counts the deciding pattern of every entry in the local hits Counter.
+        Merge hits with add_pattern_hits once the directory is done.
+        """
+        hits = Counter()
+
+        def is_ignored(relative_path, is_dir=False):
+            matcher, pattern = stack.match_pattern(relative_path, is_dir)
+            if pattern is None:
+                return False
+            hits[(matcher.origin, pattern.source)] += 1
+            return not pattern.negated
+
+        return is_ignored, hits
+
+    def add_pattern_hits(self, hits):
+        with self._lock:
+            self.pattern_hits.update(hits)
+
+    def finish(self, tree=None):
+        """Record the total time and peak memory; call once the run is over."""
+        self.total_seconds = time.perf_counter() - self._started
+        self.peak_memory = peak_memory()
+        if tree is not None:
+            self.tree_memory = tree.memory_usage()
+        return self
+
+    def _origin_name(self, origin):
+        if origin is None:
+            return "<patterns>"
+        if self.root:
+            return os.path.relpath(origin, self.root).replace(os.sep, "/")
+        return origin
+
+    def as_dict(self):
+        """Return the statistics as plain JSON-serializable data."""
+        return {
+            "root": self.root,
+            "total_seconds": self.total_seconds,
+            "phases": dict(self.phases),
+            "counts": dict(self.counts),
+            "stopped": self.stopped,
+            "peak_memory": self.peak_memory,
+            "tree_memory": self.tree_memory,
+            "pattern_hits": [
+                {"file": self._origin_name(origin), "pattern": source, "hits": hits}
+                for (origin, source), hits in self.pattern_hits.most_common()
+            ],
+        }
+
+    def summary(self):
+        """One-line summary for status bars."""
+        parts = [
+            f"{self.counts['directories']:,} folders",
+            f"{self.counts['files']:,} files",
+            f"listing {self.phases['list']:.2f}s",
+            f"ignore {self.phases['ignore']:.2f}s",
+        ]
+        pruned = self.counts["ignored_directories"] + self.counts["ignored_files"]
+        if pruned:
+            parts.append(f"{pruned:,} ignored")
+        if self.peak_memory:
+            parts.append(f"peak {format_size(self.peak_memory)}")
+        return ", ".join(parts)
+
+    def report(self):
+        """Yield a human-readable multi-line report."""
+        counts = self.counts
+        yield "Phase timings:"
+        for phase, label in PHASES:
+            if phase in self.phases:
+                yield f"  {label:<20}{self.phases[phase]:>9.3f}s"
+        if self.total_seconds is not None:
+            yield f"  {'total':<20}{self.total_seconds:>9.3f}s"
+        yield f"Visited: {counts['directories']:,} directories, {counts['files']:,} files"
+        yield (
+            f"Pruned: {counts['ignored_directories']:,} ignored directories, "
+            f"{counts['ignored_files']:,} ignored files, "
+            f"{counts['depth_pruned_directories']:,} directories past max depth, "
+            f"{counts['collapsed_entries']:,} collapsed entries"
+        )
+        if self.stopped:
+            yield f"Stopped early: {self.stopped}"
+        if counts["errors"] or counts["symlink_loops"]:
+            yield (
+                f"Errors: {counts['errors']:,} directories could not be listed, "
+                f"{counts['symlink_loops']:,} symlink loops not followed"
+            )
+        if counts["streamed_directories"]:
+            yield f"Streamed: {counts['streamed_directories']:,} directories too large to list at once"
+        yield (
+            f"Syscalls: {counts['scandir_calls'] - counts['result_cache_hits']:,} scandir, "
+            f"{counts['stat_calls']:,} stat"
+            f" ({counts['snapshot_hits']:,} listings from snapshot)"
+        )
+        if counts["result_cache_hits"] or counts["result_cache_misses"]:
+            yield (
+                f"Result cache: {counts['result_cache_hits']:,} listings reused, "
+                f"{counts['result_cache_misses']:,} listed from disk"
+            )
+        if counts["hashed_files"] or counts["hash_cache_hits"] or counts["hash_errors"]:
+            yield (
+                f"Hashed: {counts['hashed_files']:,} files ({format_size(counts['hashed_bytes'])}), "
+                f"{counts['hash_cache_hits']:,} unchanged files from the hash cache, "
+                f"{counts['hash_errors']:,} files could not be read"
+            )
+        if self.peak_memory is not None:
+            line = f"Peak memory: {format_size(self.peak_memory)}"
+            if self.tree_memory is not None:
+                line += f" (tree model {format_size(self.tree_memory)})"
+            yield line
+        if self.pattern_hits:
+            yield "Ignore pattern hits:"
+            for (origin, source), hits in self.pattern_hits.most_common():
+                dead = "  (never matched)" if not hits else ""
+                yield f"  {hits:>10,}  {self._origin_name(origin)}: {source}{dead}"
@@ -0,0 +1,251 @@
+"""
+Output format renderers for directory maps.
+
+Every renderer takes an iterable of pre-order entries (walker WalkEntry or
+tree model TreeEntry records) and yields output lines without newlines, so
+any format can be streamed through dirmap.write_directory_map without
+materializing the whole structure.
+
+json and csv are only imported by the renderers that need them, which
+keeps the start-up of text maps short.
+"""
+
+import io
+from itertools import chain
+
+from walker import ERROR_PREFIX
+
+INDENT = " " * 4
+
+FILE_TYPE = "file"
+DIR_TYPE = "directory"
+# '... N more' placeholders left by walk limits
+MORE_TYPE = "more"
+# '... error: <reason>' placeholders for directories that could not be listed
+ERROR_TYPE = "error"
+
+
+SIZE_UNITS = ["B", "KB", "MB", "GB", "TB", "PB"]
+
+
+def _error_reason(entry):
+    """The reason of an error placeholder, or None for any other entry."""
+    if entry.omitted is not None and entry.name.startswith(ERROR_PREFIX):
+        return entry.name[len(ERROR_PREFIX):]
+    return None
+
+
+def _entry_type(entry):
+    if entry.omitted is not None:
+        return MORE_TYPE if _error_reason(entry) is None else ERROR_TYPE
+    return DIR_TYPE if entry.is_dir else FILE_TYPE
+
+
+def format_size(num_bytes):
+    """Format a byte count for people, e.g. 1536 -> '1.5 KB'."""
+    size = float(num_bytes)
+    for unit in SIZE_UNITS[:-1]:
+        if abs(size) < 1024:
+            break
+        size /= 1024
+    else:
+        unit = SIZE_UNITS[-1]
+    return f"{num_bytes} B" if unit == "B" else f"{size:.1f} {unit}"
+
+
+def format_totals(total_size, file_count):
+    """Return the ' (1.5 KB, 3 files)' suffix shown after a directory name."""
+    plural = "" if file_count == 1 else "s"
+    return f" ({format_size(total_size)}, {file_count:,} file{plural})"
+
+
+def _totals_suffix(entry):
+    total_size = getattr(entry, "total_size", None)
+    suffix = "" if total_size is None else format_totals(total_size, entry.file_count)
+    digest = getattr(entry, "digest", None)
+    if digest is not None:
+        suffix += f"  {digest}"
+    return suffix
+
+
+def render_text(entries):
+    """
+    Format entries as the classic '|_' indented map. Directories that carry
+    subtree totals (see DirectoryTree.iter_entries) show them after the name,
+    and entries with a content digest end with it.
+    """
+    for entry in entries:
+        yield f"{INDENT * entry.depth}|_{entry.name}{_totals_suffix(entry)}"
+
+
+def render_tree(entries):
+    """Format entries like the 'tree' command, with unicode box-drawing guides."""
+    # Guide strings for each open ancestor below the root
+    guides = []
+    for entry in entries:
+        if entry.depth == 0:
+            guides.clear()
+            yield entry.name + _totals_suffix(entry)
+            continue
+        del guides[entry.depth - 1:]
+        branch = "└── " if entry.is_last else "├── "
+        yield "".join(guides) + branch + entry.name + _totals_suffix(entry)
+        if entry.is_dir:
+            guides.append("    " if entry.is_last else "│   ")
+
+
+def render_json(entries):
+    """
+    Format entries as one nested JSON document. Each entry is written on its
+    own line as soon as it is seen; directories are closed when the walk
+    leaves them.
+    """
+    import json
+
+    opened = 0
+    need_comma = False
+    for entry in entries:
+        while opened > entry.depth:
+            yield "]}"
+            opened -= 1
+            need_comma = True
+        prefix = "," if need_comma else ""
+        name = json.dumps(entry.name)
+        mtime = json.dumps(entry.mtime)
+        digest = getattr(entry, "digest", None)
+        digest = "" if digest is None else f', "digest": "{digest}"'
+        if entry.is_dir:
+            totals = ""
+            if getattr(entry, "total_size", None) is not None:
+                totals = f', "total_size": {entry.total_size}, "file_count": {entry.file_count}'
+            yield (
+                f'{prefix}{{"name": {name}, "type": "{DIR_TYPE}", "mtime": {mtime}'
+                f'{totals}{digest}, "children": ['
+            )
+            opened += 1
+            need_comma = False
+        elif _error_reason(entry) is not None:
+            reason = json.dumps(_error_reason(entry))
+            yield f'{prefix}{{"name": {name}, "type": "{ERROR_TYPE}", "reason": {reason}}}'
+            need_comma = True
+        elif entry.omitted is not None:
+            yield f'{prefix}{{"name": {name}, "type": "{MORE_TYPE}", "omitted": {entry.omitted}}}'
+            need_comma = True
+        else:
+            yield (
+                f'{prefix}{{"name": {name}, "type": "{FILE_TYPE}", '
+                f'"size": {json.dumps(entry.size)}, "mtime": {mtime}{digest}}}'
+            )
+            need_comma = True
+    while opened:
+        yield "]}"
+        opened -= 1
+
+
+def _record(entry):
+    record = {
+        "path": entry.rel_path or ".",
+        "name": entry.name,
+        "depth": entry.depth,
+        "type": _entry_type(entry),
+        "size": entry.size,
+        "mtime": entry.mtime,
+    }
+    if getattr(entry, "total_size", None) is not None:
+        record["total_size"] = entry.total_size
+        record["file_count"] = entry.file_count
+    reason = _error_reason(entry)
+    if reason is not None:
+        record["reason"] = reason
+    elif entry.omitted is not None:
+        record["omitted"] = entry.omitted
+    digest = getattr(entry, "digest", None)
+    if digest is not None:
+        record["digest"] = digest
+    return record
+
+
+def render_ndjson(entries):
+    """
+    Format entries as one JSON object per line with path, depth, type, size
+    and mtime (plus total_size and file_count for directories with totals,
+    omitted for '... N more' placeholders, reason for '... error' ones, whose
+    type is 'error', and digest for hashed entries).
+    """
+    from json import dumps
+
+    for entry in entries:
+        yield dumps(_record(entry))
+
+
+CSV_FIELDS = ["path", "name", "depth", "type", "size", "mtime", "total_size", "file_count"]
+
+
+def _blank_if_none(value):
+    return "" if value is None else value
+
+
+def render_csv(entries):
+    """
+    Format entries as CSV rows with a header line; unknown values are empty.
+    A digest column is added when the first entry (the root) has a digest.
+    """
+    import csv
+
+    entries = iter(entries)
+    first = next(entries, None)
+    with_digests = getattr(first, "digest", None) is not None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="")
+    writer.writerow(CSV_FIELDS + ["digest"] if with_digests else CSV_FIELDS)
+    yield buffer.getvalue()
+    if first is None:
+        return
+    for entry in chain((first,), entries):
+        buffer.seek(0)
+        buffer.truncate()
+        row = [
+            entry.rel_path or ".",
+            entry.name,
+            entry.depth,
+            _entry_type(entry),
+            _blank_if_none(entry.size),
+            _blank_if_none(entry.mtime),
+            _blank_if_none(getattr(entry, "total_size", None)),
+            _blank_if_none(getattr(entry, "file_count", None)),
+        ]
+        if with_digests:
+            row.append(_blank_if_none(entry.digest))
+        writer.writerow(row)
+        yield buffer.getvalue()
+
+
+RENDERERS = {
+    "text": render_text,
+    "tree": render_tree,
+    "json": render_json,
+    "ndjson": render_ndjson,
+    "csv": render_csv,
+}
+
+# Formats that report file sizes and mtimes, so the walk should collect them
+SIZED_FORMATS = {"json", "ndjson", "csv"}
+
+# Default file extension for each format
+EXTENSIONS = {
+    "text": ".txt",
+    "tree": ".txt",
+    "json": ".json",
+    "ndjson": ".ndjson",
+    "csv": ".csv",
+}
+
+
+def get_renderer(format):
+    """Return the renderer function for a format name."""
+    try:
+        return RENDERERS[format]
+    except KeyError:
+        raise ValueError(
+            f"Unknown format '{format}' (choose from {', '.join(RENDERERS)})"
+        ) from None
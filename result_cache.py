@@ -0,0 +1,388 @@
+"""
+Cache of directory listings shared between runs, the GUI and the CLI.
+
+What is cached per root is the raw listing of every directory a map has
+listed: each child's name and type, before any ignore rule is applied. A walk served from the
+cache runs the normal walker over those listings, so .gitignore filtering
+(with the current ignore files), sort order, limits and the output format
+can change between runs without listing the directories again. Folders no
+earlier map has entered, e.g. ignored ones when the ignore rules are
+turned off, are listed once and then cached too.
+
+A cached listing is used only while its directory keeps the mtime it had
+when it was listed (adding, removing or renaming entries changes it), so
+a warm run costs one stat per directory instead of a listing of every
+directory. Sizes and mtimes are not cached: files rewritten in place keep
+their directory's mtime, so maps with sizes stat the files of cached
+listings again, as they would after listing them.
+
+Listings are kept in memory and, with a cache directory, in one sqlite
+file per root; both are bounded by size and drop the least recently used
+root first.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from contextlib import nullcontext
+
+from snapshot import RACY_WINDOW_NS
+
+CACHE_FORMAT_VERSION = 2
+CACHE_SUFFIX = ".dircache"
+DEFAULT_MEMORY_BYTES = 256 << 20
+DEFAULT_DISK_BYTES = 1 << 30
+# Rough memory cost of one cached child on top of its name
+ENTRY_BYTES = 120
+# How long a write waits for another process holding the cache file
+LOCK_TIMEOUT_SECONDS = 5
+
+_IS_DIR = 1
+_IS_SYMLINK = 2
+
+
+def default_cache_dir():
+    """Per-user cache directory shared by the GUI and the CLI."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "dirmap")
+
+
+def _digest(text):
+    import hashlib
+
+    return hashlib.sha256(text.encode("utf-8", "surrogateescape")).hexdigest()[:32]
+
+
+def _listing_bytes(children):
+    return sum(ENTRY_BYTES + len(child[0]) for child in children)
+
+
+class _CachedDirEntry:
+    """
+    Stand-in for os.DirEntry for children served from the cache; stat()
+    asks the disk, and remembers the answer like os.DirEntry does.
+    """
+
+    __slots__ = ("name", "path", "_flags", "_stats")
+
+    def __init__(self, name, path, flags):
+        self.name = name
+        self.path = path
+        self._flags = flags
+        # follow_symlinks -> stat result
+        self._stats = {}
+
+    def is_dir(self):
+        return bool(self._flags & _IS_DIR)
+
+    def is_symlink(self):
+        return bool(self._flags & _IS_SYMLINK)
+
+    def stat(self, follow_symlinks=True):
+        st = self._stats.get(follow_symlinks)
+        if st is None:
+            st = self._stats[follow_symlinks] = os.stat(self.path, follow_symlinks=follow_symlinks)
+        return st
+
+
+class _RootListings:
+    """Cached listings of one root: relative path -> (mtime_ns, children)."""
+
+    def __init__(self, key):
+        self.key = key
+        self.dirs = {}
+        self.bytes = 0
+        # Relative paths listed since the last write to disk, and folders
+        # gone since then whose listings (and those below) are to be deleted
+        self.dirty = set()
+        self.pruned = set()
+
+
+class CachedListing:
+    """
+    A function with the os.scandir interface for one walk of a root: fresh
+    cached listings are served without listing the directory, the others
+    are listed with scandir and recorded. hits and misses count both.
+    """
+
+    def __init__(self, cache, root, start_path, scandir=None):
+        self._cache = cache
+        self._root = root
+        self._start_path = start_path
+        self._prefix = os.path.join(start_path, "")
+        self._scandir = scandir or os.scandir
+        self._started_ns = time.time_ns()
+        self.hits = 0
+        self.misses = 0
+
+    def _rel_path(self, path):
+        if path == self._start_path:
+            return ""
+        if path.startswith(self._prefix):
+            return path[len(self._prefix):]
+        return None
+
+    def __call__(self, path):
+        st = os.stat(path)
+        rel_path = self._rel_path(path)
+        cached = None if rel_path is None else self._root.dirs.get(rel_path)
+        if cached is not None and cached[0] == st.st_mtime_ns:
+            self.hits += 1
+            return nullcontext([
+                _CachedDirEntry(name, os.path.join(path, name), flags) for name, flags in cached[1]
+            ])
+
+        self.misses += 1
+        with self._scandir(path) as it:
+            entries = list(it)
+        if rel_path is None:
+            return nullcontext(entries)
+        children = []
+        for entry in entries:
+            try:
+                flags = _IS_DIR if entry.is_dir() else 0
+                if entry.is_symlink():
+                    flags |= _IS_SYMLINK
+            except OSError:
+                flags = 0
+            children.append((entry.name, flags))
+        mtime_ns = st.st_mtime_ns
+        # Directories changed just before or during the walk may change again
+        # within the same mtime tick, so their listings are never reused
+        if mtime_ns >= self._started_ns - RACY_WINDOW_NS:
+            mtime_ns = -1
+        self._cache._record(self._root, rel_path, (mtime_ns, children))
+        return nullcontext(entries)
+
+
+class ResultCache:
+    """
+    LRU cache of raw directory listings, in memory and optionally on disk
+    in directory.
+
+    max_memory and max_disk bound the (approximate) bytes kept in each.
+    stats counts listing_hits and listing_misses over all committed walks,
+    disk_loads (roots read back from disk), evictions, invalidations and
+    skipped_writes (cache files locked by another process).
+    """
+
+    def __init__(self, directory=None, max_memory=DEFAULT_MEMORY_BYTES,
+                 max_disk=DEFAULT_DISK_BYTES):
+        self.directory = directory
+        self.max_memory = max_memory
+        self.max_disk = max_disk
+        self.stats = Counter()
+        # Root key -> _RootListings, least recently used first
+        self._roots = OrderedDict()
+        self._memory = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # Sent to worker processes without the listings held in memory
+        return {"directory": self.directory, "max_memory": self.max_memory,
+                "max_disk": self.max_disk}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @staticmethod
+    def _key(start_path):
+        return json.dumps([CACHE_FORMAT_VERSION, os.path.abspath(start_path)])
+
+    def _file(self, key):
+        return os.path.join(self.directory, _digest(key) + CACHE_SUFFIX)
+
+    def listing(self, start_path, scandir=None):
+        """
+        Return a CachedListing to pass as scandir= to walker.walk_directory
+        for start_path; call commit() with it once the walk is over.
+        """
+        key = self._key(start_path)
+        with self._lock:
+            root = self._roots.get(key)
+            if root is not None:
+                self._roots.move_to_end(key)
+        if root is None:
+            loaded = self._load(key)
+            with self._lock:
+                root = self._roots.get(key)
+                if root is None:
+                    root = self._roots[key] = loaded
+                    self._memory += root.bytes
+                    self._evict_memory(keep=key)
+        return CachedListing(self, root, start_path, scandir)
+
+    def _record(self, root, rel_path, listing):
+        with self._lock:
+            old = root.dirs.get(rel_path)
+            change = _listing_bytes(listing[1]) - (0 if old is None else _listing_bytes(old[1]))
+            if old is not None:
+                # Folders that are gone (or are no longer folders) leave
+                # listings of their own behind, which would never be read
+                kept = {name for name, flags in listing[1] if flags & _IS_DIR}
+                for name, flags in old[1]:
+                    if flags & _IS_DIR and name not in kept:
+                        change -= self._prune(root, os.path.join(rel_path, name))
+            root.dirs[rel_path] = listing
+            root.dirty.add(rel_path)
+            root.bytes += change
+            if self._roots.get(root.key) is root:
+                self._memory += change
+
+    @staticmethod
+    def _prune(root, rel_path):
+        """Drop the listings of rel_path and the folders below it; returns their bytes."""
+        prefix = os.path.join(rel_path, "")
+        freed = 0
+        for path in [path for path in root.dirs if path == rel_path or path.startswith(prefix)]:
+            freed += _listing_bytes(root.dirs.pop(path)[1])
+            root.dirty.discard(path)
+        root.pruned.add(rel_path)
+        return freed
+
+    def commit(self, listing):
+        """
+        Count a finished walk and write the listings it made to disk. A
+        write that finds the cache file locked by another process is
+        skipped and retried on the next commit of the same root.
+        """
+        root = listing._root
+        with self._lock:
+            self.stats["listing_hits"] += listing.hits
+            self.stats["listing_misses"] += listing.misses
+            self._evict_memory(keep=root.key)
+            dirty = [(rel_path, root.dirs[rel_path]) for rel_path in root.dirty]
+            pruned = list(root.pruned)
+            root.dirty.clear()
+            root.pruned.clear()
+        if self.directory is None or not (dirty or pruned):
+            return
+        if not self._store(root.key, dirty, pruned):
+            with self._lock:
+                self.stats["skipped_writes"] += 1
+                root.pruned.update(pruned)
+                root.dirty.update(rel_path for rel_path, _ in dirty if rel_path in root.dirs)
+
+    def invalidate(self, start_path=None):
+        """Drop the cached listings of start_path, or of every root."""
+        key = None if start_path is None else self._key(start_path)
+        with self._lock:
+            for root_key in list(self._roots):
+                if key is None or root_key == key:
+                    self._memory -= self._roots.pop(root_key).bytes
+            self.stats["invalidations"] += 1
+        if self.directory is None or not os.path.isdir(self.directory):
+            return
+        if key is not None:
+            self._remove_file(self._file(key))
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                self._remove_file(os.path.join(self.directory, name))
+
+    def _evict_memory(self, keep):
+        """Drop least recently used roots, never keep, until within max_memory."""
+        for root_key in list(self._roots):
+            if self._memory <= self.max_memory:
+                break
+            if root_key != keep:
+                self._memory -= self._roots.pop(root_key).bytes
+                self.stats["evictions"] += 1
+
+    # Disk
+
+    def _load(self, key):
+        root = _RootListings(key)
+        if self.directory is None:
+            return root
+        path = self._file(key)
+        if not os.path.isfile(path):
+            return root
+        import sqlite3
+
+        try:
+            db = sqlite3.connect(path)
+            try:
+                stored = db.execute("SELECT value FROM meta WHERE key = 'root'").fetchone()
+                rows = db.execute("SELECT * FROM dirs").fetchall() if stored else []
+            finally:
+                db.close()
+        except sqlite3.Error:
+            return root
+        if not stored or stored[0] != key:
+            return root
+        for rel_path, mtime_ns, children in rows:
+            children = [tuple(child) for child in json.loads(children)]
+            root.dirs[rel_path] = (mtime_ns, children)
+            root.bytes += _listing_bytes(children)
+        with self._lock:
+            self.stats["disk_loads"] += 1
+        # Mark it as recently used for eviction
+        os.utime(path)
+        return root
+
+    def _store(self, key, dirty, pruned=()):
+        """Write listings and delete pruned folders; False if the file is locked."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._file(key)
+        rows = [
+            (rel_path, mtime_ns, json.dumps(children))
+            for rel_path, (mtime_ns, children) in dirty
+        ]
+        import sqlite3
+
+        db = sqlite3.connect(path, timeout=LOCK_TIMEOUT_SECONDS)
+        try:
+            with db:
+                db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                db.execute(
+                    "CREATE TABLE IF NOT EXISTS dirs (rel_path TEXT PRIMARY KEY, "
+                    "mtime_ns INTEGER, children TEXT)"
+                )
+                db.execute("INSERT OR REPLACE INTO meta VALUES ('root', ?)", (key,))
+                db.executemany(
+                    "DELETE FROM dirs WHERE rel_path = ? OR substr(rel_path, 1, ?) = ?",
+                    [
+                        (rel_path, len(os.path.join(rel_path, "")), os.path.join(rel_path, ""))
+                        for rel_path in pruned
+                    ],
+                )
+                db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)", rows)
+        except sqlite3.OperationalError:
+            # Locked by another map writing the same root ('database is locked')
+            return False
+        finally:
+            db.close()
+        self._evict_files(keep=path)
+        return True
+
+    def _evict_files(self, keep):
+        """Delete least recently used cache files, never keep, until within max_disk."""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(CACHE_SUFFIX):
+                path = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_disk:
+                break
+            if path != keep:
+                self._remove_file(path)
+                with self._lock:
+                    self.stats["evictions"] += 1
+                total -= size
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -6,11 +6,13 @@ This script can run either the CLI or GUI version of the directory mapper.
 Usage:
     python run.py          # Run GUI version
     python run.py cli      # Run CLI version
+    python run.py cli PATH [PATH ...] [options]   # Map without prompts
+    python run.py serve    # Keep a map server running for fast cli runs
+    python run.py stop     # Stop the map server
     python run.py --help   # Show help
 """
 
 import sys
-import os
 
 def show_help():
     print("Directory Mapper - Generate text-based directory structure maps")
@@ -19,6 +21,10 @@ def show_help():
     print("    python run.py          # Run GUI version (default)")
     print("    python run.py gui      # Run GUI version")
     print("    python run.py cli      # Run CLI version")
+    print("    python run.py cli PATH [PATH ...] [options]")
+    print("                           # Map without prompts (see: run.py cli --help)")
+    print("    python run.py serve    # Keep a map server running; cli runs use it")
+    print("    python run.py stop     # Stop the map server")
     print("    python run.py --help   # Show this help")
     print()
     print("GUI Features:")
@@ -30,6 +36,8 @@ def show_help():
     print("CLI Features:")
     print("  - Command-line interface for batch processing")
     print("  - Saves output to directory_map.txt in current directory")
+    print("  - Map many paths at once in parallel, one output file each")
+    print("  - Skip start-up time with a background map server (run.py serve)")
 
 def run_gui():
     try:
@@ -40,9 +48,14 @@ def run_gui():
         print("Make sure tkinter is installed: sudo apt install python3-tk")
         sys.exit(1)
 
-def run_cli():
-    # Import and run the original CLI functionality
-    os.system(f"{sys.executable} dirmap.py")
+def run_cli(argv):
+    # Remaining arguments go to dirmap's parser, on the map server if one is running
+    from map_server import run
+    sys.exit(run(argv))
+
+def run_server(command):
+    from map_server import main as server_main
+    sys.exit(server_main([command]))
 
 def main():
     if len(sys.argv) > 1:
@@ -50,7 +63,9 @@ def main():
         if arg in ['--help', '-h', 'help']:
             show_help()
         elif arg == 'cli':
-            run_cli()
+            run_cli(sys.argv[2:])
+        elif arg in ['serve', 'stop']:
+            run_server(arg)
         elif arg == 'gui':
             run_gui()
         else:
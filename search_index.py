@@ -0,0 +1,330 @@
+"""
+Search index over a mapped DirectoryTree.
+
+Building the index takes one pass over the tree; afterwards queries such as
+"all *.log files over 100MB under any build/" only touch the entries that
+can match instead of rescanning the disk or the whole tree:
+
+- a trigram index over the (lowercased, interned) names narrows substring
+  and glob queries down to a few candidate names before they are checked;
+- names map to their nodes through a compact offsets/nodes array pair;
+- extension buckets answer ``ext:`` terms directly;
+- file nodes sorted by size answer ``size`` comparisons with a bisect.
+
+Queries are whitespace-separated terms that must all match:
+
+    report          name contains 'report' (case-insensitive)
+    *.log           name matches the glob (case-insensitive)
+    ext:log         extension is .log
+    size>100MB      file size comparison: >, >=, <, <=, =; units B, K/KB, M/MB,
+                    G/GB, T/TB (1024-based)
+    under:build     somewhere below a directory whose name matches (glob allowed)
+    type:f, type:d  files or directories only
+
+Matches are rendered with their ancestor chains via
+DirectoryTree.iter_selection. An index can be saved next to its tree in one
+sqlite file and loaded again without walking.
+"""
+
+import bisect
+import fnmatch
+import json
+import operator
+import os
+import re
+import shlex
+import sqlite3
+import sys
+from array import array
+
+from tree_model import FLAG_DIR, FLAG_MORE, NO_SIZE, DirectoryTree
+
+SIZE_FACTORS = {"": 1, "k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40}
+SIZE_OPERATORS = {
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "=": operator.eq,
+}
+
+_SIZE_TERM = re.compile(r"size(>=|<=|>|<|=)", re.IGNORECASE)
+_GLOB_CHARS = re.compile(r"[*?]|\[[^\]]*\]")
+
+
+def _trigrams(text):
+    return {text[i : i + 3] for i in range(len(text) - 2)}
+
+
+def _extension(name):
+    return os.path.splitext(name)[1][1:].lower()
+
+
+def parse_size(text):
+    """Parse '100MB', '1.5g' or '512' into bytes (1024-based units)."""
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([kmgt]?)i?b?", text.strip(), re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"invalid size: {text!r}")
+    return int(float(match.group(1)) * SIZE_FACTORS[match.group(2).lower()])
+
+
+class SearchIndex:
+    """
+    Query index over a DirectoryTree. The tree must not be extended after
+    the index is built.
+    """
+
+    def __init__(self, tree, _build=True):
+        self.tree = tree
+        self._lower = [name.lower() for name in tree.names]
+        self._trigrams = {}
+        self._extensions = {}
+        # Nodes grouped by name id: the nodes named names[i] are
+        # _name_nodes[_name_offsets[i]:_name_offsets[i + 1]]
+        self._name_offsets = array("I")
+        self._name_nodes = array("i")
+        # File nodes ordered by size, with the sizes alongside for bisect
+        self._size_nodes = array("i")
+        self._sizes = array("q")
+        if _build:
+            self._build()
+
+    def _build(self):
+        tree = self.tree
+        trigrams = {}
+        extensions = {}
+        for name_id, name in enumerate(self._lower):
+            for gram in _trigrams(name):
+                postings = trigrams.get(gram)
+                if postings is None:
+                    postings = trigrams[gram] = array("I")
+                postings.append(name_id)
+            extensions.setdefault(_extension(name), array("I")).append(name_id)
+        self._trigrams = trigrams
+        self._extensions = extensions
+
+        # Nodes ordered by name id (sorted() is stable, so map order is kept
+        # within a name), then the start of each name's run by bisection
+        name_ids = tree.name_ids
+        nodes = sorted(range(tree.size), key=name_ids.__getitem__)
+        sorted_ids = array("I", (name_ids[node] for node in nodes))
+        self._name_nodes = array("i", nodes)
+        self._name_offsets = array(
+            "I", (bisect.bisect_left(sorted_ids, i) for i in range(len(self._lower) + 1))
+        )
+
+        # Directories and placeholders have no size
+        sizes = tree.sizes
+        files = [node for node, size in enumerate(sizes) if size != NO_SIZE]
+        files.sort(key=sizes.__getitem__)
+        self._size_nodes = array("i", files)
+        self._sizes = array("q", (sizes[node] for node in files))
+
+    # Each query term becomes (count, nodes, accepts): count is how many
+    # nodes the term can match at most, nodes() returns them in map order
+    # and accepts(node) checks one node. A query iterates the term with the
+    # smallest count and checks the others node by node.
+
+    def _name_term(self, name_ids):
+        offsets, nodes = self._name_offsets, self._name_nodes
+        count = sum(offsets[i + 1] - offsets[i] for i in name_ids)
+        wanted = set(name_ids)
+        name_of = self.tree.name_ids
+
+        def term_nodes():
+            result = array("i")
+            for name_id in name_ids:
+                result.extend(nodes[offsets[name_id] : offsets[name_id + 1]])
+            return sorted(result)
+
+        return count, term_nodes, lambda node: name_of[node] in wanted
+
+    def _size_term(self, op, size):
+        sizes = self._sizes
+        low, high = 0, len(sizes)
+        if op in (">", "<="):
+            cut = bisect.bisect_right(sizes, size)
+        else:
+            cut = bisect.bisect_left(sizes, size)
+        if op in (">", ">="):
+            low = cut
+        elif op in ("<", "<="):
+            high = cut
+        else:
+            low, high = cut, bisect.bisect_right(sizes, size)
+        compare = SIZE_OPERATORS[op]
+        tree_sizes = self.tree.sizes
+
+        def term_nodes():
+            return sorted(self._size_nodes[low:high])
+
+        def accepts(node):
+            node_size = tree_sizes[node]
+            return node_size != NO_SIZE and compare(node_size, size)
+
+        return high - low, term_nodes, accepts
+
+    def _under_term(self, pattern):
+        """Nodes strictly below the directories whose name matches pattern."""
+        tree = self.tree
+        flags = tree.flags
+        if _GLOB_CHARS.search(pattern):
+            name_ids = self.match_names(pattern)
+        else:
+            name_ids = self._exact_names(pattern)
+        dirs = [node for node in self._name_term(name_ids)[1]() if flags[node] & FLAG_DIR]
+        ranges = []
+        for node in dirs:
+            if ranges and node < ranges[-1][1]:
+                continue  # nested inside a range already covered
+            ranges.append((node + 1, tree.subtree_end(node)))
+        starts = [start for start, _ in ranges]
+
+        def term_nodes():
+            return [node for start, end in ranges for node in range(start, end)]
+
+        def accepts(node):
+            i = bisect.bisect_right(starts, node) - 1
+            return i >= 0 and node < ranges[i][1]
+
+        return sum(end - start for start, end in ranges), term_nodes, accepts
+
+    def _type_term(self, want_dirs):
+        flags = self.tree.flags
+
+        def accepts(node):
+            return bool(flags[node] & FLAG_DIR) == want_dirs
+
+        def term_nodes():
+            return [node for node in range(self.tree.size) if accepts(node)]
+
+        return self.tree.size, term_nodes, accepts
+
+    def _names_with(self, literals):
+        """Name ids that may contain every literal, narrowed by trigrams."""
+        grams = set()
+        for literal in literals:
+            grams |= _trigrams(literal)
+        if not grams:
+            return range(len(self._lower))
+        postings = sorted((self._trigrams.get(gram, ()) for gram in grams), key=len)
+        candidates = set(postings[0])
+        for other in postings[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(other)
+        return sorted(candidates)
+
+    def match_names(self, pattern):
+        """Return the ids of the names matching a substring or glob pattern."""
+        pattern = pattern.lower()
+        lower = self._lower
+        if _GLOB_CHARS.search(pattern) is None:
+            return [i for i in self._names_with([pattern]) if pattern in lower[i]]
+        literals = [part for part in _GLOB_CHARS.split(pattern) if len(part) >= 3]
+        regex = re.compile(fnmatch.translate(pattern))
+        return [i for i in self._names_with(literals) if regex.match(lower[i])]
+
+    def _exact_names(self, name):
+        name = name.lower()
+        lower = self._lower
+        return [i for i in self._names_with([name]) if lower[i] == name]
+
+    def _parse(self, query):
+        try:
+            words = shlex.split(query)
+        except ValueError as e:
+            raise ValueError(f"invalid query: {e}") from None
+        terms = []
+        for word in words:
+            key, sep, value = word.partition(":")
+            key = key.lower() if sep else ""
+            size_match = _SIZE_TERM.match(word)
+            if size_match is not None:
+                op = size_match.group(1)
+                terms.append(self._size_term(op, parse_size(word[size_match.end() :])))
+            elif key == "ext":
+                terms.append(self._name_term(self._extensions.get(value.lower().lstrip("."), ())))
+            elif key == "under":
+                if not value.rstrip("/"):
+                    raise ValueError("under: needs a directory name")
+                terms.append(self._under_term(value.rstrip("/")))
+            elif key == "type":
+                if value.lower() not in ("f", "file", "d", "dir", "directory"):
+                    raise ValueError(f"unknown type: {value!r} (use f or d)")
+                terms.append(self._type_term(value.lower().startswith("d")))
+            elif key in ("name", ""):
+                terms.append(self._name_term(self.match_names(value if sep else word)))
+            else:
+                raise ValueError(f"unknown search term: {word!r}")
+        return terms
+
+    # Queries
+
+    def search(self, query):
+        """
+        Return the nodes matching every term of query, in map order; the
+        root and '... N more' placeholders never match. Raises ValueError
+        for malformed terms.
+        """
+        terms = self._parse(query)
+        if not terms:
+            terms = [(self.tree.size, lambda: range(self.tree.size), None)]
+        terms.sort(key=lambda term: term[0])
+        checks = [accepts for _, _, accepts in terms[1:]]
+        flags = self.tree.flags
+        return [
+            node
+            for node in terms[0][1]()
+            if node and not flags[node] & FLAG_MORE and all(check(node) for check in checks)
+        ]
+
+    def iter_matches(self, query, totals=False, digests=False):
+        """Yield TreeEntry records for the matches of query and their ancestors."""
+        return self.tree.iter_selection(self.search(query), totals=totals, digests=digests)
+
+    # Persistence
+
+    def save(self, path):
+        """Save the tree and the index together in one sqlite file."""
+        self.tree.save(path)
+        with sqlite3.connect(path) as db:
+            db.execute("CREATE TABLE postings (kind TEXT, key TEXT, data BLOB, PRIMARY KEY (kind, key))")
+            rows = [("trigram", gram, ids.tobytes()) for gram, ids in self._trigrams.items()]
+            rows += [("ext", ext, ids.tobytes()) for ext, ids in self._extensions.items()]
+            for field in ("_name_offsets", "_name_nodes", "_size_nodes", "_sizes"):
+                rows.append(("array", field, getattr(self, field).tobytes()))
+            db.executemany("INSERT INTO postings VALUES (?, ?, ?)", rows)
+        db.close()
+
+    @classmethod
+    def load(cls, path):
+        """
+        Load an index written by save(). A file written by
+        DirectoryTree.save has no index yet; it is built on load.
+        """
+        tree = DirectoryTree.load(path)
+        db = sqlite3.connect(path)
+        try:
+            has_index = db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'postings'"
+            ).fetchone()
+            if not has_index:
+                return cls(tree)
+            byteorder = db.execute("SELECT value FROM meta WHERE key = 'byteorder'").fetchone()[0]
+            rows = db.execute("SELECT kind, key, data FROM postings").fetchall()
+        finally:
+            db.close()
+        swap = json.loads(byteorder) != sys.byteorder
+        index = cls(tree, _build=False)
+        for kind, key, data in rows:
+            if kind == "array":
+                values = getattr(index, key)
+            else:
+                values = array("I")
+                (index._trigrams if kind == "trigram" else index._extensions)[key] = values
+            values.frombytes(data)
+            if swap:
+                values.byteswap()
+        return index
+
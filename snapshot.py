@@ -0,0 +1,173 @@
+"""
+Persistent directory listing snapshots for incremental re-mapping.
+
+A snapshot is a small sqlite database holding, for every directory visited
+by the last run, its mtime and inode plus its raw (unfiltered) child
+listing. On the next run a directory whose mtime and inode are unchanged is
+served from the snapshot with a single stat call instead of being listed
+again; only dirty directories are rescanned and written back.
+
+The whole snapshot is discarded when the mapping options or the root ignore
+files change, so a stale snapshot can never leak into a map made with
+different settings.
+"""
+
+import json
+import os
+import threading
+import time
+
+SNAPSHOT_VERSION = 2
+
+# Directories modified this close to the scan may change again within the
+# same mtime tick, so their listings are never reused (like git's racy index).
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+
+_FILE, _DIR, _LINK = "f", "d", "l"
+
+
+class CachedEntry:
+    """Stand-in for os.DirEntry for children served from a snapshot."""
+
+    __slots__ = ("name", "path", "_is_dir", "_is_symlink")
+
+    def __init__(self, name, path, is_dir, is_symlink=False):
+        self.name = name
+        self.path = path
+        self._is_dir = is_dir
+        self._is_symlink = is_symlink
+
+    def is_dir(self):
+        return self._is_dir
+
+    def is_symlink(self):
+        return self._is_symlink
+
+    def stat(self, follow_symlinks=True):
+        return os.stat(self.path, follow_symlinks=follow_symlinks)
+
+
+def snapshot_fingerprint(start_path, options):
+    """Hash the options and root ignore files a snapshot depends on."""
+    import hashlib
+
+    digest = hashlib.sha256()
+    digest.update(json.dumps([SNAPSHOT_VERSION, options], sort_keys=True).encode())
+    for rel in (".gitignore", os.path.join(".git", "info", "exclude")):
+        try:
+            with open(os.path.join(start_path, rel), "rb") as f:
+                digest.update(f.read())
+        except OSError:
+            digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _encode_listing(files, dirs):
+    names = [_FILE + e.name for e in files]
+    names.extend((_LINK if e.is_symlink() else _DIR) + e.name for e in dirs)
+    return "\0".join(names).encode("utf-8", "surrogateescape")
+
+
+def _decode_listing(path, blob):
+    files, dirs = [], []
+    if not blob:
+        return files, dirs
+    prefix = os.path.join(path, "")
+    for item in blob.decode("utf-8", "surrogateescape").split("\0"):
+        name = item[1:]
+        if item[0] != _FILE:
+            dirs.append(CachedEntry(name, prefix + name, True, item[0] == _LINK))
+        else:
+            files.append(CachedEntry(name, prefix + name, False))
+    return files, dirs
+
+
+class Snapshot:
+    """
+    Directory listing snapshot used and updated during one walk.
+
+    Previous listings are loaded up front; rescanned directories and
+    directories that disappeared are only written back by ``commit``, which
+    should be called once the walk has completed.
+    """
+
+    def __init__(self, snapshot_file, fingerprint):
+        self.snapshot_file = snapshot_file
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._started_ns = time.time_ns()
+        self._updates = []
+        import sqlite3
+
+        self._db = sqlite3.connect(snapshot_file, check_same_thread=False)
+        self._rows = self._load()
+
+    def _load(self):
+        db = self._db
+        db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS dirs (rel_path TEXT PRIMARY KEY, "
+            "mtime_ns INTEGER, ino INTEGER, listing BLOB)"
+        )
+        row = db.execute("SELECT value FROM meta WHERE key = 'fingerprint'").fetchone()
+        if row is None or row[0] != self.fingerprint:
+            db.execute("DELETE FROM dirs")
+            db.execute(
+                "INSERT OR REPLACE INTO meta VALUES ('fingerprint', ?)", (self.fingerprint,)
+            )
+            db.commit()
+            return {}
+        return {
+            rel_path: (mtime_ns, ino, listing)
+            for rel_path, mtime_ns, ino, listing in db.execute("SELECT * FROM dirs")
+        }
+
+    def scan(self, path, rel_path, scan):
+        """
+        Return (files, dirs) for a directory, from the snapshot when its
+        mtime and inode are unchanged, otherwise by calling scan(path).
+        """
+        with self._lock:
+            # Whatever is left in _rows after the walk no longer exists
+            row = self._rows.pop(rel_path, None)
+        try:
+            st = os.stat(path)
+        except OSError:
+            return scan(path)
+
+        if row is not None and row[0] == st.st_mtime_ns and row[1] == st.st_ino:
+            self.hits += 1
+            return _decode_listing(path, row[2])
+
+        files, dirs = scan(path)
+        mtime_ns = st.st_mtime_ns
+        if mtime_ns >= self._started_ns - RACY_WINDOW_NS:
+            mtime_ns = -1
+        with self._lock:
+            self.misses += 1
+            self._updates.append((rel_path, mtime_ns, st.st_ino, _encode_listing(files, dirs)))
+        return files, dirs
+
+    def commit(self):
+        """Write rescanned listings and drop directories that are gone."""
+        with self._lock:
+            db = self._db
+            db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?)", self._updates)
+            db.executemany("DELETE FROM dirs WHERE rel_path = ?", ((k,) for k in self._rows))
+            db.commit()
+            self._updates.clear()
+            self._rows.clear()
+
+    def close(self):
+        """Close the snapshot; changes not committed are discarded."""
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,1440 @@
+#!/usr/bin/env python3
+"""
+Test script for the core Directory Mapper functionality.
+"""
+
+import os
+import sys
+import tempfile
+import shutil
+
+
+def _make_tree(spec):
+    """Create a temporary tree from a {relative_path: content or None} dict."""
+    test_dir = tempfile.mkdtemp()
+    for rel_path, content in spec.items():
+        path = os.path.join(test_dir, *rel_path.split("/"))
+        if content is None:
+            os.makedirs(path, exist_ok=True)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+    return test_dir
+
+
+def test_gitignore_matcher():
+    """Test the compiled matcher against gitignore semantics."""
+    try:
+        from ignore_matcher import GitignoreMatcher
+
+        matcher = GitignoreMatcher([
+            "*.log",
+            "!keep.log",
+            "build/",
+            "/root_only.txt",
+            "docs/**/draft",
+            "**/cache",
+            "data/*.csv",
+            "# comment",
+        ])
+
+        assert matcher.is_ignored("app.log"), "*.log should match at top level"
+        assert matcher.is_ignored("a/b/app.log"), "*.log should match at any depth"
+        assert not matcher.is_ignored("a/keep.log"), "negation should re-include"
+        assert matcher.match("keep.log") is False, "negated match should be False"
+        assert matcher.is_ignored("src/build", is_dir=True), "dir pattern should match dirs"
+        assert not matcher.is_ignored("src/build"), "dir pattern should not match files"
+        assert matcher.is_ignored("root_only.txt"), "anchored pattern should match at root"
+        assert not matcher.is_ignored("sub/root_only.txt"), "anchored pattern is rooted"
+        assert matcher.is_ignored("docs/draft"), "'**' should match zero directories"
+        assert matcher.is_ignored("docs/a/b/draft"), "'**' should match many directories"
+        assert matcher.is_ignored("x/y/cache"), "leading '**/' should match anywhere"
+        assert matcher.is_ignored("data/a.csv"), "path pattern should match"
+        assert not matcher.is_ignored("data/sub/a.csv"), "'*' should not cross '/'"
+        assert matcher.match("README.md") is None, "unmatched path should be None"
+        assert len(matcher) == 7, "comments should be skipped"
+
+        print("✓ Compiled gitignore matcher works")
+        return True
+
+    except Exception as e:
+        print(f"✗ Gitignore matcher test failed: {e}")
+        return False
+
+
+def test_map_directory_gitignore():
+    """Test that map_directory prunes ignored files and directories."""
+    test_dir = None
+    try:
+        from dirmap import map_directory
+
+        test_dir = _make_tree({
+            ".gitignore": "*.log\n__pycache__/\n",
+            "main.py": "",
+            "debug.log": "",
+            "pkg/mod.py": "",
+            "pkg/__pycache__/mod.pyc": "",
+        })
+        output_file = os.path.join(test_dir, "map.txt")
+
+        result = map_directory(test_dir, exclude_ignore=True, output_file=output_file)
+        assert "main.py" in result, "Should keep regular files"
+        assert "debug.log" not in result, "Should drop ignored files"
+        assert "__pycache__" not in result, "Should prune ignored directories"
+        assert "mod.pyc" not in result, "Should not descend into ignored directories"
+
+        result = map_directory(test_dir, exclude_ignore=False, output_file=output_file)
+        assert "debug.log" in result, "Should keep everything without gitignore"
+
+        print("✓ map_directory honours .gitignore patterns")
+        return True
+
+    except Exception as e:
+        print(f"✗ map_directory gitignore test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_nested_gitignore():
+    """Test that nested .gitignore files and .git/info/exclude are honoured."""
+    test_dir = None
+    try:
+        from dirmap import map_directory
+
+        test_dir = _make_tree({
+            ".gitignore": "*.tmp\n",
+            ".git/info/exclude": "secret.txt\n",
+            "keep.txt": "",
+            "secret.txt": "",
+            "a.tmp": "",
+            "vendor/.gitignore": "*\n!.gitignore\n!wanted.tmp\n",
+            "vendor/lib.js": "",
+            "vendor/wanted.tmp": "",
+            "vendor/sub/deep.js": "",
+            "other/lib.js": "",
+        })
+        output_file = os.path.join(test_dir, "map.txt")
+
+        result = map_directory(test_dir, exclude_ignore=True, output_file=output_file)
+        assert "keep.txt" in result, "Should keep regular files"
+        assert "secret.txt" not in result, "Should honour .git/info/exclude"
+        assert "a.tmp" not in result, "Should honour the root .gitignore"
+        names = [line.strip()[2:] for line in result.splitlines()]
+        assert ".git" not in names, "Should leave out the .git directory with ignore rules on"
+        unfiltered = map_directory(test_dir, exclude_ignore=False, output_file=output_file)
+        assert ".git" in [line.strip()[2:] for line in unfiltered.splitlines()], \
+            "Should list the .git directory with ignore rules off"
+        assert "other" in result and result.count("lib.js") == 1, \
+            "Nested rules should only apply below their directory"
+        assert "wanted.tmp" in result, "Deeper negation should override the root rule"
+        assert "deep.js" not in result, "Nested rules should prune subtrees"
+
+        print("✓ Nested .gitignore files are honoured")
+        return True
+
+    except Exception as e:
+        print(f"✗ Nested gitignore test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_walk_directory():
+    """Test the scandir walker's order, depth and relative paths."""
+    test_dir = None
+    try:
+        from walker import walk_directory
+
+        test_dir = _make_tree({
+            "top.txt": "",
+            "a/a1.txt": "",
+            "a/b/b1.txt": "",
+            "c": None,
+        })
+
+        entries = list(walk_directory(test_dir, exclude_ignore=False))
+        assert entries[0].depth == 0 and entries[0].rel_path == "", "Root comes first"
+        assert entries[1].rel_path == "top.txt", "Files come before subdirectories"
+        by_path = {e.rel_path: e for e in entries}
+        assert by_path["a/b/b1.txt"].depth == 3, "Depth should follow the tree"
+        assert by_path["a/b"].is_dir and not by_path["a/a1.txt"].is_dir, \
+            "Entry types should come from scandir"
+        order = [e.rel_path for e in entries]
+        assert order.index("a/a1.txt") < order.index("a/b"), \
+            "A directory's files should precede its subdirectories"
+        assert order.index("a/b/b1.txt") == order.index("a/b") + 1, \
+            "Subdirectories should be walked depth-first"
+        assert len(entries) == 7, "Every entry should be yielded once"
+
+        print("✓ scandir walker yields entries in tree order")
+        return True
+
+    except Exception as e:
+        print(f"✗ Walker test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_parallel_walk():
+    """Test that parallel traversal matches the serial walk exactly."""
+    test_dir = None
+    try:
+        from walker import walk_directory
+
+        spec = {".gitignore": "skip/\n*.o\n"}
+        for i in range(5):
+            spec[f"d{i}/f.txt"] = ""
+            spec[f"d{i}/x.o"] = ""
+            spec[f"d{i}/skip/hidden.txt"] = ""
+            spec[f"d{i}/e/g.txt"] = ""
+        test_dir = _make_tree(spec)
+
+        serial = list(walk_directory(test_dir))
+        parallel = list(walk_directory(test_dir, workers=4))
+        assert serial == parallel, "Parallel walk should keep the serial order"
+        assert not any(e.name in ("skip", "x.o") for e in parallel), \
+            "Parallel walk should prune ignored entries"
+
+        import walker
+        for i in range(100):
+            os.makedirs(os.path.join(test_dir, "wide", f"w{i:03d}", "sub"))
+        listed = []
+
+        def counting_scandir(path):
+            listed.append(path)
+            return os.scandir(path)
+
+        workers = 2
+        entries = list(walk_directory(
+            os.path.join(test_dir, "wide"), workers=workers, scandir=counting_scandir,
+            limits=walker.WalkLimits(max_entries=5),
+        ))
+        assert len(entries) == 6, "The entry budget should stop the walk"
+        # The window, plus the listings the consumer took (each frees a slot)
+        assert len(listed) <= workers * walker.READ_AHEAD_PER_WORKER + len(entries), \
+            f"Read-ahead should be bounded, but {len(listed)} folders were listed"
+        wide = os.path.join(test_dir, "wide")
+        assert list(walk_directory(wide, workers=workers)) == list(walk_directory(wide)), \
+            "Folders waiting for room in the read-ahead window should keep their place"
+
+        print("✓ Parallel walk matches serial walk")
+        return True
+
+    except Exception as e:
+        print(f"✗ Parallel walk test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_streaming_map():
+    """Test the streaming generator and writer against map_directory."""
+    test_dir = None
+    try:
+        import io
+        from dirmap import iter_directory_map, map_directory, write_directory_map
+
+        test_dir = _make_tree({"tree/a.txt": "", "tree/sub/b.txt": ""})
+        output_file = os.path.join(test_dir, "map.txt")
+        test_tree = os.path.join(test_dir, "tree")
+
+        lines = iter_directory_map(test_tree, exclude_ignore=False)
+        assert not isinstance(lines, list), "iter_directory_map should be lazy"
+        buffer = io.StringIO()
+        count = write_directory_map(lines, buffer)
+        assert count == 4, "Writer should report the number of lines"
+
+        result = map_directory(test_tree, exclude_ignore=False, output_file=output_file)
+        assert buffer.getvalue() == result, "Streamed output should match map_directory"
+        with open(output_file) as f:
+            assert f.read() == result, "Written file should match the returned map"
+
+        print("✓ Streaming map output works")
+        return True
+
+    except Exception as e:
+        print(f"✗ Streaming map test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_snapshot_reuse():
+    """Test that unchanged directories are served from the snapshot."""
+    test_dir = None
+    try:
+        from snapshot import Snapshot, snapshot_fingerprint
+        from walker import walk_directory
+
+        test_dir = _make_tree({"tree/a.txt": "", "tree/sub/b.txt": "", "tree/other/c.txt": ""})
+        tree = os.path.join(test_dir, "tree")
+        snapshot_file = os.path.join(test_dir, "snap.db")
+        # Back-date directories so they fall outside the racy window
+        for path in (tree, os.path.join(tree, "sub"), os.path.join(tree, "other")):
+            os.utime(path, (1_000_000_000, 1_000_000_000))
+
+        def run(options=None):
+            fingerprint = snapshot_fingerprint(tree, options or {})
+            with Snapshot(snapshot_file, fingerprint) as snap:
+                names = [e.rel_path for e in walk_directory(tree, snapshot=snap)]
+                snap.commit()
+            return snap, names
+
+        first, names1 = run()
+        assert first.hits == 0 and first.misses == 3, "First run should scan everything"
+        second, names2 = run()
+        assert second.hits == 3 and second.misses == 0, "Unchanged run should hit"
+        assert names1 == names2, "Cached listings should give the same map"
+
+        with open(os.path.join(tree, "sub", "new.txt"), "w"):
+            pass
+        third, names3 = run()
+        assert third.misses == 1 and "sub/new.txt" in names3, "Dirty directory should be rescanned"
+
+        fourth, _ = run({"changed": True})
+        assert fourth.hits == 0, "Changed options should invalidate the snapshot"
+
+        print("✓ Snapshot reuses unchanged directory listings")
+        return True
+
+    except Exception as e:
+        print(f"✗ Snapshot test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_directory_tree():
+    """Test that the in-memory tree renders the same map as the walk."""
+    test_dir = None
+    try:
+        from dirmap import iter_directory_map, map_directory_tree, render_text
+
+        test_dir = _make_tree({
+            "a.txt": "",
+            "sub/b.txt": "",
+            "sub/deeper/c.txt": "",
+            "empty": None,
+        })
+
+        tree = map_directory_tree(test_dir, exclude_ignore=False)
+        assert tree.size == 7, "Tree should hold every entry"
+        names = [tree.name(n) for n in tree.children(tree.root)]
+        assert names[0] == "a.txt", "Files should come before directories"
+        sub = next(n for n in tree.children(tree.root) if tree.name(n) == "sub")
+        assert tree.is_dir(sub) and tree.child_count(sub) == 2, "Children should nest"
+        assert list(render_text(tree.iter_entries())) == \
+            list(iter_directory_map(test_dir, exclude_ignore=False)), \
+            "Rendering the tree should match the streamed map"
+        sub_lines = list(render_text(tree.iter_entries(sub)))
+        assert sub_lines[0] == "|_sub" and len(sub_lines) == 4, \
+            "A subtree should render on its own without re-walking"
+        deeper = tree.children(sub)[1]
+        assert tree.path(deeper) == "sub/deeper", "Paths should be rebuilt from parents"
+        assert tree.parent(deeper) == sub, "Parents should be tracked"
+        assert tree.memory_usage() > 0, "Memory usage should be reported"
+
+        print("✓ In-memory directory tree works")
+        return True
+
+    except Exception as e:
+        print(f"✗ Directory tree test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_output_formats():
+    """Test the JSON, NDJSON, CSV and unicode tree renderers."""
+    test_dir = None
+    try:
+        import csv
+        import json
+        from dirmap import iter_directory_map, map_directory_tree
+        from renderers import get_renderer
+
+        test_dir = _make_tree({
+            "tree/ odd |_name.txt": "abc",
+            "tree/sub/b.txt": "",
+            "tree/sub/c.txt": "",
+        })
+        tree_path = os.path.join(test_dir, "tree")
+
+        document = json.loads("\n".join(iter_directory_map(tree_path, format="json")))
+        assert document["type"] == "directory", "JSON root should be a directory"
+        children = {c["name"]: c for c in document["children"]}
+        assert children[" odd |_name.txt"]["size"] == 3, "JSON should keep names and sizes"
+        assert len(children["sub"]["children"]) == 2, "JSON should nest children"
+
+        records = [json.loads(line) for line in iter_directory_map(tree_path, format="ndjson")]
+        by_path = {r["path"]: r for r in records}
+        assert by_path["sub/b.txt"]["depth"] == 2, "NDJSON should carry depth"
+        assert by_path["sub"]["type"] == "directory", "NDJSON should carry type"
+
+        rows = list(csv.DictReader(iter_directory_map(tree_path, format="csv")))
+        assert len(rows) == len(records), "CSV should have one row per entry"
+        assert any(r["name"] == " odd |_name.txt" for r in rows), "CSV should quote names"
+
+        lines = list(iter_directory_map(tree_path, format="tree"))
+        assert lines[0] == "tree", "Tree view should start with the root"
+        assert lines[-1].startswith("    └── "), "Last nested entry should close the branch"
+
+        built = map_directory_tree(tree_path, collect_sizes=True)
+        assert list(get_renderer("ndjson")(built.iter_entries())) == \
+            list(iter_directory_map(tree_path, format="ndjson")), \
+            "Renderers should work the same over the tree model"
+
+        print("✓ Output format renderers work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Output format test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_batch_cli():
+    """Test the non-interactive CLI, including batch mapping of several roots."""
+    test_dir = None
+    try:
+        import json
+        from contextlib import redirect_stdout
+        import io
+        import subprocess
+        from dirmap import main
+
+        test_dir = _make_tree({
+            "one/.gitignore": "*.log\n",
+            "one/a.txt": "",
+            "one/a.log": "",
+            "two/b.txt": "",
+            "nested/one/c.txt": "",
+        })
+        roots = [os.path.join(test_dir, name) for name in ("one", "two", "nested/one")]
+        out_dir = os.path.join(test_dir, "out")
+
+        with redirect_stdout(io.StringIO()):
+            code = main(roots + ["--output-dir", out_dir, "-j", "2"])
+        assert code == 0, "Batch run should succeed"
+        assert sorted(os.listdir(out_dir)) == \
+            ["dirmap_summary.json", "one-2.txt", "one.txt", "two.txt"], \
+            "Each root should get its own output file"
+        with open(os.path.join(out_dir, "dirmap_summary.json")) as f:
+            summaries = json.load(f)
+        assert [s["root"] for s in summaries] == roots, "Summary should keep input order"
+        with open(os.path.join(out_dir, "one.txt")) as f:
+            assert "a.log" not in f.read(), "Batch mode should honour .gitignore"
+
+        single = os.path.join(test_dir, "single.txt")
+        with redirect_stdout(io.StringIO()):
+            code = main([roots[0], "--no-gitignore", "-o", single])
+        with open(single) as f:
+            assert code == 0 and "a.log" in f.read(), "--no-gitignore should include everything"
+
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dirmap.py")
+        result = subprocess.run(
+            [sys.executable, script],
+            stdin=subprocess.DEVNULL, capture_output=True, text=True, cwd=test_dir,
+        )
+        assert result.returncode == 2 and "path is required" in result.stderr, \
+            "Without a terminal, a missing path should be an error rather than a prompt"
+
+        print("✓ Non-interactive and batch CLI work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Batch CLI test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_subtree_totals():
+    """Test size and mtime collection, directory rollups and the largest-subtrees report."""
+    test_dir = None
+    try:
+        from dirmap import iter_directory_map, largest_subtrees_report, map_directory_tree
+
+        test_dir = _make_tree({
+            "tree/a.txt": "x" * 10,
+            "tree/big/b.bin": "x" * 1000,
+            "tree/big/inner/c.bin": "x" * 500,
+            "tree/small/d.txt": "x" * 5,
+            "tree/empty": None,
+        })
+        tree_path = os.path.join(test_dir, "tree")
+
+        tree = map_directory_tree(tree_path, collect_sizes=True)
+        by_path = {tree.path(n): n for n in range(tree.size)}
+        assert tree.total_size(tree.root) == 1515, "Root should total every file"
+        assert tree.file_count(tree.root) == 4, "Root should count every file"
+        assert tree.total_size(by_path["big"]) == 1500, "Totals should include nested dirs"
+        assert tree.file_count(by_path["big"]) == 2, "Counts should include nested dirs"
+        assert tree.total_size(by_path["empty"]) == 0, "Empty dirs should total zero"
+        assert tree.mtime_of(by_path["a.txt"]) is not None, "Mtimes should be collected"
+
+        largest = tree.largest_subtrees(2)
+        assert [tree.path(n) for _, n in largest] == ["big", "big/inner"], \
+            "Largest subtrees should be ordered by size"
+        report = list(largest_subtrees_report(tree, 2))
+        assert len(report) == 3 and report[1].endswith("big"), "Report should list the top N"
+
+        lines = list(iter_directory_map(tree_path, totals=True))
+        assert lines[0] == "|_tree (1.5 KB, 4 files)", "Root line should show its totals"
+        assert "    |_big (1.5 KB, 2 files)" in lines, "Directories should show totals"
+        assert "    |_a.txt" in lines, "Files should not show totals"
+
+        tree.extend([])
+        assert tree.total_size(tree.root) == 1515, "Rollups should be reused until the tree grows"
+
+        print("✓ Size rollups and largest subtrees work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Subtree totals test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_walk_limits():
+    """Test depth, per-directory, total-entry and time budgets."""
+    test_dir = None
+    try:
+        from dirmap import WalkLimits, iter_directory_map, map_directory_tree
+        from walker import walk_directory
+
+        test_dir = _make_tree({
+            "tree/a.txt": "",
+            "tree/b.txt": "",
+            "tree/c.txt": "",
+            "tree/sub/deeper/d.txt": "",
+        })
+        tree_path = os.path.join(test_dir, "tree")
+
+        listed = []
+
+        def recording_scandir(path):
+            listed.append(os.path.relpath(path, tree_path))
+            return os.scandir(path)
+
+        for workers in (None, 4):
+            listed.clear()
+            entries = list(walk_directory(
+                tree_path, scandir=recording_scandir, workers=workers,
+                limits=WalkLimits(max_depth=1),
+            ))
+            assert [e.name for e in entries if e.depth == 1][-1] == "sub", \
+                "Directories at the depth limit should still be shown"
+            assert listed == ["."], \
+                "Directories past the depth limit should never be listed"
+
+        lines = list(iter_directory_map(tree_path, limits=WalkLimits(max_entries_per_dir=2)))
+        assert len(lines) == 4 and lines[-1] == "    |_... 2 more", \
+            "Extra entries should be collapsed into '... N more'"
+
+        lines = list(iter_directory_map(tree_path, limits=WalkLimits(max_entries=3)))
+        assert len(lines) == 4 and "stopped" in lines[-1], \
+            "The total budget should stop the walk with a marker"
+
+        lines = list(iter_directory_map(tree_path, limits=WalkLimits(time_limit=0)))
+        assert len(lines) == 2 and "time limit" in lines[-1], \
+            "An expired time budget should stop before listing"
+
+        tree = map_directory_tree(
+            tree_path, collect_sizes=True, limits=WalkLimits(max_entries_per_dir=2)
+        )
+        more = tree.children(tree.root)[-1]
+        assert tree.omitted(more) == 2, "The tree should keep placeholder counts"
+        assert tree.file_count(tree.root) == 2, "Placeholders should not count as files"
+
+        print("✓ Walk limits prune the walk")
+        return True
+
+    except Exception as e:
+        print(f"✗ Walk limits test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_map_stats():
+    """Test the optional statistics collected during a mapping run."""
+    test_dir = None
+    try:
+        from dirmap import map_directory
+        from map_stats import MapStats
+
+        test_dir = _make_tree({
+            "tree/.gitignore": "*.log\nbuild/\nnever_matches\n!keep.log\n",
+            "tree/a.txt": "",
+            "tree/a.log": "",
+            "tree/keep.log": "",
+            "tree/build/out.o": "",
+            "tree/sub/b.log": "",
+        })
+        tree_path = os.path.join(test_dir, "tree")
+        output_file = os.path.join(test_dir, "map.txt")
+
+        for workers in (None, 4):
+            stats = MapStats()
+            map_directory(tree_path, output_file=output_file, workers=workers, stats=stats)
+            counts = stats.counts
+            assert counts["directories"] == 2 and counts["files"] == 3, \
+                "Visited directories and files should be counted"
+            assert counts["ignored_directories"] == 1 and counts["ignored_files"] == 2, \
+                "Pruned entries should be counted"
+            assert counts["scandir_calls"] == 2, "Listings should be counted as syscalls"
+            hits = {source: n for (_, source), n in stats.pattern_hits.items()}
+            assert hits == {"*.log": 2, "build/": 1, "never_matches": 0, "!keep.log": 1}, \
+                "Each pattern's hits should be counted, including dead patterns"
+            for phase in ("walk", "list", "ignore", "build", "render", "write"):
+                assert phase in stats.phases, f"Phase '{phase}' should be timed"
+            assert stats.total_seconds is not None, "The run should be finished"
+            assert any("never matched" in line for line in stats.report()), \
+                "The report should flag dead patterns"
+            assert stats.as_dict()["pattern_hits"][0]["file"] == ".gitignore", \
+                "Ignore files should be reported relative to the root"
+
+        print("✓ Mapping statistics are collected")
+        return True
+
+    except Exception as e:
+        print(f"✗ Map stats test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_search_index():
+    """Test index queries, filtered rendering and saving the index to disk."""
+    test_dir = None
+    try:
+        from dirmap import map_directory_tree, search_directory_map
+        from search_index import SearchIndex
+
+        test_dir = _make_tree({
+            "tree/a/build/big.log": "x" * 3000,
+            "tree/a/build/small.log": "x",
+            "tree/a/Report.txt": "",
+            "tree/b/build/other.LOG": "x" * 5000,
+            "tree/b/notes.md": "",
+        })
+        tree = map_directory_tree(os.path.join(test_dir, "tree"), collect_sizes=True)
+        index = SearchIndex(tree)
+
+        def paths(query):
+            return sorted(tree.path(node) for node in index.search(query))
+
+        assert paths("*.log size>2K under:build") == ["a/build/big.log", "b/build/other.LOG"], \
+            "Glob, size and under terms should all apply"
+        assert paths("ext:log") == ["a/build/big.log", "a/build/small.log", "b/build/other.LOG"], \
+            "Extensions should match case-insensitively"
+        assert paths("report") == ["a/Report.txt"], "Substrings should match names"
+        assert paths("build type:d") == ["a/build", "b/build"], "type:d should keep folders"
+        assert paths("type:d") == ["a", "a/build", "b", "b/build"], "type:d alone should list folders"
+        assert paths("type:f") == ["a/Report.txt", "a/build/big.log", "a/build/small.log",
+                                   "b/build/other.LOG", "b/notes.md"], "type:f alone should list files"
+        assert paths("under:b type:f") == ["b/build/other.LOG", "b/notes.md"], \
+            "under: should cover the whole subtree"
+        for bad in ("size>lots", "colour:red", "type:x"):
+            try:
+                index.search(bad)
+                assert False, f"{bad!r} should be rejected"
+            except ValueError:
+                pass
+
+        lines = list(search_directory_map(index, "small"))
+        assert [line.strip() for line in lines] == ["|_tree", "|_a", "|_build", "|_small.log"], \
+            "Matches should be shown with their parent folders only"
+
+        index_file = os.path.join(test_dir, "tree.idx")
+        index.save(index_file)
+        loaded = SearchIndex.load(index_file)
+        assert list(loaded.tree.iter_entries(totals=True)) == list(tree.iter_entries(totals=True)), \
+            "A saved tree should load unchanged"
+        assert loaded.search("*.log size>2K") == index.search("*.log size>2K"), \
+            "A saved index should answer queries like the original"
+
+        print("✓ Search index queries and saved indexes work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Search index test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_watch_mode():
+    """Test that a live map follows filesystem changes and patches only changed lines."""
+    test_dir = None
+    try:
+        from dirmap import map_directory_tree
+        from renderers import render_text
+        from watcher import InotifyWatcher, LiveMap, PollingWatcher, apply_patches, inotify_available
+
+        test_dir = _make_tree({
+            "tree/.gitignore": "*.log\n",
+            "tree/a/x.txt": "12345",
+            "tree/b/y.txt": "",
+        })
+        root = os.path.join(test_dir, "tree")
+        live_map = LiveMap(root, totals=True)
+        entries = list(live_map.scan())
+        assert len(entries) == 6, "The initial scan should yield the whole map"
+        text = list(live_map.lines())
+
+        def expected():
+            tree = map_directory_tree(root, collect_sizes=True)
+            return sorted(render_text(tree.iter_entries(totals=True)))
+
+        watcher = PollingWatcher(interval=0)
+        watcher.sync(live_map.directories())
+
+        os.makedirs(os.path.join(root, "a", "new"))
+        with open(os.path.join(root, "a", "new", "z.txt"), "w") as f:
+            f.write("x" * 100)
+        with open(os.path.join(root, "a", "skip.log"), "w") as f:
+            f.write("")
+        changed = watcher.read(0)
+        assert changed == {"a"}, "Polling should report the changed directory"
+        patches = live_map.refresh(changed)
+        assert patches, "A visible change should produce patches"
+        apply_patches(text, patches)
+        assert text == list(live_map.lines()), "Patched lines should equal a full render"
+        assert sorted(text) == expected(), "The live map should match a fresh walk"
+        assert not any("skip.log" in line for line in text), \
+            ".gitignore rules should apply to new entries"
+        assert not any("|_b" in line for _, _, lines in patches for line in lines), \
+            "Unchanged directories should not be re-rendered"
+
+        shutil.rmtree(os.path.join(root, "a", "new"))
+        with open(os.path.join(root, "b", ".gitignore"), "w") as f:
+            f.write("y.txt\n")
+        watcher.sync(live_map.directories())
+        apply_patches(text, live_map.refresh({"a", "b"}))
+        assert text == list(live_map.lines()) and sorted(text) == expected(), \
+            "Removed folders and changed .gitignore files should be followed"
+        assert live_map.refresh({"a"}) == [], "An unchanged directory should give no patches"
+
+        os.makedirs(os.path.join(root, ".git", "info"))
+        watchers = [PollingWatcher(interval=0)]
+        if inotify_available():
+            watchers.append(InotifyWatcher())
+        for watcher in watchers:
+            watcher.sync(live_map.directories())
+        with open(os.path.join(root, ".gitignore"), "w") as f:
+            f.write("*.log\nb/\n")
+        os.utime(os.path.join(root, ".gitignore"), (1000000000, 1000000000))
+        assert all(watcher.read(0.5) == {""} for watcher in watchers), \
+            "Root .gitignore edits should be reported as the root"
+        apply_patches(text, live_map.refresh({""}))
+        assert text == list(live_map.lines()) and sorted(text) == expected(), \
+            "Root .gitignore edits should filter the whole map anew"
+        assert not any("|_b" in line for line in text), "The new root rule should apply"
+        with open(os.path.join(root, ".git", "info", "exclude"), "w") as f:
+            f.write("x.txt\n")
+        assert all(watcher.read(0.5) == {""} for watcher in watchers), \
+            ".git/info/exclude edits should be reported as the root"
+        apply_patches(text, live_map.refresh({""}))
+        assert text == list(live_map.lines()) and sorted(text) == expected(), \
+            ".git/info/exclude edits should be followed"
+        assert not any("x.txt" in line for line in text), "The new exclude rule should apply"
+        for watcher in watchers:
+            watcher.close()
+
+        # A folder that becomes unreadable shows the error a fresh map shows
+        import watcher as watcher_module
+        from walker import walk_directory
+
+        def scandir(path):
+            if os.path.basename(path) == "a":
+                raise PermissionError(13, "Permission denied", path)
+            return os.scandir(path)
+
+        plain = LiveMap(root)
+        text = list(render_text(plain.scan()))
+        list_directory = watcher_module.list_directory
+        watcher_module.list_directory = \
+            lambda *args, **kwargs: list_directory(*args, scandir=scandir, **kwargs)
+        try:
+            apply_patches(text, plain.refresh({"a"}))
+        finally:
+            watcher_module.list_directory = list_directory
+        assert text == list(render_text(walk_directory(root, scandir=scandir))), \
+            "An unreadable folder should get an error entry, as in a fresh map"
+        assert any("... error: Permission denied" in line for line in text), \
+            "The error entry should be shown"
+
+        print("✓ Watch mode keeps the map up to date")
+        return True
+
+    except Exception as e:
+        print(f"✗ Watch mode test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_tree_diff():
+    """Test diffing saved and live trees, skipping identical subtrees, and the --diff CLI."""
+    test_dir = None
+    try:
+        import io
+        import json
+        from contextlib import redirect_stderr, redirect_stdout
+        from dirmap import load_tree, main, map_directory_tree
+        from tree_diff import render_diff_json, render_diff_text, diff_trees
+        from tree_model import DirectoryTree
+
+        test_dir = _make_tree({
+            "tree/a/f.txt": "abc",
+            "tree/a/g.txt": "abc",
+            "tree/same/deep/h.txt": "x",
+            "tree/gone/i.txt": "x",
+        })
+        root = os.path.join(test_dir, "tree")
+        saved = os.path.join(test_dir, "old.dirtree")
+        map_directory_tree(root, collect_sizes=True).save(saved)
+
+        with open(os.path.join(root, "a", "g.txt"), "w") as f:
+            f.write("abcde")
+        shutil.rmtree(os.path.join(root, "gone"))
+        os.makedirs(os.path.join(root, "new"))
+        old, new = DirectoryTree.load(saved), load_tree(root)
+        entries = list(diff_trees(old, new))
+        assert [(e.status, e.rel_path) for e in entries] == \
+            [("changed", "a/g.txt"), ("removed", "gone"), ("added", "new")], \
+            "Differences should be reported once each, in sorted pre-order"
+        same_old = old.children(old.root)[[old.name(c) for c in old.children(old.root)].index("same")]
+        same_new = new.children(new.root)[[new.name(c) for c in new.children(new.root)].index("same")]
+        assert old.subtree_hash(same_old) == new.subtree_hash(same_new), \
+            "Unchanged folders should hash equal so they are skipped"
+        assert old.subtree_hash(old.root) != new.subtree_hash(new.root), "Changes should reach the root hash"
+        assert [(e.status, e.rel_path) for e in diff_trees(old, map_directory_tree(root))] == \
+            [("removed", "gone"), ("added", "new")], \
+            "Sizes should only be compared when both maps recorded them"
+
+        lines = list(render_diff_text(old, new, entries))
+        assert lines[0] == "~ a/g.txt (3 B) -> (5 B)" and lines[-1] == "1 added, 1 removed, 1 changed", \
+            "Text diffs should show sizes and a summary"
+        report = json.loads("\n".join(render_diff_json(old, new, entries)))
+        assert report["summary"] == {"added": 1, "removed": 1, "changed": 1}, "JSON diffs should parse"
+        assert list(render_diff_text(old, old, diff_trees(old, old))) == ["No differences."]
+
+        with redirect_stdout(io.StringIO()) as out:
+            code = main(["--diff", saved, root])
+        assert code == 1 and "+ new/" in out.getvalue(), "--diff should exit 1 when maps differ"
+        with redirect_stdout(io.StringIO()):
+            assert main(["--diff", saved, saved]) == 0, "--diff should exit 0 for identical maps"
+        with redirect_stderr(io.StringIO()):
+            assert main(["--diff", saved, os.path.join(test_dir, "missing.dirtree")]) == 2, \
+                "--diff should exit 2 when a map cannot be loaded"
+
+        print("✓ Tree diffs of saved and live maps work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Tree diff test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_sorted_output():
+    """Test that sort orders give the same map whatever order the filesystem lists entries in."""
+    test_dir = None
+    try:
+        from dirmap import WalkLimits, iter_directory_map
+        from walker import walk_directory
+
+        test_dir = _make_tree({
+            "tree/file10.txt": "x" * 10,
+            "tree/file2.txt": "x" * 200,
+            "tree/B.txt": "",
+            "tree/a.txt": "x" * 50,
+            "tree/sub10/x.txt": "",
+            "tree/sub9/y.txt": "",
+        })
+        tree_path = os.path.join(test_dir, "tree")
+
+        class ReversedScandir:
+            """os.scandir with the entries in reverse order, like another filesystem."""
+            def __init__(self, path):
+                with os.scandir(path) as it:
+                    self.entries = sorted(it, key=lambda entry: entry.name, reverse=True)
+            def __enter__(self):
+                return iter(self.entries)
+            def __exit__(self, *exc):
+                return False
+
+        def names(order, **options):
+            return [e.name for e in walk_directory(tree_path, order=order, **options) if e.depth == 1]
+
+        assert names("name") == ["B.txt", "a.txt", "file10.txt", "file2.txt", "sub10", "sub9"], \
+            "Names should sort by code point, not locale"
+        assert names("natural") == ["B.txt", "a.txt", "file2.txt", "file10.txt", "sub9", "sub10"], \
+            "Natural order should compare numbers numerically"
+        assert names("size") == ["file2.txt", "a.txt", "file10.txt", "B.txt", "sub10", "sub9"], \
+            "Size order should put the largest files first"
+        assert names("dirs-first") == ["sub10", "sub9", "B.txt", "a.txt", "file10.txt", "file2.txt"], \
+            "dirs-first should put folders before files"
+
+        for order in ("name", "natural", "dirs-first", "size"):
+            expected = list(iter_directory_map(tree_path, format="tree", order=order))
+            assert list(walk_directory(tree_path, order=order, scandir=ReversedScandir)) == \
+                list(walk_directory(tree_path, order=order)), f"{order} should not depend on listing order"
+            assert list(iter_directory_map(tree_path, format="tree", order=order, workers=4)) == expected, \
+                f"Parallel walks should sort like serial ones ({order})"
+        lines = list(iter_directory_map(tree_path, format="tree", order="dirs-first"))
+        assert lines[-1].startswith("└── ") and lines[-1].endswith("file2.txt"), \
+            "With dirs-first the last file should close its folder"
+
+        lines = list(iter_directory_map(
+            tree_path, order="dirs-first", limits=WalkLimits(max_entries_per_dir=3)
+        ))
+        assert [line.strip() for line in lines[1:]] == \
+            ["|_sub10", "|_x.txt", "|_sub9", "|_y.txt", "|_B.txt", "|_... 3 more"], \
+            "Per-folder limits should keep the first entries in sorted order"
+
+        try:
+            list(walk_directory(tree_path, order="random"))
+            assert False, "Unknown sort orders should be rejected"
+        except ValueError:
+            pass
+
+        print("✓ Sorted output is deterministic")
+        return True
+
+    except Exception as e:
+        print(f"✗ Sorted output test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_async_map():
+    """Test the asyncio API: streaming, the concurrency limit and cancellation."""
+    test_dir = None
+    try:
+        import asyncio
+        import threading
+        import time
+        from async_map import AsyncMapper, aiter_directory_map, amap_directory
+        from dirmap import iter_directory_map
+
+        spec = {f"tree/d{i}/f{j}.txt": "" for i in range(20) for j in range(3)}
+        test_dir = _make_tree(spec)
+        tree_path = os.path.join(test_dir, "tree")
+        expected = list(iter_directory_map(tree_path, order="name"))
+
+        lock = threading.Lock()
+        listing = {"now": 0, "most": 0, "calls": 0}
+
+        class SlowScandir:
+            """os.scandir that takes a while and records how many listings overlap."""
+            def __init__(self, path):
+                with lock:
+                    listing["now"] += 1
+                    listing["calls"] += 1
+                    listing["most"] = max(listing["most"], listing["now"])
+                time.sleep(0.01)
+                with os.scandir(path) as it:
+                    self.entries = list(it)
+                with lock:
+                    listing["now"] -= 1
+            def __enter__(self):
+                return iter(self.entries)
+            def __exit__(self, *exc):
+                return False
+
+        async def scenario():
+            text = await amap_directory(tree_path, order="name")
+            assert text == "\n".join(expected) + "\n", "amap_directory should match the blocking map"
+            lines = [line async for line in aiter_directory_map(tree_path, order="name")]
+            assert lines == expected, "Streamed lines should match the blocking map"
+
+            # The loop keeps running while maps are walking, and only two run at once
+            mapper = AsyncMapper(max_maps=2)
+            ticks = 0
+            async def count(mapper):
+                return len([e async for e in mapper.iter_entries(tree_path, scandir=SlowScandir)])
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    ticks += 1
+                    await asyncio.sleep(0.005)
+            ticking = asyncio.create_task(ticker())
+            counts = await asyncio.gather(*(count(mapper) for _ in range(4)))
+            ticking.cancel()
+            assert counts == [len(expected)] * 4, "Concurrent maps should all complete"
+            assert listing["most"] == 2, "At most max_maps maps should list at once"
+            assert ticks > 10, "The event loop should not be blocked by the walk"
+
+            # Cancelling a map stops its walk and frees its slot
+            single = AsyncMapper(max_maps=1)
+            async def first_entry_then_wait():
+                async for _ in single.iter_entries(tree_path, scandir=SlowScandir):
+                    await asyncio.sleep(10)
+            task = asyncio.create_task(first_entry_then_wait())
+            await asyncio.sleep(0.05)
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            calls = listing["calls"]
+            assert await asyncio.wait_for(count(single), 5) == len(expected), \
+                "A cancelled map should free its slot"
+            assert listing["calls"] - calls == 21, "A cancelled walk should stop listing"
+            mapper.shutdown()
+            single.shutdown()
+
+        asyncio.run(scenario())
+        print("✓ Async mapping API works")
+        return True
+
+    except Exception as e:
+        print(f"✗ Async mapping test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_result_cache():
+    """Test that cached listings are reused across option changes, revalidated and evicted."""
+    test_dir = None
+    try:
+        import time
+        from dirmap import iter_directory_map, map_directory_tree
+        from result_cache import ResultCache
+
+        test_dir = _make_tree({
+            "tree/.gitignore": "build/\n",
+            "tree/a/x.txt": "12345",
+            "tree/a/b/y.txt": "",
+            "tree/build/out/z.o": "123",
+            "other/w.txt": "",
+        })
+        tree_path = os.path.join(test_dir, "tree")
+        cache_dir = os.path.join(test_dir, "cache")
+        # Listings of directories changed moments ago are never reused
+        old = time.time() - 3600
+        for dirpath, dirnames, filenames in os.walk(test_dir):
+            for name in dirnames + filenames:
+                os.utime(os.path.join(dirpath, name), (old, old))
+        os.utime(tree_path, (old, old))
+
+        def cached_map(cache, **options):
+            return list(iter_directory_map(tree_path, result_cache=cache, **options))
+
+        cache = ResultCache(cache_dir)
+        assert cached_map(cache) == list(iter_directory_map(tree_path)), \
+            "A cached map should match an uncached one"
+        assert cache.stats["listing_misses"] == 3, "The first map should list every kept folder"
+        assert cached_map(cache, exclude_ignore=False, order="name") == \
+            list(iter_directory_map(tree_path, exclude_ignore=False, order="name")), \
+            "Changing the filtering should re-filter the cached listings"
+        assert cache.stats["listing_hits"] == 3 and cache.stats["listing_misses"] == 5, \
+            "Only the folders no map had entered yet should be listed"
+
+        fresh = ResultCache(cache_dir)
+        sized = cached_map(fresh, totals=True)
+        assert sized == list(iter_directory_map(tree_path, totals=True)), \
+            "Sizes should be read for cached listings"
+        assert fresh.stats["disk_loads"] == 1 and fresh.stats["listing_hits"] == 3, \
+            "Listings should be shared through the cache directory"
+
+        # Appending to a file keeps its folder's mtime
+        x_path = os.path.join(tree_path, "a", "x.txt")
+        with open(x_path, "a") as f:
+            f.write("x" * 5000)
+        os.utime(os.path.join(tree_path, "a"), (old, old))
+        tree = map_directory_tree(tree_path, collect_sizes=True, result_cache=fresh)
+        x_node = next(node for node in range(tree.size) if tree.name(node) == "x.txt")
+        assert tree.size_of(x_node) == 5005 and fresh.stats["listing_hits"] == 6, \
+            "Files rewritten in place should show their current size"
+
+        with open(os.path.join(tree_path, "a", "new.txt"), "w"):
+            pass
+        assert any("new.txt" in line for line in cached_map(fresh)), \
+            "A folder whose mtime changed should be listed again"
+
+        # Listings under a folder that is gone are dropped, on disk too
+        shutil.rmtree(os.path.join(tree_path, "a", "b"))
+        cached_map(fresh)
+        reloaded = ResultCache(cache_dir)
+        cached_map(reloaded)
+        assert not any(path.startswith("a" + os.sep) for path in reloaded._roots[ResultCache._key(tree_path)].dirs), \
+            "Listings of removed folders should be pruned"
+
+        # A cache file locked by another process is not written
+        import sqlite3
+        import result_cache
+        locker = sqlite3.connect(fresh._file(ResultCache._key(tree_path)))
+        locker.execute("BEGIN EXCLUSIVE")
+        timeout = result_cache.LOCK_TIMEOUT_SECONDS
+        result_cache.LOCK_TIMEOUT_SECONDS = 0
+        try:
+            with open(os.path.join(tree_path, "a", "newer.txt"), "w"):
+                pass
+            assert any("newer.txt" in line for line in cached_map(fresh)) and \
+                fresh.stats["skipped_writes"] == 1, "A locked cache file should be skipped"
+        finally:
+            result_cache.LOCK_TIMEOUT_SECONDS = timeout
+            locker.rollback()
+            locker.close()
+        cached_map(fresh)
+        assert fresh.stats["skipped_writes"] == 1 and \
+            "newer.txt" in dict(ResultCache(cache_dir).listing(tree_path)._root.dirs["a"][1]), \
+            "A skipped write should be made on the next commit"
+
+        fresh.invalidate(tree_path)
+        misses = fresh.stats["listing_misses"]
+        cached_map(fresh)
+        assert fresh.stats["listing_misses"] - misses == 2, "Invalidated listings should not be used"
+
+        small = ResultCache(max_memory=1)
+        cached_map(small)
+        list(iter_directory_map(os.path.join(test_dir, "other"), result_cache=small))
+        assert small.stats["evictions"] == 1, "The least recently used root should be evicted"
+
+        print("✓ Result cache reuses, revalidates and evicts listings")
+        return True
+
+    except Exception as e:
+        print(f"✗ Result cache test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_symlinks_errors_and_streaming():
+    """Test symlink policies with loop detection, error entries and streamed listings."""
+    test_dir = None
+    try:
+        import json
+        from dirmap import iter_directory_map
+        from map_stats import MapStats
+        from renderers import render_csv, render_json, render_ndjson
+        from walker import walk_directory
+
+        files = {f"big/f{i:02d}.txt": "" for i in range(30)}
+        files.update({f"big/f{i:02d}.tmp": "" for i in range(5)})
+        files.update({"big/.gitignore": "*.tmp\n", "big/sub/x.txt": "", "a/b/y.txt": "", "other/o.txt": ""})
+        test_dir = _make_tree(files)
+        os.symlink("../..", os.path.join(test_dir, "a", "b", "up"))
+        os.symlink(os.path.join(test_dir, "other"), os.path.join(test_dir, "a", "link"))
+
+        def names(**options):
+            return [entry.rel_path for entry in walk_directory(test_dir, **options)]
+
+        assert "a/link" not in names(), "Symlinked folders should be skipped by default"
+        listed = names(symlinks="list")
+        assert "a/link" in listed and "a/link/o.txt" not in listed, \
+            "Listed symlinks should be shown without their contents"
+        stats = MapStats()
+        followed = names(symlinks="follow", stats=stats)
+        assert "a/link/o.txt" in followed, "Followed symlinks should be mapped"
+        assert "a/b/up/... error: symlink loop" in followed and stats.counts["symlink_loops"] == 1, \
+            "A symlink to an ancestor should be reported as a loop, not followed"
+        assert names(symlinks="follow", workers=4) == followed, \
+            "Parallel walks should follow symlinks the same way"
+
+        def scandir(path):
+            if os.path.basename(path) == "b":
+                raise PermissionError(13, "Permission denied", path)
+            return os.scandir(path)
+
+        stats = MapStats()
+        entries = list(walk_directory(test_dir, scandir=scandir, stats=stats))
+        error = next(entry for entry in entries if entry.rel_path.startswith("a/b/"))
+        assert error.name == "... error: Permission denied" and error.omitted == 0, \
+            "Unreadable folders should get an error entry"
+        assert stats.counts["errors"] == 1, "Errors should be counted"
+        records = [json.loads(line) for line in render_ndjson(entries)]
+        errors = [r for r in records if r["path"].startswith("a/b/")]
+        assert [(r["type"], r.get("reason"), "omitted" in r) for r in errors] == \
+            [("error", "Permission denied", False)], "NDJSON should type errors with their reason"
+        document = json.loads("\n".join(render_json(entries)))
+        a_dir = next(child for child in document["children"] if child["name"] == "a")
+        b_dir = next(child for child in a_dir["children"] if child["name"] == "b")
+        assert b_dir["children"] == [
+            {"name": "... error: Permission denied", "type": "error", "reason": "Permission denied"}
+        ], "JSON should type errors with their reason"
+        assert any(",error," in line for line in render_csv(entries)), "CSV should type errors"
+
+        stats = MapStats()
+        streamed = list(walk_directory(test_dir, chunk_size=4, stats=stats))
+        assert streamed == list(walk_directory(test_dir, chunk_size=None)), \
+            "Streamed folders should map like folders listed whole"
+        assert stats.counts["streamed_directories"] == 1, "Only the large folder should be streamed"
+        assert not any(entry.name.endswith(".tmp") for entry in streamed), \
+            "A streamed folder's own .gitignore should apply to all of it"
+        assert list(iter_directory_map(test_dir, order="name")) == \
+            list(iter_directory_map(test_dir, order="name", workers=4)), \
+            "Sorted walks list folders whole"
+
+        print("✓ Symlinks, errors and large folders are handled")
+        return True
+
+    except Exception as e:
+        print(f"✗ Symlink/error/streaming test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_startup_and_map_server():
+    """Test that the CLI imports little and that runs through the map server match local ones."""
+    test_dir = None
+    try:
+        import io
+        import socket
+        import subprocess
+        import threading
+        from contextlib import redirect_stderr, redirect_stdout
+        import map_server
+
+        heavy = ["argparse", "sqlite3", "ctypes", "tkinter", "csv", "tree_model", "search_index",
+                 "result_cache", "watcher"]
+        loaded = subprocess.run(
+            [sys.executable, "-c", "import sys, dirmap; "
+             f"print(' '.join(m for m in {heavy!r} if m in sys.modules))"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.split()
+        assert not loaded, f"Importing dirmap should not import {', '.join(loaded)}"
+
+        if not hasattr(socket, "AF_UNIX"):
+            print("✓ The CLI imports little (no unix sockets for the map server)")
+            return True
+
+        test_dir = _make_tree({".gitignore": "*.log\n", "src/a.py": "", "src/a.log": "", "b.txt": ""})
+        socket_path = os.path.join(test_dir, "server.sock")
+        assert map_server.request(["."], socket_path) is None, "No server should be found"
+        ready = threading.Event()
+        server = threading.Thread(target=map_server.serve, args=(socket_path, ready), daemon=True)
+        server.start()
+        assert ready.wait(30), "The server should start"
+        cwd = os.getcwd()
+        try:
+            os.chdir(test_dir)
+            out = io.StringIO()
+            with redirect_stdout(out):
+                code = map_server.request(["src", "-o", "-", "-f", "json"], socket_path)
+            from dirmap import map_directory
+            expected = map_directory("src", format="json", output_file=os.devnull)
+            assert code == 0 and out.getvalue() == expected, \
+                "The server should map relative paths from the client's directory"
+            err = io.StringIO()
+            with redirect_stderr(err):
+                code = map_server.request(["missing"], socket_path)
+            assert code == 1 and "not a valid directory" in err.getvalue(), \
+                "Errors and the exit status should come back to the client"
+            with redirect_stderr(io.StringIO()):
+                code = map_server.request(["--no-such-option"], socket_path)
+            assert code == 2, "Argument errors should exit with status 2"
+        finally:
+            os.chdir(cwd)
+            assert map_server.stop(socket_path), "The server should stop when asked"
+            server.join(10)
+        assert not server.is_alive() and not os.path.exists(socket_path), \
+            "A stopped server should remove its socket"
+
+        print("✓ Start-up imports and the map server work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Start-up/map server test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def test_content_hashes():
+    """Test file digests, Merkle folder digests, the hash cache and digests in outputs."""
+    test_dir = None
+    try:
+        import hashlib
+        import content_hash
+        from content_hash import HashCache, hash_entries
+        from dirmap import iter_directory_map, map_directory_tree
+        from map_stats import MapStats
+        from tree_model import DirectoryTree
+        from walker import WalkLimits, walk_directory
+
+        files = {"src/a.py": "print('a')\n", "src/b.py": "b" * 300000, "c.txt": "", "empty": None}
+        test_dir = _make_tree({"tree": None, **{f"tree/{path}": content for path, content in files.items()}})
+        root = os.path.join(test_dir, "tree")
+        # Old enough to be outside the hash cache's racy window
+        for dirpath, dirnames, filenames in os.walk(root):
+            for name in filenames:
+                os.utime(os.path.join(dirpath, name), (1000000000, 1000000000))
+
+        def digests(path, **options):
+            tree = map_directory_tree(path, content_hash="sha256", **options)
+            return {tree.path(node): tree.digest_of(node) for node in range(tree.size)}
+
+        found = digests(root)
+        for rel_path, content in files.items():
+            if content is not None:
+                assert found[rel_path] == hashlib.sha256(content.encode()).hexdigest(), \
+                    f"{rel_path} should have the sha256 of its contents"
+        assert found["empty"] is not None and found[""] is not None, "Folders should have digests"
+        assert digests(root, order="name", workers=4) == found, \
+            "Digests should not depend on the walk order"
+        shutil.copytree(root, os.path.join(test_dir, "renamed"))
+        assert digests(os.path.join(test_dir, "renamed"))[""] == found[""], \
+            "A folder's digest should not depend on its own name"
+        with open(os.path.join(root, "c.txt"), "w") as f:
+            f.write("changed")
+        os.utime(os.path.join(root, "c.txt"), (1000000000, 1000000000))
+        changed = digests(root)
+        assert changed["src"] == found["src"] and changed[""] != found[""], \
+            "A change should only alter the digests of the file's folders"
+
+        csv_lines = list(iter_directory_map(root, format="csv", content_hash="sha256", order="name"))
+        assert csv_lines[0].rstrip().endswith(",digest"), "CSV should get a digest column"
+        assert any(changed["src/a.py"] in line for line in csv_lines), "CSV rows should carry digests"
+
+        # utime cannot back-date ctime, so the racy window is closed instead of waiting it out
+        racy_window = content_hash.RACY_WINDOW_NS
+        content_hash.RACY_WINDOW_NS = 0
+        try:
+            cache_file = os.path.join(test_dir, "hashes.db")
+            stats = MapStats()
+            digests(root, hash_cache=HashCache(cache_file), stats=stats)
+            assert stats.counts["hashed_files"] == 3 and stats.counts["hash_cache_hits"] == 0, \
+                "A cold cache should hash every file"
+            stats = MapStats()
+            assert digests(root, hash_cache=HashCache(cache_file), stats=stats) == changed, \
+                "Cached digests should match hashed ones"
+            assert stats.counts["hashed_files"] == 0 and stats.counts["hash_cache_hits"] == 3, \
+                "Unchanged files should come from the cache"
+            with open(os.path.join(root, "src", "a.py"), "w") as f:
+                f.write("print('b')\n")
+            os.utime(os.path.join(root, "src", "a.py"), (1000000000, 1000000000))
+            stats = MapStats()
+            rehashed = digests(root, hash_cache=HashCache(cache_file), stats=stats)
+            assert stats.counts["hashed_files"] == 1, \
+                "A file rewritten with its old mtime put back should be hashed again"
+            assert rehashed["src/a.py"] == hashlib.sha256(b"print('b')\n").hexdigest(), \
+                "The rewritten file should get its new digest"
+        finally:
+            content_hash.RACY_WINDOW_NS = racy_window
+
+        tree = map_directory_tree(root, content_hash="sha256")
+        tree_file = os.path.join(test_dir, "saved.dirtree")
+        tree.save(tree_file)
+        loaded = DirectoryTree.load(tree_file)
+        assert [loaded.digest_of(node) for node in range(loaded.size)] == \
+            [tree.digest_of(node) for node in range(tree.size)], "Saved trees should keep their digests"
+
+        limited = digests(root, limits=WalkLimits(max_entries_per_dir=1))
+        assert limited[""] is None and limited.get("src") is None, \
+            "Folders cut short by limits should get no digest, nor their parents"
+        for options in ({"limits": WalkLimits(max_depth=1)}, {"symlinks": "list"}):
+            try:
+                digests(root, **options)
+            except ValueError:
+                pass
+            else:
+                raise AssertionError(f"Hashing should refuse walks that leave folders unlisted: {options}")
+
+        if hasattr(os, "mkfifo"):
+            os.mkfifo(os.path.join(root, "pipe"))
+            stats = MapStats()
+            entries = list(hash_entries(walk_directory(root, collect_sizes=True), stats=stats))
+            pipe = next(entry for entry in entries if entry.name == "pipe")
+            assert pipe.digest is None and stats.counts["hash_errors"] == 0, \
+                "Special files should get no digest and never be read"
+
+        print("✓ Content digests, folder digests and the hash cache work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Content hash test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
+
+def run_all_tests():
+    """Run all tests and report results."""
+    print("Running Directory Mapper Core Tests...")
+    print("=" * 40)
+
+    tests = [
+        test_gitignore_matcher,
+        test_map_directory_gitignore,
+        test_nested_gitignore,
+        test_walk_directory,
+        test_parallel_walk,
+        test_streaming_map,
+        test_snapshot_reuse,
+        test_directory_tree,
+        test_output_formats,
+        test_batch_cli,
+        test_subtree_totals,
+        test_walk_limits,
+        test_map_stats,
+        test_search_index,
+        test_watch_mode,
+        test_tree_diff,
+        test_sorted_output,
+        test_async_map,
+        test_result_cache,
+        test_symlinks_errors_and_streaming,
+        test_startup_and_map_server,
+        test_content_hashes,
+    ]
+
+    passed = 0
+    total = len(tests)
+
+    for test in tests:
+        if test():
+            passed += 1
+        print()
+
+    print("=" * 40)
+    print(f"Tests passed: {passed}/{total}")
+
+    if passed == total:
+        print("🎉 All tests passed!")
+        return True
+    else:
+        print("❌ Some tests failed. Please check the errors above.")
+        return False
+
+
+if __name__ == "__main__":
+    success = run_all_tests()
+    sys.exit(0 if success else 1)
@@ -83,10 +83,20 @@ def test_gui_initialization():
         assert hasattr(app, 'directory_path'), "GUI should have directory_path variable"
         assert hasattr(app, 'exclude_gitignore'), "GUI should have exclude_gitignore variable"
         assert hasattr(app, 'output_text'), "GUI should have output_text widget"
+        assert hasattr(app, 'output_tree'), "GUI should have output_tree widget"
         assert hasattr(app, 'generate_map'), "GUI should have generate_map method"
         
         # Test variable initialization
         assert app.exclude_gitignore.get() == True, "Default should exclude gitignore"
+        assert app.view_mode.get() == "text", "Default view should be text"
+        assert app.show_sizes.get() == False, "Folder sizes should be off by default"
+        assert not any(app.read_limits()), "Walk limits should be off by default"
+        assert app.collect_stats.get() == False, "Statistics should be off by default"
+        assert app.search_query.get() == "", "Search box should start empty"
+        assert app.watch_changes.get() == False, "Watching should be off by default"
+        assert app.sort_order.get() == "filesystem", "Entries should keep filesystem order by default"
+        assert app.symlink_policy.get() == "skip", "Symlinked folders should be skipped by default"
+        assert app.result_cache is not None, "Maps should be cached between runs"
         
         root.destroy()
         
@@ -97,6 +107,97 @@ def test_gui_initialization():
         print(f"✗ GUI initialization test failed: {e}")
         return False
 
+def test_batched_cancel():
+    """Test that mapping batches reach the UI queue and cancel stops the walk."""
+    try:
+        import queue
+        import threading
+        from directory_mapper_gui import DirectoryMapperGUI, MAP_BATCH_SIZE
+
+        results = queue.Queue()
+        cancel_event = threading.Event()
+        entries = iter(range(MAP_BATCH_SIZE * 3))
+        passed = []
+        for entry in DirectoryMapperGUI._batched(entries, results, cancel_event):
+            passed.append(entry)
+            if len(passed) == MAP_BATCH_SIZE + 1:
+                cancel_event.set()
+
+        assert len(passed) == MAP_BATCH_SIZE + 1, "Cancel should stop the walk"
+        batches = []
+        while not results.empty():
+            batches.append(results.get_nowait())
+        assert [kind for kind, _ in batches] == ["batch", "batch"], "Should post batches"
+        assert sum(len(batch) for _, batch in batches) == len(passed), \
+            "Every entry passed through should reach the UI"
+
+        # A full queue holds the walk back until Cancel releases it
+        results = queue.Queue(maxsize=1)
+        cancel_event = threading.Event()
+        entries = iter(range(MAP_BATCH_SIZE * 3))
+        walk = DirectoryMapperGUI._batched(entries, results, cancel_event)
+        worker = threading.Thread(target=lambda: passed.extend(walk))
+        passed = []
+        worker.start()
+        worker.join(0.5)
+        assert worker.is_alive(), "Walk should wait while the UI queue is full"
+        assert len(passed) == MAP_BATCH_SIZE * 2, "Walk should stop at the second batch"
+        cancel_event.set()
+        worker.join(2)
+        assert not worker.is_alive(), "Cancel should wake a walk waiting on the queue"
+
+        print("✓ Batched mapping and cancel work")
+        return True
+
+    except Exception as e:
+        print(f"✗ Batched mapping test failed: {e}")
+        return False
+
+def test_diff_view():
+    """Test that the Compare window lists the differences of two maps with their parents."""
+    test_dir = None
+    try:
+        from directory_mapper_gui import DirectoryMapperGUI
+        from dirmap import map_directory_tree
+        from tree_diff import diff_trees
+
+        class FakeView:
+            """Stand-in for ttk.Treeview, so no display is needed."""
+
+            def __init__(self):
+                self.items = []
+
+            def insert(self, parent, index, text, open, tags):
+                self.items.append((parent, text, tags))
+                return len(self.items)
+
+        test_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(test_dir, "src"))
+        with open(os.path.join(test_dir, "src", "a.py"), "w") as f:
+            f.write("a")
+        old = map_directory_tree(test_dir, collect_sizes=True)
+        with open(os.path.join(test_dir, "src", "b.py"), "w") as f:
+            f.write("b")
+        new = map_directory_tree(test_dir)
+
+        statuses = {e.new_node: e.status for e in diff_trees(old, new) if e.new_node is not None}
+        view = FakeView()
+        DirectoryMapperGUI._fill_diff_view(view, new, statuses)
+        labels = [text for _, text, _ in view.items]
+        assert labels[1:] == ["src", "+ b.py"], f"Unexpected diff view {labels}"
+        assert view.items[2][0] == 2 and view.items[2][2] == ("added",), \
+            "Changes should be tagged and shown under their folder"
+
+        print("✓ Compare view shows the differences")
+        return True
+
+    except Exception as e:
+        print(f"✗ Compare view test failed: {e}")
+        return False
+    finally:
+        if test_dir:
+            shutil.rmtree(test_dir)
+
 def run_all_tests():
     """Run all tests and report results."""
     print("Running Directory Mapper Tests...")
@@ -105,7 +206,9 @@ def run_all_tests():
     tests = [
         test_gui_import,
         test_dirmap_functionality,
-        test_gui_initialization
+        test_gui_initialization,
+        test_batched_cancel,
+        test_diff_view
     ]
     
     passed = 0
@@ -0,0 +1,183 @@
+"""
+Compare two directory maps.
+
+Both maps are DirectoryTrees, mapped live or loaded from files saved with
+DirectoryTree.save. The comparison walks both trees level by level: the
+children of each pair of matching directories are sorted by name and
+merged, so every entry is looked at once, and a pair of directories whose
+subtree hashes are equal is skipped without descending into it. Unchanged
+parts of a huge tree therefore cost one hash comparison.
+
+Each difference is reported once: an added or removed directory is one
+entry (with its subtree totals), not one entry per file below it. Files
+are changed when their size differs (if both maps recorded sizes), or
+their mtime with mtimes=True; an entry that turned from a file into a
+directory (or back) is reported as removed and added.
+"""
+
+import json
+from collections import Counter, namedtuple
+
+from renderers import DIR_TYPE, FILE_TYPE, format_size, format_totals
+from tree_model import FLAG_MORE
+
+ADDED = "added"
+REMOVED = "removed"
+CHANGED = "changed"
+DIFF_MARKERS = {ADDED: "+", REMOVED: "-", CHANGED: "~"}
+
+DiffEntry = namedtuple(
+    "DiffEntry", ["status", "rel_path", "is_dir", "old_node", "new_node"]
+)
+DiffEntry.__doc__ = """One difference between two maps.
+
+status is ADDED, REMOVED or CHANGED; old_node and new_node are the nodes in
+the old and new tree (None on the side where the entry does not exist)."""
+
+
+def _sorted_children(tree, node):
+    """Children of node as (name, child) pairs sorted by name, placeholders left out."""
+    flags = tree.flags
+    return sorted(
+        (tree.name(child), child)
+        for child in tree.children(node)
+        if not flags[child] & FLAG_MORE
+    )
+
+
+def _merge_level(old, new, old_node, new_node, prefix, mtimes, sizes):
+    """
+    Merge the name-sorted children of two matching directories, yielding
+    DiffEntry records and, for subdirectories whose hashes differ,
+    (old child, new child, prefix) tuples to descend into.
+    """
+    old_children = _sorted_children(old, old_node)
+    new_children = _sorted_children(new, new_node)
+    i = j = 0
+    while i < len(old_children) or j < len(new_children):
+        if j == len(new_children) or (
+            i < len(old_children) and old_children[i][0] < new_children[j][0]
+        ):
+            name, child = old_children[i]
+            yield DiffEntry(REMOVED, prefix + name, old.is_dir(child), child, None)
+            i += 1
+            continue
+        if i == len(old_children) or new_children[j][0] < old_children[i][0]:
+            name, child = new_children[j]
+            yield DiffEntry(ADDED, prefix + name, new.is_dir(child), None, child)
+            j += 1
+            continue
+        name, old_child = old_children[i]
+        new_child = new_children[j][1]
+        i += 1
+        j += 1
+        old_is_dir = old.is_dir(old_child)
+        new_is_dir = new.is_dir(new_child)
+        if old_is_dir != new_is_dir:
+            yield DiffEntry(REMOVED, prefix + name, old_is_dir, old_child, None)
+            yield DiffEntry(ADDED, prefix + name, new_is_dir, None, new_child)
+        elif old_is_dir:
+            old_hash = old.subtree_hash(old_child, mtimes, sizes)
+            if old_hash != new.subtree_hash(new_child, mtimes, sizes):
+                yield old_child, new_child, prefix + name + "/"
+        elif sizes and old.sizes[old_child] != new.sizes[new_child] or (
+            mtimes and old.mtimes[old_child] != new.mtimes[new_child]
+        ):
+            yield DiffEntry(CHANGED, prefix + name, False, old_child, new_child)
+
+
+def diff_trees(old, new, mtimes=False):
+    """
+    Yield DiffEntry records for the differences between two trees, in
+    pre-order with names sorted at each level. The root names are not
+    compared, so maps of differently named roots can be diffed. File sizes
+    are only compared when both trees recorded them, so a map made without
+    sizes can be compared with one made with them.
+    """
+    if old.root is None or new.root is None:
+        return
+    sizes = old.has_sizes() and new.has_sizes()
+    # One merge per open directory pair, innermost last
+    merges = [_merge_level(old, new, old.root, new.root, "", mtimes, sizes)]
+    while merges:
+        item = next(merges[-1], None)
+        if item is None:
+            merges.pop()
+        elif isinstance(item, DiffEntry):
+            yield item
+        else:
+            merges.append(_merge_level(old, new, *item, mtimes, sizes))
+
+
+def diff_summary(entries):
+    """Count entries by status."""
+    counts = Counter(entry.status for entry in entries)
+    return {status: counts[status] for status in (ADDED, REMOVED, CHANGED)}
+
+
+def _describe(tree, node):
+    if tree.is_dir(node):
+        return format_totals(tree.total_size(node), tree.file_count(node)).strip()
+    size = tree.size_of(node)
+    return "(size unknown)" if size is None else f"({format_size(size)})"
+
+
+def render_diff_text(old, new, entries):
+    """Yield one line per difference ('+', '-' or '~' and the path), then a summary."""
+    counts = Counter()
+    for entry in entries:
+        counts[entry.status] += 1
+        path = entry.rel_path + ("/" if entry.is_dir else "")
+        if entry.status == CHANGED:
+            detail = f"{_describe(old, entry.old_node)} -> {_describe(new, entry.new_node)}"
+        elif entry.status == ADDED:
+            detail = _describe(new, entry.new_node)
+        else:
+            detail = _describe(old, entry.old_node)
+        yield f"{DIFF_MARKERS[entry.status]} {path} {detail}"
+    if not counts:
+        yield "No differences."
+        return
+    yield (
+        f"{counts[ADDED]:,} added, {counts[REMOVED]:,} removed, {counts[CHANGED]:,} changed"
+    )
+
+
+def _side(tree, node):
+    if node is None:
+        return None
+    if tree.is_dir(node):
+        return {"total_size": tree.total_size(node), "file_count": tree.file_count(node)}
+    return {"size": tree.size_of(node), "mtime": tree.mtime_of(node)}
+
+
+def render_diff_json(old, new, entries):
+    """
+    Yield the differences as a JSON object with a summary and an 'entries'
+    list, streamed one entry per line.
+    """
+    counts = Counter()
+    yield '{"entries": ['
+    previous = None
+    for entry in entries:
+        counts[entry.status] += 1
+        record = {
+            "status": entry.status,
+            "path": entry.rel_path,
+            "type": DIR_TYPE if entry.is_dir else FILE_TYPE,
+            "old": _side(old, entry.old_node),
+            "new": _side(new, entry.new_node),
+        }
+        if previous is not None:
+            yield previous + ","
+        previous = "  " + json.dumps(record)
+    if previous is not None:
+        yield previous
+    summary = {status: counts[status] for status in (ADDED, REMOVED, CHANGED)}
+    yield '], "summary": ' + json.dumps(summary) + "}"
+
+
+DIFF_RENDERERS = {
+    "text": render_diff_text,
+    "json": render_diff_json,
+}
@@ -0,0 +1,568 @@
+"""
+Compact in-memory tree model of a directory map.
+
+The walker's flat, depth-annotated entries are stored in parallel arrays
+(parent, depth, flags, name id, first child, next sibling, size, mtime) plus an interned
+name table, so millions of entries take a few dozen bytes each instead of a
+Python object and a formatted line apiece. Nodes are plain integer indices
+assigned in walk order, which is also the map's pre-order: rendering the
+whole tree, or any subtree, is a linear scan over a slice of the arrays and
+never touches the disk again.
+
+Subtree totals (bytes and file count per directory) are rolled up lazily in
+a single reverse pass over the arrays: in pre-order every node comes after
+its parent, so walking the indices backwards adds each child into its
+parent after the child's own subtree is complete.
+
+Content digests of files, when the map was hashed, are kept by node; a
+directory's digest is a Merkle hash over its children's names and digests,
+computed in the same kind of reverse pass (and None when something below
+it was left out).
+
+A tree can be saved to a sqlite file as the raw array bytes and loaded
+again without walking, e.g. to search or compare it later.
+"""
+
+import heapq
+import json
+import os
+import sys
+from array import array
+from collections import namedtuple
+
+TreeEntry = namedtuple(
+    "TreeEntry",
+    [
+        "depth",
+        "name",
+        "is_dir",
+        "is_last",
+        "rel_path",
+        "size",
+        "mtime",
+        "total_size",
+        "file_count",
+        "omitted",
+        "digest",
+    ],
+    defaults=(False, "", None, None, None, None, None, None),
+)
+TreeEntry.__doc__ = """A node of the tree as a pre-order entry.
+
+total_size and file_count are the directory's subtree totals when
+requested from iter_entries(totals=True), and None otherwise. omitted is
+set on '... N more' placeholders as in walker.WalkEntry. digest is the hex
+content digest of files and directories when requested with digests=True
+from a hashed tree (see DirectoryTree.digest_of), and None otherwise."""
+
+FLAG_DIR = 0x01
+# '... N more' placeholder left by walk limits
+FLAG_MORE = 0x02
+
+NO_NODE = -1
+NO_SIZE = -1
+NO_MTIME = -1.0
+HASH_SIZE = 16
+
+TREE_FORMAT_VERSION = 1
+# Arrays stored by save(), in the order they are written
+_ARRAY_FIELDS = (
+    "parents",
+    "depths",
+    "flags",
+    "name_ids",
+    "first_child",
+    "next_sibling",
+    "sizes",
+    "mtimes",
+)
+
+
+class DirectoryTree:
+    """
+    Array-backed tree of mapped entries.
+
+    Nodes are integer handles; use the accessor methods rather than the
+    arrays so views do not depend on the representation.
+    """
+
+    def __init__(self):
+        self.parents = array("i")
+        self.depths = array("H")
+        self.flags = array("B")
+        self.name_ids = array("I")
+        self.first_child = array("i")
+        self.next_sibling = array("i")
+        self.sizes = array("q")
+        self.mtimes = array("d")
+        self.names = []
+        self._name_index = {}
+        # Placeholder node -> number of entries it stands for
+        self._omitted = {}
+        # Open directories along the current path while building, by depth,
+        # as [node, last child] pairs
+        self._path = []
+        # Subtree totals, valid for the first _rolled_up nodes
+        self._totals = array("q")
+        self._file_counts = array("q")
+        self._rolled_up = 0
+        # Subtree digests, HASH_SIZE bytes per node, by whether mtimes and sizes count
+        self._hashes = {}
+        # Content digests: hashlib algorithm, file node -> digest, and the
+        # directory digests as (node count, {node: digest}) once computed
+        self.digest_algorithm = None
+        self._digests = {}
+        self._dir_digests = (0, {})
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Build a tree from pre-order entries carrying depth, name and is_dir."""
+        tree = cls()
+        tree.extend(entries)
+        return tree
+
+    @property
+    def size(self):
+        return len(self.parents)
+
+    @property
+    def root(self):
+        return 0 if self.parents else None
+
+    def _intern(self, name):
+        name_id = self._name_index.get(name)
+        if name_id is None:
+            name_id = len(self.names)
+            self._name_index[name] = name_id
+            self.names.append(name)
+        return name_id
+
+    def extend(self, entries):
+        """Add pre-order entries, continuing from where the last call stopped."""
+        path = self._path
+        parents = self.parents
+        next_sibling = self.next_sibling
+        first_child = self.first_child
+        for entry in entries:
+            node = len(parents)
+            depth = entry.depth
+            if depth == 0:
+                parent = NO_NODE
+                del path[:]
+            else:
+                del path[depth:]
+                slot = path[depth - 1]
+                parent = slot[0]
+                if slot[1] == NO_NODE:
+                    first_child[parent] = node
+                else:
+                    next_sibling[slot[1]] = node
+                slot[1] = node
+            parents.append(parent)
+            self.depths.append(depth)
+            omitted = getattr(entry, "omitted", None)
+            if omitted is not None:
+                self._omitted[node] = omitted
+                self.flags.append(FLAG_MORE)
+            else:
+                self.flags.append(FLAG_DIR if entry.is_dir else 0)
+            self.name_ids.append(self._intern(entry.name))
+            first_child.append(NO_NODE)
+            next_sibling.append(NO_NODE)
+            size = getattr(entry, "size", None)
+            self.sizes.append(NO_SIZE if size is None else size)
+            mtime = getattr(entry, "mtime", None)
+            self.mtimes.append(NO_MTIME if mtime is None else mtime)
+            digest = getattr(entry, "digest", None)
+            if digest is not None:
+                self._digests[node] = bytes.fromhex(digest)
+            if entry.is_dir:
+                path.append([node, NO_NODE])
+        return self
+
+    def name(self, node):
+        return self.names[self.name_ids[node]]
+
+    def is_dir(self, node):
+        return bool(self.flags[node] & FLAG_DIR)
+
+    def depth(self, node):
+        return self.depths[node]
+
+    def size_of(self, node):
+        """Return the recorded size of node in bytes, or None if unknown."""
+        size = self.sizes[node]
+        return None if size == NO_SIZE else size
+
+    def omitted(self, node):
+        """Return how many entries a '... N more' placeholder stands for, or None."""
+        return self._omitted.get(node)
+
+    def has_sizes(self):
+        """Return whether file sizes were recorded, i.e. the tree was mapped with sizes."""
+        return max(self.sizes, default=NO_SIZE) != NO_SIZE
+
+    def mtime_of(self, node):
+        """Return the recorded modification time of node, or None if unknown."""
+        mtime = self.mtimes[node]
+        return None if mtime == NO_MTIME else mtime
+
+    def rollup(self):
+        """
+        Compute the bytes and file count below every node in one bottom-up
+        pass. Accessors call this on demand; it only does work again after
+        the tree has been extended. Files of unknown size count as 0 bytes.
+        """
+        count = len(self.parents)
+        if self._rolled_up == count:
+            return
+        totals = array("q", (max(size, 0) for size in self.sizes))
+        file_counts = array(
+            "q", (0 if flag & (FLAG_DIR | FLAG_MORE) else 1 for flag in self.flags)
+        )
+        parents = self.parents
+        for node in range(count - 1, 0, -1):
+            parent = parents[node]
+            totals[parent] += totals[node]
+            file_counts[parent] += file_counts[node]
+        self._totals = totals
+        self._file_counts = file_counts
+        self._rolled_up = count
+
+    def total_size(self, node):
+        """Return the bytes of all files in node's subtree (the file's own size for files)."""
+        self.rollup()
+        return self._totals[node]
+
+    def file_count(self, node):
+        """Return the number of files in node's subtree."""
+        self.rollup()
+        return self._file_counts[node]
+
+    def _compute_hashes(self, mtimes, sizes):
+        from hashlib import blake2b
+
+        encoded = [name.encode("utf-8", "surrogateescape") + b"\0" for name in self.names]
+        name_ids, flags, parents = self.name_ids, self.flags, self.parents
+        file_sizes, times = self.sizes, self.mtimes
+        hashes = bytearray(HASH_SIZE * len(parents))
+        # Digests of the children seen so far, by parent, as (name, digest)
+        children = {}
+        for node in range(len(parents) - 1, -1, -1):
+            name = encoded[name_ids[node]]
+            flag = flags[node]
+            if flag & FLAG_DIR:
+                digest = blake2b(b"d" + name, digest_size=HASH_SIZE)
+                for _, child in sorted(children.pop(node, ())):
+                    digest.update(child)
+                value = digest.digest()
+            else:
+                data = (b"m" if flag & FLAG_MORE else b"f") + name
+                if sizes:
+                    data += file_sizes[node].to_bytes(8, "little", signed=True)
+                if mtimes:
+                    data += repr(times[node]).encode()
+                value = blake2b(data, digest_size=HASH_SIZE).digest()
+            hashes[node * HASH_SIZE : (node + 1) * HASH_SIZE] = value
+            parent = parents[node]
+            if parent != NO_NODE:
+                children.setdefault(parent, []).append((name, value))
+        return hashes
+
+    def subtree_hash(self, node, mtimes=False, sizes=True):
+        """
+        Return a digest of node's subtree: names, types and file sizes (and
+        file mtimes with mtimes=True; sizes are left out with sizes=False),
+        with children taken in name order so listing order does not matter.
+        Equal digests mean identical subtrees. All digests are computed in
+        one pass on first use.
+        """
+        key = (mtimes, sizes)
+        cached = self._hashes.get(key)
+        if cached is None or cached[0] != len(self.parents):
+            cached = self._hashes[key] = (len(self.parents), self._compute_hashes(mtimes, sizes))
+        return bytes(cached[1][node * HASH_SIZE : (node + 1) * HASH_SIZE])
+
+    def _directory_digests(self):
+        """Return {directory node: digest}, computing it if the tree has grown."""
+        if self.digest_algorithm is None:
+            return {}
+        if self._dir_digests[0] != len(self.parents):
+            self._dir_digests = (len(self.parents), self._compute_dir_digests())
+        return self._dir_digests[1]
+
+    def _compute_dir_digests(self):
+        import hashlib
+
+        algorithm = self.digest_algorithm
+        encoded = [name.encode("utf-8", "surrogateescape") + b"\0" for name in self.names]
+        name_ids, flags, parents = self.name_ids, self.flags, self.parents
+        files = self._digests
+        dir_digests = {}
+        # Records of the children seen so far, by parent, as (name, record);
+        # a None record leaves the parent without a digest
+        children = {}
+        for node in range(len(parents) - 1, -1, -1):
+            name = encoded[name_ids[node]]
+            flag = flags[node]
+            if flag & FLAG_DIR:
+                records = sorted(children.pop(node, ()))
+                if any(record is None for _, record in records):
+                    record = None
+                else:
+                    digest = hashlib.new(algorithm)
+                    for _, record in records:
+                        digest.update(record)
+                    value = dir_digests[node] = digest.digest()
+                    record = b"d" + name + value
+            elif flag & FLAG_MORE:
+                # Entries left out or an error: the folder was not listed in full
+                record = None
+            else:
+                value = files.get(node)
+                # Special and unreadable files count by name only
+                record = b"x" + name if value is None else b"f" + name + value
+            parent = parents[node]
+            if parent != NO_NODE:
+                children.setdefault(parent, []).append((name, record))
+        return dir_digests
+
+    def digest_of(self, node):
+        """
+        Return the hex content digest of node, or None. A file's digest is
+        the digest_algorithm hash of its contents; a directory's hashes its
+        children in name order, each as a type byte ('d', 'f', or 'x' for
+        special and unreadable files), its name, a NUL and its digest (none
+        for 'x'), so it does not depend on the directory's own name. A
+        directory with a '... N more' or error placeholder below it has no
+        digest. Directory digests need digest_algorithm and are computed in
+        one pass on first use.
+        """
+        if self.flags[node] & FLAG_DIR:
+            digest = self._directory_digests().get(node)
+        else:
+            digest = self._digests.get(node)
+        return None if digest is None else digest.hex()
+
+    def largest_subtrees(self, n=10):
+        """
+        Return the n directories below the root with the largest subtree
+        totals, as (total bytes, node) pairs, largest first. Uses a bounded
+        heap, so memory stays O(n) however many directories there are.
+        """
+        self.rollup()
+        totals, flags = self._totals, self.flags
+        dirs = (node for node in range(1, len(flags)) if flags[node] & FLAG_DIR)
+        return [(totals[node], node) for node in heapq.nlargest(n, dirs, key=totals.__getitem__)]
+
+    def parent(self, node):
+        parent = self.parents[node]
+        return None if parent == NO_NODE else parent
+
+    def children(self, node):
+        """Return the children of node in map order (files, then directories)."""
+        result = []
+        child = self.first_child[node]
+        while child != NO_NODE:
+            result.append(child)
+            child = self.next_sibling[child]
+        return result
+
+    def child_count(self, node):
+        count = 0
+        child = self.first_child[node]
+        while child != NO_NODE:
+            count += 1
+            child = self.next_sibling[child]
+        return count
+
+    def path(self, node):
+        """Return the '/'-separated path of node relative to the root."""
+        parts = []
+        while node != NO_NODE and self.parents[node] != NO_NODE:
+            parts.append(self.name(node))
+            node = self.parents[node]
+        return "/".join(reversed(parts))
+
+    def subtree_end(self, node):
+        """Return the index just past node's subtree (nodes are in pre-order)."""
+        if node == 0:
+            return len(self.depths)
+        depth = self.depths[node]
+        depths = self.depths
+        end = node + 1
+        size = len(depths)
+        while end < size and depths[end] > depth:
+            end += 1
+        return end
+
+    def iter_entries(self, node=None, totals=False, digests=False):
+        """
+        Yield TreeEntry records for node's subtree (the whole tree by
+        default) in pre-order, with depths and paths relative to node.
+        totals=True fills in total_size and file_count for directories,
+        digests=True the content digests of files and directories.
+        """
+        node = self.root if node is None else node
+        if node is None:
+            return
+        if totals:
+            self.rollup()
+        file_digests = self._digests if digests else {}
+        dir_digests = self._directory_digests() if digests else {}
+        base = self.depths[node]
+        names = self.names
+        depths, flags, name_ids = self.depths, self.flags, self.name_ids
+        next_sibling, sizes, mtimes = self.next_sibling, self.sizes, self.mtimes
+        # '/'-terminated path prefixes of the open directories, by depth
+        prefixes = []
+        for i in range(node, self.subtree_end(node)):
+            depth = depths[i] - base
+            name = names[name_ids[i]]
+            is_dir = bool(flags[i] & FLAG_DIR)
+            if depth == 0:
+                rel_path = ""
+            else:
+                del prefixes[depth:]
+                rel_path = prefixes[depth - 1] + name
+            if is_dir:
+                prefixes.append(rel_path + "/" if depth else "")
+            size = sizes[i]
+            mtime = mtimes[i]
+            digest = (dir_digests if is_dir else file_digests).get(i)
+            yield TreeEntry(
+                depth,
+                name,
+                is_dir,
+                i == node or next_sibling[i] == NO_NODE,
+                rel_path,
+                None if size == NO_SIZE else size,
+                None if mtime == NO_MTIME else mtime,
+                self._totals[i] if totals and is_dir else None,
+                self._file_counts[i] if totals and is_dir else None,
+                self._omitted.get(i) if flags[i] & FLAG_MORE else None,
+                None if digest is None else digest.hex(),
+            )
+
+    def iter_selection(self, nodes, totals=False, digests=False):
+        """
+        Yield TreeEntry records for the given nodes plus all their ancestors,
+        in pre-order, so a filtered view keeps the path to every match.
+        Depths and paths are relative to the root; is_last refers to the
+        selection, not to the full tree.
+        """
+        parents = self.parents
+        keep = set()
+        for node in nodes:
+            while node != NO_NODE and node not in keep:
+                keep.add(node)
+                node = parents[node]
+        ordered = sorted(keep)
+        last_child = {parents[node]: node for node in ordered}
+        if totals:
+            self.rollup()
+        file_digests = self._digests if digests else {}
+        dir_digests = self._directory_digests() if digests else {}
+        names, name_ids, flags = self.names, self.name_ids, self.flags
+        for node in ordered:
+            is_dir = bool(flags[node] & FLAG_DIR)
+            digest = (dir_digests if is_dir else file_digests).get(node)
+            yield TreeEntry(
+                self.depths[node],
+                names[name_ids[node]],
+                is_dir,
+                last_child[parents[node]] == node,
+                self.path(node),
+                self.size_of(node),
+                self.mtime_of(node),
+                self._totals[node] if totals and is_dir else None,
+                self._file_counts[node] if totals and is_dir else None,
+                self._omitted.get(node) if flags[node] & FLAG_MORE else None,
+                None if digest is None else digest.hex(),
+            )
+
+    def save(self, path):
+        """
+        Save the tree to a sqlite file at path (replacing it), so it can be
+        searched, rendered or diffed later without walking again.
+        """
+        import sqlite3
+
+        if os.path.exists(path):
+            os.remove(path)
+        with sqlite3.connect(path) as db:
+            db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+            db.execute("CREATE TABLE arrays (name TEXT PRIMARY KEY, data BLOB)")
+            meta = {
+                "version": TREE_FORMAT_VERSION,
+                "byteorder": sys.byteorder,
+                "omitted": list(self._omitted.items()),
+                "digest_algorithm": self.digest_algorithm,
+            }
+            db.executemany("INSERT INTO meta VALUES (?, ?)", [(k, json.dumps(v)) for k, v in meta.items()])
+            rows = [(field, getattr(self, field).tobytes()) for field in _ARRAY_FIELDS]
+            rows.append(("names", "\0".join(self.names).encode("utf-8", "surrogateescape")))
+            if self._digests:
+                rows.append(("digest_nodes", array("i", self._digests).tobytes()))
+                rows.append(("digests", b"".join(self._digests.values())))
+            db.executemany("INSERT INTO arrays VALUES (?, ?)", rows)
+        db.close()
+
+    @classmethod
+    def load(cls, path):
+        """Load a tree written by save()."""
+        if not os.path.isfile(path):
+            raise FileNotFoundError(f"No saved tree at {path}")
+        import sqlite3
+
+        db = sqlite3.connect(path)
+        try:
+            meta = {k: json.loads(v) for k, v in db.execute("SELECT key, value FROM meta")}
+            if meta.get("version") != TREE_FORMAT_VERSION:
+                raise ValueError(f"{path} is not a saved directory tree (or has an unsupported version)")
+            blobs = dict(db.execute("SELECT name, data FROM arrays"))
+        finally:
+            db.close()
+        tree = cls()
+        for field in _ARRAY_FIELDS:
+            values = getattr(tree, field)
+            values.frombytes(blobs[field])
+            if meta["byteorder"] != sys.byteorder:
+                values.byteswap()
+        names = blobs["names"].decode("utf-8", "surrogateescape")
+        tree.names = names.split("\0") if tree.parents else []
+        tree._name_index = {name: i for i, name in enumerate(tree.names)}
+        tree._omitted = {node: count for node, count in meta["omitted"]}
+        tree.digest_algorithm = meta.get("digest_algorithm")
+        if "digest_nodes" in blobs:
+            nodes = array("i", blobs["digest_nodes"])
+            if meta["byteorder"] != sys.byteorder:
+                nodes.byteswap()
+            digests = blobs["digests"]
+            width = len(digests) // len(nodes)
+            tree._digests = {
+                node: digests[i * width : (i + 1) * width] for i, node in enumerate(nodes)
+            }
+        return tree
+
+    def memory_usage(self):
+        """Approximate bytes used by the arrays and the name table."""
+        arrays = (
+            self.parents,
+            self.depths,
+            self.flags,
+            self.name_ids,
+            self.first_child,
+            self.next_sibling,
+            self.sizes,
+            self.mtimes,
+            self._totals,
+            self._file_counts,
+        )
+        total = sum(a.buffer_info()[1] * a.itemsize for a in arrays)
+        total += sum(sys.getsizeof(name) for name in self.names)
+        total += sys.getsizeof(self.names) + sys.getsizeof(self._name_index)
+        if self._digests:
+            total += sys.getsizeof(self._digests)
+            total += sum(sys.getsizeof(digest) for digest in self._digests.values())
+        return total
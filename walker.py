@@ -0,0 +1,844 @@
+"""
+Iterative os.scandir-based directory walker for the directory mapper.
+
+The walker yields one WalkEntry per mapped file or directory in the same
+order the original os.walk loop produced: a directory, then its files, then
+each of its subdirectories in turn. Depth and the '/'-separated relative
+path are carried along incrementally, and the cached DirEntry type
+information is used so no extra stat calls are needed.
+
+With workers > 1 directories are listed on a thread pool as soon as they
+are discovered, which hides per-directory latency on network filesystems;
+entries are still yielded in the same deterministic tree order. At most
+READ_AHEAD_PER_WORKER listings per worker are queued or held ahead of the
+consumer, the ones it reaches soonest first; further directories wait until
+it catches up, so memory and the work wasted when a limit stops the walk
+stay bounded.
+
+Children are yielded in the order the filesystem lists them unless a sort
+order is given (see SORT_ORDERS). Sorting happens per directory as it is
+listed, by code point rather than locale, so a sorted map is byte-identical
+on every host and filesystem.
+
+Directories are read chunk_size entries at a time. One with more entries
+than that is streamed: its files are filtered and yielded chunk by chunk
+while the listing goes on, so a directory of millions of files never sits
+in memory. Only unsorted walks without a snapshot can stream, since
+sorting and snapshots need the whole listing.
+
+A directory that cannot be listed (or a symlink loop, see SYMLINK_POLICIES)
+gets an '... error: <reason>' placeholder entry instead of its children.
+"""
+
+import errno
+import os
+import re
+import time
+from collections import namedtuple
+from itertools import chain, islice
+
+from ignore_matcher import GITIGNORE, default_cache, root_ignore_stack
+
+WalkEntry = namedtuple(
+    "WalkEntry",
+    ["depth", "name", "rel_path", "is_dir", "path", "is_last", "size", "mtime", "omitted",
+     "digest"],
+    defaults=(False, None, None, None, None),
+)
+WalkEntry.__doc__ = """A mapped file or directory; rel_path is '' for the root.
+
+is_last marks the last child of its directory. When sizes are collected,
+size is the file size in bytes (None for directories) and mtime the
+modification time in seconds; both are None otherwise.
+
+Entries cut by WalkLimits are replaced by a placeholder entry named
+'... N more' whose omitted field is the number of entries left out (0 when
+unknown); omitted is None for real files and directories. Directories that
+could not be listed get an '... error: <reason>' placeholder with
+omitted 0. digest is the hex digest of a file's contents when the map
+is hashed (see content_hash.hash_entries), and None otherwise."""
+
+# Name prefix of the placeholders for directories that could not be listed
+ERROR_PREFIX = "... error: "
+
+WalkLimits = namedtuple(
+    "WalkLimits",
+    ["max_depth", "max_entries_per_dir", "max_entries", "time_limit"],
+    defaults=(None, None, None, None),
+)
+WalkLimits.__doc__ = """Budgets that bound a walk; None means unlimited.
+
+max_depth: directories deeper than this many levels below the root are
+    shown but never listed (0 maps the root only).
+max_entries_per_dir: at most this many children are kept per directory;
+    the rest are collapsed into one '... N more' entry and never visited.
+max_entries: the walk stops after yielding this many entries.
+time_limit: the walk stops once this many seconds have passed.
+
+When a total budget stops the walk, a final placeholder entry says why."""
+
+# Sort orders for the children of each directory:
+#   name        by name, code point order
+#   natural     by name, with digit runs compared as numbers (file2 < file10)
+#   dirs-first  subdirectories (and their contents) before files, both by name
+#   size        files largest first, then by name; subdirectories by name
+SORT_ORDERS = ("name", "natural", "dirs-first", "size")
+
+# What to do with symlinks to directories:
+#   skip    leave them out of the map, like os.walk
+#   list    show them, but do not list their contents
+#   follow  map their contents; a directory that is one of its own ancestors
+#           (same device and inode) is a loop and gets an error entry instead.
+#           Telling that costs one stat per directory.
+# Symlinks to files are always shown as files.
+SYMLINK_POLICIES = ("skip", "list", "follow")
+
+# Entries read from a directory at a time; a directory with more is streamed
+LISTING_CHUNK = 10000
+# Directory listings queued or finished ahead of a parallel walk's consumer, per worker
+READ_AHEAD_PER_WORKER = 16
+
+_DIGITS = re.compile(r"(\d+)")
+
+
+def root_name(start_path):
+    """Return the name shown for the map root."""
+    return os.path.basename(os.path.normpath(start_path))
+
+
+def _split_entries(entries, symlinks, files, dirs):
+    """Append DirEntry objects to files or dirs; symlinked directories follow the policy."""
+    skip_links = symlinks == "skip"
+    for entry in entries:
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            is_dir = False
+        if is_dir:
+            if skip_links and entry.is_symlink():
+                continue
+            dirs.append(entry)
+        else:
+            files.append(entry)
+
+
+def scan_directory(path, scandir=None, symlinks="skip"):
+    """
+    List one directory into (files, dirs) lists of DirEntry objects.
+    Symlinked directories are left out under the 'skip' policy (see
+    SYMLINK_POLICIES) and kept in dirs otherwise. Raises OSError when the
+    directory cannot be listed.
+    """
+    files = []
+    dirs = []
+    with (scandir or os.scandir)(path) as it:
+        _split_entries(it, symlinks, files, dirs)
+    return files, dirs
+
+
+def _read_chunks(path, scandir, chunk_size):
+    """Yield the entries of a directory in lists of at most chunk_size."""
+    with (scandir or os.scandir)(path) as it:
+        it = iter(it)
+        while True:
+            chunk = list(islice(it, chunk_size))
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+
+
+def _natural_key(name):
+    """Sort key comparing digit runs numerically; ties fall back to the plain name."""
+    parts = _DIGITS.split(name)
+    parts[1::2] = map(int, parts[1::2])
+    return parts, name
+
+
+def _size_key(entry):
+    try:
+        size = entry.stat(follow_symlinks=False).st_size
+    except OSError:
+        size = -1
+    return -size, entry.name
+
+
+def _name_key(entry):
+    return entry.name
+
+
+def sort_listing(files, dirs, order):
+    """
+    Sort the files and subdirectories of one directory in place by order
+    (one of SORT_ORDERS). Keys are computed once per entry; sizes come from
+    the DirEntry's cached stat, so collecting sizes afterwards costs nothing.
+    """
+    if order not in SORT_ORDERS:
+        raise ValueError(f"unknown sort order: {order!r} (choose from {', '.join(SORT_ORDERS)})")
+    if order == "natural":
+        files.sort(key=lambda entry: _natural_key(entry.name))
+        dirs.sort(key=lambda entry: _natural_key(entry.name))
+        return
+    files.sort(key=_size_key if order == "size" else _name_key)
+    dirs.sort(key=_name_key)
+
+
+def _drop_ignored(files, dirs, prefix, stack, stats):
+    """Return files and dirs without .git and the entries stack ignores."""
+    if stats is None:
+        is_ignored = stack.is_ignored
+    else:
+        is_ignored, hits = stats.ignore_checker(stack)
+        if stack:
+            stats.add_matcher(stack.matcher)
+    dirs = [
+        entry
+        for entry in dirs
+        if entry.name != ".git" and not is_ignored(prefix + entry.name, True)
+    ]
+    if stack:
+        files = [
+            entry
+            for entry in files
+            if not is_ignored(prefix + entry.name, False)
+        ]
+    if stats is not None:
+        stats.add_pattern_hits(hits)
+    return files, dirs
+
+
+def _filter_listing(path, rel_path, files, dirs, stack, cache, stats, order, started):
+    """The part of list_directory that follows the listing; started is when it began."""
+    if stats is not None:
+        listed = time.perf_counter()
+        stats.add_time("list", listed - started)
+        listed_files, listed_dirs = len(files), len(dirs)
+
+    if stack is not None:
+        prefix = rel_path + "/" if rel_path else ""
+        if prefix and any(entry.name == GITIGNORE for entry in files):
+            stack = stack.push(prefix, (cache or default_cache).load_dir(path))
+        files, dirs = _drop_ignored(files, dirs, prefix, stack, stats)
+
+    if stats is not None:
+        stats.add_time("ignore", time.perf_counter() - listed)
+        stats.count("ignored_files", listed_files - len(files))
+        stats.count("ignored_directories", listed_dirs - len(dirs))
+    if order is not None:
+        sort_listing(files, dirs, order)
+    return files, dirs, stack
+
+
+def list_directory(
+    path,
+    rel_path,
+    stack,
+    scandir=None,
+    cache=None,
+    snapshot=None,
+    stats=None,
+    order=None,
+    symlinks="skip",
+):
+    """
+    List one directory, split into files and subdirectories, with ignored
+    entries removed. With a snapshot, unchanged directories are served from
+    it instead of being listed again. stats is an optional
+    map_stats.MapStats that records listing and ignore matching. order
+    sorts the kept entries (see sort_listing); None keeps listing order.
+    symlinks is one of SYMLINK_POLICIES; only 'skip' drops symlinked
+    directories here.
+
+    Returns (files, dirs, stack) where files and dirs are lists of DirEntry
+    objects and stack is the ignore stack that applies to the children
+    (None when ignore rules are disabled). Raises OSError when the
+    directory cannot be listed.
+    """
+    def scan(path):
+        return scan_directory(path, scandir, symlinks)
+
+    started = None
+    if stats is not None:
+        started = time.perf_counter()
+        scan = stats.timed_call("scandir", scan)
+    if snapshot is None:
+        files, dirs = scan(path)
+    else:
+        files, dirs = snapshot.scan(path, rel_path, scan)
+    return _filter_listing(path, rel_path, files, dirs, stack, cache, stats, order, started)
+
+
+class _StreamedListing:
+    """
+    A directory with more than chunk_size entries, read and filtered one
+    chunk at a time while the walk consumes it. Iterating (once) yields
+    the kept files of each chunk as a list; dirs holds the kept subdirectories and error the
+    OSError that cut the listing short, if any, once it is exhausted.
+    children(dirs) pairs subdirectories with their payloads.
+    """
+
+    def __init__(self, chunks, path, prefix, stack, symlinks, stats, children):
+        self._chunks = chunks
+        self.path = path
+        self.prefix = prefix
+        self.stack = stack
+        self.symlinks = symlinks
+        self.stats = stats
+        self.children = children
+        self.dirs = []
+        self.error = None
+
+    def __iter__(self):
+        stats = self.stats
+        stack = self.stack
+        clock = time.perf_counter
+        try:
+            while True:
+                if stats is not None:
+                    started = clock()
+                chunk = next(self._chunks, None)
+                if chunk is None:
+                    return
+                files = []
+                dirs = []
+                _split_entries(chunk, self.symlinks, files, dirs)
+                del chunk
+                if stats is not None:
+                    listed = clock()
+                    stats.add_time("list", listed - started)
+                    listed_files, listed_dirs = len(files), len(dirs)
+                if stack is not None:
+                    files, dirs = _drop_ignored(files, dirs, self.prefix, stack, stats)
+                if stats is not None:
+                    stats.add_time("ignore", clock() - listed)
+                    stats.count("ignored_files", listed_files - len(files))
+                    stats.count("ignored_directories", listed_dirs - len(dirs))
+                self.dirs.extend(dirs)
+                yield files
+        except OSError as error:
+            self.error = error
+
+
+def _list_or_stream(path, rel_path, stack, scandir, cache, stats, symlinks, chunk_size, children):
+    """
+    list_directory for unsorted walks without a snapshot, except that a
+    directory with more than chunk_size entries is returned as a
+    _StreamedListing (whose children function is children) instead.
+    """
+    started = None
+    if stats is not None:
+        started = time.perf_counter()
+        stats.count("scandir_calls")
+    chunks = _read_chunks(path, scandir, chunk_size)
+    first = next(chunks, [])
+    second = next(chunks, None) if len(first) == chunk_size else None
+    if second is None:
+        files = []
+        dirs = []
+        _split_entries(first, symlinks, files, dirs)
+        return _filter_listing(path, rel_path, files, dirs, stack, cache, stats, None, started)
+
+    if stats is not None:
+        stats.add_time("list", time.perf_counter() - started)
+        stats.count("streamed_directories")
+    prefix = rel_path + "/" if rel_path else ""
+    # The directory's own ignore file applies to its first entries too, so
+    # it is looked up directly rather than waited for in the listing
+    if stack is not None and prefix and os.path.isfile(os.path.join(path, GITIGNORE)):
+        stack = stack.push(prefix, (cache or default_cache).load_dir(path))
+    return _StreamedListing(
+        chain((first, second), chunks), path, prefix, stack, symlinks, stats, children
+    )
+
+
+def _children(dirs, stack, ancestors, symlinks, make_payload):
+    """
+    Pair subdirectories with their payloads: make_payload(entry, stack,
+    ancestors) for directories to list, None for symlinked directories
+    under the 'list' policy, and an OSError for directories that cannot be
+    entered, such as a symlink loop. ancestors is the ('follow' only)
+    chain of (device, inode) keys from the directory up to the root, as
+    nested (key, parent chain) pairs.
+    """
+    if symlinks == "skip":
+        return [(entry, make_payload(entry, stack, None)) for entry in dirs]
+    children = []
+    for entry in dirs:
+        if symlinks == "list":
+            payload = None if entry.is_symlink() else make_payload(entry, stack, None)
+            children.append((entry, payload))
+            continue
+        try:
+            # Not entry.stat(): cached entries carry no device and inode
+            st = os.stat(entry.path)
+        except OSError as error:
+            children.append((entry, error))
+            continue
+        key = (st.st_dev, st.st_ino)
+        link = ancestors
+        while link is not None and link[0] != key:
+            link = link[1]
+        if link is not None:
+            children.append((entry, OSError(errno.ELOOP, "symlink loop", entry.path)))
+        else:
+            children.append((entry, make_payload(entry, stack, (key, ancestors))))
+    return children
+
+
+def _root_ancestors(start_path, symlinks):
+    """The ancestor chain of the root under the 'follow' policy, else None."""
+    if symlinks != "follow":
+        return None
+    try:
+        st = os.stat(start_path)
+    except OSError:
+        return None
+    return ((st.st_dev, st.st_ino), None)
+
+
+def walk_directory(
+    start_path,
+    exclude_ignore=True,
+    scandir=None,
+    cache=None,
+    workers=None,
+    snapshot=None,
+    collect_sizes=False,
+    limits=None,
+    stats=None,
+    order=None,
+    symlinks="skip",
+    chunk_size=LISTING_CHUNK,
+):
+    """
+    Walk start_path depth-first and yield WalkEntry records.
+
+    Ignored files are skipped and ignored directories are pruned before they
+    are listed when exclude_ignore is set. scandir can be replaced by any
+    function with the os.scandir interface. workers > 1 lists directories
+    in parallel without changing the output order. snapshot is an optional
+    snapshot.Snapshot used to reuse listings of unchanged directories.
+    collect_sizes fills in file sizes and modification times from the
+    DirEntry.stat() data the listing already has (one lstat per entry at
+    most, none on platforms where scandir returns it).
+    limits is an optional WalkLimits; pruned directories are never listed.
+    stats is an optional map_stats.MapStats filled in during the walk.
+    order is one of SORT_ORDERS; by default children keep listing order.
+    symlinks is one of SYMLINK_POLICIES. Directories with more than
+    chunk_size entries are streamed when the walk is unsorted and has no
+    snapshot; None always lists them whole.
+    """
+    if order is not None and order not in SORT_ORDERS:
+        raise ValueError(f"unknown sort order: {order!r} (choose from {', '.join(SORT_ORDERS)})")
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(
+            f"unknown symlink policy: {symlinks!r} (choose from {', '.join(SYMLINK_POLICIES)})"
+        )
+    stack = root_ignore_stack(start_path, cache) if exclude_ignore else None
+    limits = limits or WalkLimits()
+    if stats is not None:
+        stats.root = start_path
+        if stack is not None:
+            for matcher, _ in stack.frames():
+                stats.add_matcher(matcher)
+    lister = _make_lister(scandir, cache, snapshot, stats, order, symlinks, limits, chunk_size)
+    ancestors = _root_ancestors(start_path, symlinks)
+    if workers and workers > 1:
+        return _walk_parallel(
+            start_path, stack, ancestors, lister, workers, collect_sizes, limits, stats, order
+        )
+    return _walk_serial(start_path, stack, ancestors, lister, collect_sizes, limits, stats, order)
+
+
+def _entry_stat(entry):
+    """Return (size, mtime) of a DirEntry, or (None, None) if it vanished."""
+    try:
+        st = entry.stat(follow_symlinks=False)
+    except OSError:
+        return None, None
+    return st.st_size, st.st_mtime
+
+
+def _root_mtime(start_path):
+    try:
+        return os.stat(start_path).st_mtime
+    except OSError:
+        return None
+
+
+def _more_name(count):
+    return f"... {count} more"
+
+
+def _stop_entry(depth, prefix, reason):
+    """Placeholder closing a walk that a total budget stopped early."""
+    name = f"... stopped: {reason}"
+    return WalkEntry(depth, name, prefix + name, False, None, True, omitted=0)
+
+
+def _error_name(error):
+    return f"{ERROR_PREFIX}{error.strerror or error}"
+
+
+def _limit_listing(files, dirs, max_entries_per_dir, dirs_first=False):
+    """Keep the first max_entries_per_dir children in map order; return (files, dirs, omitted)."""
+    if max_entries_per_dir is None or len(files) + len(dirs) <= max_entries_per_dir:
+        return files, dirs, 0
+    omitted = len(files) + len(dirs) - max_entries_per_dir
+    if dirs_first:
+        kept_files = max(max_entries_per_dir - len(dirs), 0)
+        return files[:kept_files], dirs[:max_entries_per_dir], omitted
+    kept_dirs = max(max_entries_per_dir - len(files), 0)
+    return files[:max_entries_per_dir], dirs[:kept_dirs], omitted
+
+
+def _should_list(depth, limits):
+    """Whether a directory at depth is listed at all under limits.max_depth."""
+    return limits.max_depth is None or depth < limits.max_depth
+
+
+def _make_lister(scandir, cache, snapshot, stats, order, symlinks, limits, chunk_size):
+    """
+    Return list_children(path, rel_path, stack, ancestors, make_payload),
+    which lists one directory for either walker. It returns the kept files,
+    the subdirectories paired by _children and the number of children
+    collapsed by max_entries_per_dir, or a _StreamedListing for a directory
+    too large to list whole. OSError is raised for unreadable directories.
+    """
+    dirs_first = order == "dirs-first"
+    streams = chunk_size is not None and snapshot is None and order is None
+
+    def list_children(path, rel_path, stack, ancestors, make_payload):
+        if streams:
+            def children(dirs, stack):
+                return _children(dirs, stack, ancestors, symlinks, make_payload)
+
+            listing = _list_or_stream(
+                path, rel_path, stack, scandir, cache, stats, symlinks, chunk_size, children
+            )
+            if isinstance(listing, _StreamedListing):
+                return listing
+            files, dirs, stack = listing
+        else:
+            files, dirs, stack = list_directory(
+                path, rel_path, stack, scandir, cache, snapshot, stats, order, symlinks
+            )
+        files, dirs, omitted = _limit_listing(files, dirs, limits.max_entries_per_dir, dirs_first)
+        return files, _children(dirs, stack, ancestors, symlinks, make_payload), omitted
+
+    return list_children
+
+
+def _iter_walk(start_path, root_payload, expand, collect_sizes, limits, stats, dirs_first=False):
+    """
+    Shared depth-first driver. expand(path, rel_path, payload) returns the
+    kept files, a list of (dir entry, payload) pairs and the number of
+    children collapsed by max_entries_per_dir, or a _StreamedListing. It
+    raises OSError for a directory that cannot be listed. Directories that
+    max_depth keeps from being listed, or whose payload is None, are never
+    expanded; a payload that is an OSError is reported instead. dirs_first
+    yields each directory's files after its subdirectories instead of
+    before them.
+    """
+    deadline = None
+    if limits.time_limit is not None:
+        deadline = time.monotonic() + limits.time_limit
+    max_entries = limits.max_entries
+    max_entries_per_dir = limits.max_entries_per_dir
+    entry_limit = f"limit of {max_entries} entries reached"
+    emitted = 0
+    entry_stat = _entry_stat if stats is None else stats.timed_call("stat", _entry_stat)
+
+    def emit_files(files, prefix, depth, last_file):
+        """Yield the file entries; return True if max_entries stopped the walk."""
+        nonlocal emitted
+        for i, entry in enumerate(files):
+            if max_entries is not None and emitted >= max_entries:
+                if stats is not None:
+                    stats.stopped = entry_limit
+                yield _stop_entry(depth, prefix, entry_limit)
+                return True
+            size, mtime = entry_stat(entry) if collect_sizes else (None, None)
+            yield WalkEntry(
+                depth,
+                entry.name,
+                prefix + entry.name,
+                False,
+                entry.path,
+                i == last_file,
+                size,
+                mtime,
+            )
+            emitted += 1
+        return False
+
+    def emit_stream(listing, prefix, depth):
+        """
+        Yield the file entries of a _StreamedListing as it is read, holding
+        back the last one until the directory's end shows whether it is the
+        last child. Return (dir pairs, omitted), or None if max_entries
+        stopped the walk.
+        """
+        held = []
+        file_count = 0
+        omitted = 0
+        for files in listing:
+            if max_entries_per_dir is not None:
+                # Files past max_entries_per_dir are read only to be counted
+                room = max(max_entries_per_dir - file_count, 0)
+                if len(files) > room:
+                    omitted += len(files) - room
+                    files = files[:room]
+            if not files:
+                continue
+            file_count += len(files)
+            batch = held + files[:-1]
+            held = files[-1:]
+            if (yield from emit_files(batch, prefix, depth, -1)):
+                return None
+        dirs = listing.dirs
+        if max_entries_per_dir is not None and file_count + len(dirs) > max_entries_per_dir:
+            omitted += file_count + len(dirs) - max_entries_per_dir
+            dirs = dirs[: max(max_entries_per_dir - file_count, 0)]
+        last_file = -1 if dirs or omitted or listing.error else 0
+        if (yield from emit_files(held, prefix, depth, last_file)):
+            return None
+        if stats is not None:
+            stats.count("files", file_count)
+        return listing.children(dirs, listing.stack), omitted
+
+    def error_item(error, prefix, depth, is_last):
+        """Pending placeholder for an error, counted in stats."""
+        if stats is not None:
+            stats.count("symlink_loops" if error.errno == errno.ELOOP else "errors")
+        name = _error_name(error)
+        return (None, name, prefix + name, depth, is_last, None, 0)
+
+    # Pending items: (path, name, rel_path, depth, is_last, mtime, payload);
+    # path is None for placeholders ('... N more' and errors closing a
+    # directory; payload is then the omitted count), and name is None too
+    # for a dirs-first directory's files (payload is then (files, index of
+    # the last one))
+    root_mtime = None
+    if collect_sizes:
+        root_mtime = _root_mtime(start_path)
+        if stats is not None:
+            stats.count("stat_calls")
+    pending = [(start_path, root_name(start_path), "", 0, True, root_mtime, root_payload)]
+    while pending:
+        path, name, rel_path, depth, is_last, mtime, payload = pending.pop()
+        if name is None:
+            files, last_file = payload
+            if (yield from emit_files(files, rel_path, depth, last_file)):
+                return
+            continue
+        if max_entries is not None and emitted >= max_entries:
+            if stats is not None:
+                stats.stopped = entry_limit
+            yield _stop_entry(depth, rel_path[: len(rel_path) - len(name)], entry_limit)
+            return
+        if path is None:
+            yield WalkEntry(depth, name, rel_path, False, None, is_last, omitted=payload)
+            emitted += 1
+            continue
+        yield WalkEntry(depth, name, rel_path, True, path, is_last, None, mtime)
+        emitted += 1
+        if not _should_list(depth, limits):
+            if stats is not None:
+                stats.count("depth_pruned_directories")
+            continue
+        if payload is None:
+            # A symlinked directory under the 'list' policy
+            continue
+        prefix = rel_path + "/" if rel_path else ""
+        child_depth = depth + 1
+        if isinstance(payload, OSError):
+            pending.append(error_item(payload, prefix, child_depth, True))
+            continue
+        if deadline is not None and time.monotonic() >= deadline:
+            reason = f"time limit of {limits.time_limit}s reached"
+            if stats is not None:
+                stats.stopped = reason
+            yield _stop_entry(child_depth, prefix, reason)
+            return
+
+        try:
+            listing = expand(path, rel_path, payload)
+        except OSError as error:
+            pending.append(error_item(error, prefix, child_depth, True))
+            continue
+        if stats is not None:
+            stats.count("directories")
+        streamed = isinstance(listing, _StreamedListing)
+        error = None
+        if streamed:
+            result = yield from emit_stream(listing, prefix, child_depth)
+            if result is None:
+                return
+            dirs, omitted = result
+            error = listing.error
+        else:
+            files, dirs, omitted = listing
+            if stats is not None:
+                stats.count("files", len(files))
+        if stats is not None:
+            stats.count("collapsed_entries", omitted)
+        if error is not None:
+            pending.append(error_item(error, prefix, child_depth, True))
+        if omitted:
+            more = _more_name(omitted)
+            pending.append((None, more, prefix + more, child_depth, error is None, None, omitted))
+        if streamed:
+            last_dir = -1 if omitted or error is not None else len(dirs) - 1
+        elif dirs_first:
+            last_file = -1 if omitted else len(files) - 1
+            if files:
+                pending.append((None, None, prefix, child_depth, False, None, (files, last_file)))
+            last_dir = -1 if files or omitted else len(dirs) - 1
+        else:
+            last_file = -1 if dirs or omitted else len(files) - 1
+            if (yield from emit_files(files, prefix, child_depth, last_file)):
+                return
+            last_dir = -1 if omitted else len(dirs) - 1
+        for i in range(len(dirs) - 1, -1, -1):
+            entry, child_payload = dirs[i]
+            mtime = entry_stat(entry)[1] if collect_sizes else None
+            pending.append(
+                (
+                    entry.path,
+                    entry.name,
+                    prefix + entry.name,
+                    child_depth,
+                    i == last_dir,
+                    mtime,
+                    child_payload,
+                )
+            )
+
+
+def _walk_serial(start_path, stack, ancestors, lister, collect_sizes, limits, stats, order):
+    def make_payload(entry, stack, ancestors):
+        return stack, ancestors
+
+    def expand(path, rel_path, payload):
+        stack, ancestors = payload
+        return lister(path, rel_path, stack, ancestors, make_payload)
+
+    return _iter_walk(
+        start_path,
+        (stack, ancestors),
+        expand,
+        collect_sizes,
+        limits,
+        stats,
+        order == "dirs-first",
+    )
+
+
+class _ListTask:
+    """
+    A directory listing of a parallel walk. key is the path of child
+    indexes from the root, so tasks sort in the order the walk reaches
+    them; future gets the listing once a worker has run it.
+    """
+
+    __slots__ = ("key", "args", "future")
+
+    def __init__(self, key, args, future):
+        self.key = key
+        self.args = args
+        self.future = future
+
+    def __lt__(self, other):
+        return self.key < other.key
+
+
+def _walk_parallel(start_path, stack, ancestors, lister, workers, collect_sizes, limits, stats, order):
+    import heapq
+    import threading
+    from concurrent.futures import Future, ThreadPoolExecutor
+    from itertools import count
+
+    pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dirmap-walk")
+    window = workers * READ_AHEAD_PER_WORKER
+    lock = threading.Lock()
+    # Tasks not started yet, the consumer's next first. Pool jobs do not
+    # carry a task: each runs the first waiting one when it starts, so the
+    # listings the consumer needs soonest go first. outstanding counts the
+    # jobs whose listing the consumer has not taken yet, queued the jobs
+    # not started yet.
+    waiting = []
+    outstanding = 0
+    queued = 0
+
+    def admit(force=False):
+        """Submit jobs for waiting tasks while the window has room (one more with force)."""
+        nonlocal outstanding, queued
+        while queued < len(waiting) and (outstanding < window or force):
+            outstanding += 1
+            queued += 1
+            force = False
+            pool.submit(run_next)
+
+    def run_next():
+        nonlocal queued
+        with lock:
+            queued -= 1
+            task = heapq.heappop(waiting)
+            task.future.set_running_or_notify_cancel()
+        try:
+            task.future.set_result(list_task(task.key, *task.args))
+        except BaseException as error:
+            task.future.set_exception(error)
+
+    def add_task(key, args):
+        task = _ListTask(key, args, Future())
+        with lock:
+            heapq.heappush(waiting, task)
+            admit()
+        return task
+
+    def list_task(key, path, rel_path, depth, stack, ancestors):
+        prefix = rel_path + "/" if rel_path else ""
+        child_depth = depth + 1
+        listed = _should_list(child_depth, limits)
+        child_index = count()
+
+        # Ignored and collapsed directories are already gone, and directories
+        # past max_depth are not listed, so only kept subtrees get scheduled.
+        # Children are queued right away so that siblings and their
+        # descendants are listed while the consumer is still busy; a
+        # streamed directory queues its children once it has been read.
+        def make_payload(entry, stack, ancestors):
+            if not listed:
+                return None
+            return add_task(
+                key + (next(child_index),),
+                (entry.path, prefix + entry.name, child_depth, stack, ancestors),
+            )
+
+        return lister(path, rel_path, stack, ancestors, make_payload)
+
+    def expand(path, rel_path, task):
+        nonlocal outstanding
+        with lock:
+            if queued == 0 and not task.future.running() and not task.future.done():
+                # Reached while the window is full of listings further ahead;
+                # as the first waiting task, the extra job runs this one
+                admit(force=True)
+        try:
+            return task.future.result()
+        finally:
+            with lock:
+                outstanding -= 1
+                admit()
+
+    try:
+        root_task = None
+        if _should_list(0, limits):
+            root_task = add_task((), (start_path, "", 0, stack, ancestors))
+        yield from _iter_walk(
+            start_path, root_task, expand, collect_sizes, limits, stats, order == "dirs-first"
+        )
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
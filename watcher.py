@@ -0,0 +1,629 @@
+"""
+Watch mode: keep a directory map up to date as the filesystem changes.
+
+A LiveMap does one initial walk and keeps each directory's filtered listing
+in memory. When directories change, only those directories are listed
+again: added subdirectories are walked (with the ignore rules that apply
+to them), removed ones are dropped, and a directory whose .gitignore
+changed is walked again below it (the whole map when the root .gitignore
+or .git/info/exclude changed). The text map is kept as one block of
+lines per directory, so an update returns patches that replace just the
+lines of the changed subtrees.
+
+Changes are noticed through inotify (Linux, via ctypes) or, where that is
+unavailable or runs out of watches, by polling directory mtimes. Polling
+sees entries being added, removed or renamed and .gitignore edits, but not
+files changing size in place. watch_changes debounces the raw events so a
+burst of writes results in one update.
+"""
+
+import errno
+import os
+import select
+import struct
+import sys
+import time
+from functools import lru_cache
+
+from ignore_matcher import GITIGNORE, default_cache, root_ignore_stack
+from renderers import get_renderer, render_text
+from tree_model import DirectoryTree, TreeEntry
+from walker import WalkEntry, _entry_stat, _error_name, _root_mtime, list_directory, root_name
+
+# Quiet period before a burst of changes is applied, and the longest an
+# update is held back while changes keep coming
+DEFAULT_DEBOUNCE = 0.2
+MAX_DEBOUNCE_DELAY = 2.0
+DEFAULT_POLL_INTERVAL = 1.0
+# Longest a read blocks, so stop requests are noticed promptly
+READ_TIMEOUT = 0.5
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+# Events that change a directory's listing
+LISTING_EVENTS = IN_CREATE | IN_DELETE | IN_MOVED_FROM | IN_MOVED_TO
+# Events that change a file's size or mtime (and .gitignore contents)
+CONTENT_EVENTS = IN_CLOSE_WRITE | IN_ATTRIB | IN_MODIFY
+
+_EVENT_HEADER = struct.Struct("iIII")
+# The root's .git/info/exclude, relative to the root; .git itself is never
+# mapped, so its folder is watched in addition to the mapped directories
+EXCLUDE_FILE = os.path.join(".git", "info", "exclude")
+_EXCLUDE_WATCH = os.path.dirname(EXCLUDE_FILE)
+
+
+@lru_cache(maxsize=None)
+def _load_libc():
+    """libc with inotify set up, or None; loaded on first use, which can take a while."""
+    if not sys.platform.startswith("linux"):
+        return None
+    import ctypes
+    import ctypes.util
+
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    except OSError:
+        return None
+    if not hasattr(libc, "inotify_init1"):
+        return None
+    libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+    libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    return libc
+
+
+def _errno():
+    import ctypes
+
+    return ctypes.get_errno()
+
+
+def inotify_available():
+    """Whether inotify can be used on this system."""
+    return _load_libc() is not None
+
+
+class InotifyWatcher:
+    """
+    Watches a set of directories with one inotify descriptor.
+
+    sync() adds and removes watches to match the mapped directories;
+    read() returns the root-relative paths of directories whose contents
+    changed. With sizes=False, writes to files are only reported for
+    .gitignore files, so busy build outputs do not cause needless updates.
+    Changes to the root's .git/info/exclude are reported as the root.
+    """
+
+    def __init__(self, sizes=False):
+        self._libc = _load_libc()
+        if self._libc is None:
+            raise OSError(errno.ENOSYS, "inotify is not available")
+        self.sizes = sizes
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            err = _errno()
+            raise OSError(err, os.strerror(err))
+        self._mask = LISTING_EVENTS | CONTENT_EVENTS | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+        # Watch descriptor <-> relative path of the watched directory
+        self._paths = {}
+        self._watches = {}
+
+    def sync(self, directories):
+        """Watch exactly the given {relative path: path} directories."""
+        if "" in directories:
+            directories = dict(directories)
+            directories[_EXCLUDE_WATCH] = os.path.join(directories[""], _EXCLUDE_WATCH)
+        # Removals first: a directory renamed inside the tree keeps its
+        # inode, so adding its new path returns the same watch descriptor
+        for rel_path in [rel for rel in self._watches if rel not in directories]:
+            wd = self._watches.pop(rel_path)
+            if self._paths.get(wd) == rel_path:
+                del self._paths[wd]
+                self._libc.inotify_rm_watch(self._fd, wd)
+        for rel_path, path in directories.items():
+            if rel_path in self._watches:
+                continue
+            wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), self._mask)
+            if wd < 0:
+                err = _errno()
+                if err in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                    continue  # gone or unreadable; the parent's listing says so
+                raise OSError(err, f"cannot watch {path}: {os.strerror(err)}")
+            old = self._paths.get(wd)
+            if old is not None:
+                self._watches.pop(old, None)
+            self._paths[wd] = rel_path
+            self._watches[rel_path] = wd
+
+    def read(self, timeout):
+        """Wait up to timeout seconds and return the set of changed directories."""
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                break
+            self._parse(data, changed)
+        return changed
+
+    def _parse(self, data, changed):
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + _EVENT_HEADER.size : offset + _EVENT_HEADER.size + length]
+            offset += _EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost: every directory has to be listed again
+                changed.update(self._watches)
+                continue
+            rel_path = self._paths.get(wd)
+            if rel_path is None:
+                continue
+            if mask & IN_IGNORED:
+                del self._paths[wd]
+                if self._watches.get(rel_path) == wd:
+                    del self._watches[rel_path]
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                continue  # reported to the parent directory as well
+            if rel_path == _EXCLUDE_WATCH:
+                if name.rstrip(b"\0") == os.path.basename(EXCLUDE_FILE).encode():
+                    changed.add("")
+            elif mask & LISTING_EVENTS or self.sizes:
+                changed.add(rel_path)
+            elif name.rstrip(b"\0") == GITIGNORE.encode():
+                changed.add(rel_path)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def _directory_signature(path, root=False):
+    """
+    What polling compares: the directory's mtime and its .gitignore's, and
+    for the root also its .git/info/exclude's.
+    """
+    targets = [path, os.path.join(path, GITIGNORE)]
+    if root:
+        targets.append(os.path.join(path, EXCLUDE_FILE))
+    signature = []
+    for target in targets:
+        try:
+            signature.append(os.stat(target).st_mtime_ns)
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+
+class PollingWatcher:
+    """Fallback watcher that compares directory mtimes every interval seconds."""
+
+    def __init__(self, interval=DEFAULT_POLL_INTERVAL):
+        self.interval = interval
+        self._signatures = {}
+        self._next_poll = time.monotonic() + interval
+
+    def sync(self, directories):
+        signatures = {}
+        for rel_path, path in directories.items():
+            known = self._signatures.get(rel_path)
+            if known is not None and known[0] == path:
+                signatures[rel_path] = known
+            else:
+                signatures[rel_path] = (path, _directory_signature(path, not rel_path))
+        self._signatures = signatures
+
+    def read(self, timeout):
+        wait = self._next_poll - time.monotonic()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(wait, 0))
+        self._next_poll = time.monotonic() + self.interval
+        changed = set()
+        for rel_path, (path, signature) in self._signatures.items():
+            current = _directory_signature(path, not rel_path)
+            if current != signature:
+                changed.add(rel_path)
+                self._signatures[rel_path] = (path, current)
+        return changed
+
+    def close(self):
+        pass
+
+
+def open_watcher(polling=False, sizes=False, interval=DEFAULT_POLL_INTERVAL):
+    """Return an InotifyWatcher, or a PollingWatcher if asked for or inotify is unavailable."""
+    if not polling and inotify_available():
+        try:
+            return InotifyWatcher(sizes)
+        except OSError:
+            pass
+    return PollingWatcher(interval)
+
+
+class _DirState:
+    """Filtered listing of one mapped directory."""
+
+    __slots__ = ("path", "stack", "child_stack", "mtime", "files", "dirs", "error", "own_size")
+
+    def __init__(self, path, stack, child_stack, mtime, files, dirs, error=None):
+        self.path = path
+        # Ignore stack the directory was listed with, and the one for its children
+        self.stack = stack
+        self.child_stack = child_stack
+        self.mtime = mtime
+        # [(name, size, mtime)] and [(name, mtime)] in map order
+        self.files = files
+        self.dirs = dirs
+        # '... error: <reason>' placeholder name when it could not be listed
+        self.error = error
+        self.own_size = sum(size or 0 for _, size, _ in files)
+
+    @property
+    def lines(self):
+        """Text lines of its block: its own, its files' and its error's."""
+        return 1 + len(self.files) + (self.error is not None)
+
+
+def _same_rules(a, b):
+    """Whether two ignore stacks have the same frames, built separately or not."""
+    while a is not b:
+        if a is None or b is None or a.prefix != b.prefix or a.matcher is not b.matcher:
+            return False
+        a, b = a.parent, b.parent
+    return True
+
+
+def _same_stack(a, b):
+    """Whether two child ignore stacks apply the same rules."""
+    if a is b:
+        return True
+    if a is None or b is None:
+        return False
+    return a.parent is b.parent and a.matcher is b.matcher and a.prefix == b.prefix
+
+
+def _depth(rel_path):
+    return rel_path.count("/") + 1 if rel_path else 0
+
+
+def _ancestors(rel_path):
+    """Yield the relative paths of the directories above rel_path, root ('') last."""
+    while rel_path:
+        rel_path = rel_path.rpartition("/")[0]
+        yield rel_path
+
+
+class LiveMap:
+    """
+    In-memory map of start_path that can be patched as directories change.
+
+    Call scan() once for the initial walk, then refresh() with the
+    directories that changed. totals=True shows subtree sizes and file
+    counts in the text map (and implies collect_sizes). Files in
+    skip_files (absolute paths) are left out, e.g. the map being written
+    into the watched tree, which would otherwise trigger its own updates.
+    order sorts each directory's children as in walker.walk_directory;
+    "dirs-first" is not supported because the text map is patched per
+    directory block (a directory's line followed by its files).
+    """
+
+    def __init__(self, start_path, exclude_ignore=True, collect_sizes=False, totals=False,
+                 cache=None, skip_files=(), order=None):
+        if order == "dirs-first":
+            raise ValueError("a live map cannot be sorted dirs-first")
+        self.start_path = start_path
+        self.order = order
+        self.skip_files = {os.path.abspath(path) for path in skip_files}
+        self.totals = totals
+        self.collect_sizes = collect_sizes or totals
+        self._cache = cache or default_cache
+        self._root_stack = root_ignore_stack(start_path, cache) if exclude_ignore else None
+        self._dirs = {}
+        # Rendered text lines per directory: its own line and its files
+        self._blocks = {}
+        # Subtree (bytes, files) per directory, when totals are shown
+        self._totals = {}
+
+    @property
+    def size(self):
+        return sum(state.lines for state in self._dirs.values())
+
+    def directories(self):
+        """Return {relative path: path} for every mapped directory."""
+        return {rel_path: state.path for rel_path, state in self._dirs.items()}
+
+    def scan(self):
+        """Walk start_path, yielding WalkEntry records in map order as it goes."""
+        mtime = _root_mtime(self.start_path) if self.collect_sizes else None
+        yield from self._traverse("", self.start_path, self._root_stack, mtime, self._list)
+        self._compute_totals()
+
+    def iter_entries(self):
+        """Yield WalkEntry records for the current map, without touching the disk."""
+        return self._traverse("", None, None, None, lambda rel_path, *args: self._dirs[rel_path])
+
+    def tree(self):
+        """Build a DirectoryTree of the current map."""
+        return DirectoryTree.from_entries(self.iter_entries())
+
+    def lines(self, format="text"):
+        """Yield the current map in format; text is assembled from cached blocks."""
+        if format != "text":
+            return get_renderer(format)(self.tree().iter_entries(totals=self.totals))
+        return (line for rel_path in self._dir_order("") for line in self._block(rel_path))
+
+    def _list(self, rel_path, path, stack, mtime):
+        error = None
+        try:
+            files, dirs, child_stack = list_directory(
+                path, rel_path, stack, cache=self._cache, order=self.order
+            )
+        except OSError as e:
+            # Unreadable, or removed before it could be listed; shown with an
+            # error placeholder, as a fresh map would, until it changes again
+            files, dirs, child_stack = [], [], stack
+            error = _error_name(e)
+        if self.skip_files:
+            files = [entry for entry in files if os.path.abspath(entry.path) not in self.skip_files]
+        if self.collect_sizes:
+            files = [(entry.name,) + _entry_stat(entry) for entry in files]
+            dirs = [(entry.name, _entry_stat(entry)[1]) for entry in dirs]
+        else:
+            files = [(entry.name, None, None) for entry in files]
+            dirs = [(entry.name, None) for entry in dirs]
+        state = _DirState(path, stack, child_stack, mtime, files, dirs, error)
+        self._dirs[rel_path] = state
+        self._blocks.pop(rel_path, None)
+        return state
+
+    def _traverse(self, rel_path, path, stack, mtime, get_state):
+        """Yield the entries of rel_path's subtree; get_state lists or looks up each directory."""
+        pending = [(rel_path, path, stack, mtime, True)]
+        while pending:
+            rel_path, path, stack, mtime, is_last = pending.pop()
+            state = get_state(rel_path, path, stack, mtime)
+            yield from self._dir_entries(rel_path, state, is_last)
+            prefix = rel_path + "/" if rel_path else ""
+            last = len(state.dirs) - 1
+            for i in range(last, -1, -1):
+                name, child_mtime = state.dirs[i]
+                pending.append(
+                    (
+                        prefix + name,
+                        os.path.join(state.path, name),
+                        state.child_stack,
+                        child_mtime,
+                        i == last,
+                    )
+                )
+
+    def _dir_entries(self, rel_path, state, is_last):
+        depth = _depth(rel_path)
+        name = rel_path.rpartition("/")[2] if rel_path else root_name(self.start_path)
+        yield WalkEntry(depth, name, rel_path, True, state.path, is_last, None, state.mtime)
+        prefix = rel_path + "/" if rel_path else ""
+        last = -1 if state.dirs or state.error else len(state.files) - 1
+        for i, (name, size, mtime) in enumerate(state.files):
+            yield WalkEntry(
+                depth + 1,
+                name,
+                prefix + name,
+                False,
+                os.path.join(state.path, name),
+                i == last,
+                size,
+                mtime,
+            )
+        if state.error is not None:
+            yield WalkEntry(
+                depth + 1, state.error, prefix + state.error, False, None, True, omitted=0
+            )
+
+    def _dir_order(self, rel_path):
+        """Yield the directories of rel_path's subtree in map order."""
+        pending = [rel_path]
+        while pending:
+            rel_path = pending.pop()
+            yield rel_path
+            prefix = rel_path + "/" if rel_path else ""
+            pending.extend(prefix + name for name, _ in reversed(self._dirs[rel_path].dirs))
+
+    def _block(self, rel_path):
+        block = self._blocks.get(rel_path)
+        if block is None:
+            entries = list(self._dir_entries(rel_path, self._dirs[rel_path], False))
+            if self.totals:
+                total_size, file_count = self._totals[rel_path]
+                header = entries[0]
+                entries[0] = TreeEntry(
+                    header.depth, header.name, True, header.is_last, header.rel_path,
+                    None, header.mtime, total_size, file_count,
+                )
+            block = self._blocks[rel_path] = list(render_text(entries))
+        return block
+
+    def _compute_totals(self):
+        """Recompute subtree totals; drop the blocks whose header changed."""
+        if not self.totals:
+            return
+        old = self._totals
+        totals = {}
+        for rel_path in reversed(list(self._dir_order(""))):
+            state = self._dirs[rel_path]
+            total_size, file_count = state.own_size, len(state.files)
+            prefix = rel_path + "/" if rel_path else ""
+            for name, _ in state.dirs:
+                child_size, child_count = totals[prefix + name]
+                total_size += child_size
+                file_count += child_count
+            totals[rel_path] = (total_size, file_count)
+            if old.get(rel_path) != totals[rel_path]:
+                self._blocks.pop(rel_path, None)
+        self._totals = totals
+
+    def _layout(self):
+        """Return the first text line of each directory and the line count of its subtree."""
+        starts = {}
+        line = 0
+        order = list(self._dir_order(""))
+        for rel_path in order:
+            starts[rel_path] = line
+            line += self._dirs[rel_path].lines
+        regions = {}
+        for rel_path in reversed(order):
+            state = self._dirs[rel_path]
+            prefix = rel_path + "/" if rel_path else ""
+            regions[rel_path] = state.lines + sum(
+                regions[prefix + name] for name, _ in state.dirs
+            )
+        return starts, regions
+
+    def _drop(self, rel_path):
+        for sub in list(self._dir_order(rel_path)):
+            del self._dirs[sub]
+            self._blocks.pop(sub, None)
+
+    def _relist(self, rel_path, state):
+        """List one directory again; return whether anything visible changed."""
+        mtime = state.mtime
+        if self.collect_sizes:
+            mtime = _root_mtime(state.path)
+        stack = state.stack
+        if not rel_path and self._root_stack is not None:
+            # The root's ignore files are only read here; if they changed,
+            # the new stack differs and everything is filtered anew below
+            root_stack = root_ignore_stack(self.start_path, self._cache)
+            if not _same_rules(root_stack, self._root_stack):
+                self._root_stack = stack = root_stack
+        new = self._list(rel_path, state.path, stack, mtime)
+        prefix = rel_path + "/" if rel_path else ""
+        old_names = {name for name, _ in state.dirs}
+        new_names = {name for name, _ in new.dirs}
+        if _same_stack(new.child_stack, state.child_stack):
+            # Keep the old stack so the subdirectories' stacks stay valid
+            new.child_stack = state.child_stack
+            rescan = new_names - old_names
+            for name in old_names - new_names:
+                self._drop(prefix + name)
+        else:
+            # The ignore rules here changed: everything below is filtered anew
+            rescan = new_names
+            for name in old_names:
+                self._drop(prefix + name)
+        for name, child_mtime in new.dirs:
+            if name in rescan:
+                path = os.path.join(new.path, name)
+                for _ in self._traverse(prefix + name, path, new.child_stack, child_mtime, self._list):
+                    pass
+        # Directory mtimes alone do not count: they change with every
+        # (possibly skipped) entry and are not part of the text map
+        return (
+            bool(rescan)
+            or new.files != state.files
+            or new_names != old_names
+            or new.error != state.error
+        )
+
+    def refresh(self, changed):
+        """
+        List the changed directories (relative paths) again and patch the
+        map. Returns text patches (first line, old line count, new lines)
+        against the previous text map, last first, so they can be applied
+        in order; empty if nothing visible changed.
+        """
+        old_starts, old_regions = self._layout()
+        old_totals = self._totals
+        relisted = set()
+        for rel_path in sorted(changed, key=_depth):
+            state = self._dirs.get(rel_path)
+            # Unknown directories were removed (or not walked) meanwhile
+            if state is not None and self._relist(rel_path, state):
+                relisted.add(rel_path)
+        self._compute_totals()
+
+        patches = []
+        for rel_path in relisted:
+            if rel_path in self._dirs and not any(a in relisted for a in _ancestors(rel_path)):
+                lines = [line for sub in self._dir_order(rel_path) for line in self._block(sub)]
+                patches.append((old_starts[rel_path], old_regions[rel_path], lines))
+        if self.totals:
+            # Totals of the directories above a change are on their own line
+            for rel_path, totals in self._totals.items():
+                if (
+                    rel_path in old_starts
+                    and old_totals.get(rel_path) != totals
+                    and rel_path not in relisted
+                    and not any(a in relisted for a in _ancestors(rel_path))
+                ):
+                    patches.append((old_starts[rel_path], 1, self._block(rel_path)[:1]))
+        patches.sort(key=lambda patch: patch[0], reverse=True)
+        return patches
+
+
+def apply_patches(lines, patches):
+    """Apply refresh() patches to a list of text lines in place."""
+    for start, count, new_lines in patches:
+        lines[start : start + count] = new_lines
+    return lines
+
+
+def watch_changes(live_map, stop_event=None, debounce=DEFAULT_DEBOUNCE, polling=False,
+                  poll_interval=DEFAULT_POLL_INTERVAL):
+    """
+    Watch the directories of a scanned LiveMap and yield refresh() patches
+    after each debounced burst of changes, until stop_event is set (or the
+    generator is closed). Falls back to polling if inotify runs out of
+    watches.
+    """
+    watcher = open_watcher(polling, live_map.collect_sizes, poll_interval)
+    try:
+        watcher = _sync(watcher, live_map, poll_interval)
+        while stop_event is None or not stop_event.is_set():
+            changed = watcher.read(READ_TIMEOUT)
+            if not changed:
+                continue
+            # Wait for a quiet period, but not forever under constant churn
+            deadline = time.monotonic() + MAX_DEBOUNCE_DELAY
+            while time.monotonic() < deadline:
+                more = watcher.read(debounce)
+                if not more:
+                    break
+                changed |= more
+            patches = live_map.refresh(changed)
+            watcher = _sync(watcher, live_map, poll_interval)
+            if patches:
+                yield patches
+    finally:
+        watcher.close()
+
+
+def _sync(watcher, live_map, poll_interval):
+    try:
+        watcher.sync(live_map.directories())
+    except OSError:
+        if isinstance(watcher, PollingWatcher):
+            raise
+        # Typically the inotify watch limit; polling needs no kernel resources
+        watcher.close()
+        watcher = PollingWatcher(poll_interval)
+        watcher.sync(live_map.directories())
+    return watcher